@@ -1,4 +1,6 @@
 from kinetics.model_module import Model
+from kinetics.cache import ResultCache
+from kinetics.sensitivities import forward_sensitivities, adjoint_gradient, FinalConcentration, SumSquaredError, TrajectoryObjective
 
 from kinetics.reaction_classes.general_rate_Law import *
 from kinetics.reaction_classes.irreversible_michaelis_menton import *
@@ -9,11 +11,17 @@ from kinetics.reaction_classes.reaction_base_class import Reaction
 
 from kinetics.optimisation.metrics import Metrics, uM_to_mgml
 from kinetics.optimisation.genetic_algorithm import GA_Base_Class
+from kinetics.optimisation.fitting import fit_model, Experiment, FitResult
 
 from kinetics.ua_and_sa.sampling import sample_distributions, sample_uniforms, salib_problem, make_saltelli_samples, distributions_to_lower_upper_bounds
-from kinetics.ua_and_sa.run_all_models import run_all_models, dataframes_all_runs, dataframes_quartiles
-from kinetics.ua_and_sa.plotting import plot_substrate, plot_ci_intervals, plot_data, remove_st_less_than, plot_sa_total_sensitivity
-from kinetics.ua_and_sa.sensitivity_analysis import get_concentrations_at_timepoint, get_time_to_concentration, analyse_sobal_sensitivity
+from kinetics.ua_and_sa.run_all_models import run_all_models, run_ensemble, run_all_models_time_to_concentration, dataframes_all_runs, dataframes_quartiles
+from kinetics.ua_and_sa.sample_set import SampleSet
+from kinetics.ua_and_sa.ensemble_result import EnsembleResult
+from kinetics.ua_and_sa.streaming import QuantileSketch, UncertaintyBands
+from kinetics.ua_and_sa.pipeline import run_pipeline, distribution_chunks, saltelli_chunks, sample_list_chunks, ScalarOutputs, ChunkWriter
+from kinetics.ua_and_sa.store import EnsembleStore, run_to_store
+from kinetics.ua_and_sa.plotting import plot_substrate, plot_ci_intervals, plot_data, remove_st_less_than, plot_sa_total_sensitivity, plot_sensitivity_over_time
+from kinetics.ua_and_sa.sensitivity_analysis import get_concentrations_at_timepoint, get_time_to_concentration, analyse_sobal_sensitivity, analyse_sobal_sensitivity_over_time, sobol_indices, sobol_confidence_intervals
 
 
 __version__ = '1.4.1'
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import re
+import threading
+import types
+from collections import OrderedDict
+import numpy as np
+
+"""
+An optional cache of model outputs, so re-running a model with the same inputs doesn't call the solver again.
+Turn on with Model.set_cache()
+
+Outputs are keyed by a hash of the model structure (the code and settings of every reaction and modifier),
+the species starting values, the parameter values, the time grid and the solver settings.
+Unlike the fingerprint used by codegen, this hash is the same in every process, so it can be used for an on-disk cache.
+"""
+
+# Attributes of reactions which hold values or are set while running, rather than describing the reaction.
+# The values used in a run are taken from the model instead.
+runtime_attributes = {'substrate_indexes', 'parameter_indexes', 'input_substrates_indexes', 'run_model_parameters',
+                      'parameters', 'parameter_distributions', 'equation', 'check_limits_functions'}
+
+class_fingerprints = {}
+
+# <sha1 key>.npy, or a temporary file which is being written as <sha1 key>.npy.<pid>.<thread>.tmp
+cache_file_name = re.compile(r'[0-9a-f]{40}\.npy(\.\d+\.\d+\.tmp)?')
+
+def code_fingerprint(code):
+    """ The bytecode, constants and names of a code object, including any nested functions """
+    parts = [code.co_code, repr(code.co_names), repr(code.co_varnames)]
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            parts.append(code_fingerprint(constant))
+        else:
+            parts.append(repr(constant))
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def class_fingerprint(cls):
+    """ A hash of the name and the code of every method of a class and its base classes """
+    if cls not in class_fingerprints:
+        parts = []
+        for klass in cls.__mro__:
+            if klass is object:
+                continue
+            parts.append(klass.__module__ + '.' + klass.__qualname__)
+            for name, attribute in sorted(vars(klass).items()):
+                function = getattr(attribute, '__func__', attribute)
+                if isinstance(function, types.FunctionType):
+                    parts.append((name, code_fingerprint(function.__code__)))
+        class_fingerprints[cls] = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return class_fingerprints[cls]
+
+def canonical(value):
+    """
+    A representation of value which is the same in every process, used for hashing.
+    Objects other than simple values, containers and arrays are represented by their class.
+    """
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, (float, np.floating)):
+        return float(value).hex()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), canonical(item)) for key, item in value.items()))
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return ('array', array.shape, str(array.dtype), hashlib.sha1(array.tobytes()).hexdigest())
+    if isinstance(value, types.FunctionType):
+        return ('function', code_fingerprint(value.__code__))
+    return ('object', class_fingerprint(type(value)))
+
+def reaction_fingerprint(reaction_class):
+    attributes = {name: value for name, value in vars(reaction_class).items()
+                  if name not in runtime_attributes and name != 'modifiers'}
+    modifiers = [(class_fingerprint(type(modifier)),
+                  canonical({name: value for name, value in vars(modifier).items() if name not in runtime_attributes}))
+                 for modifier in reaction_class.modifiers]
+    return (class_fingerprint(type(reaction_class)), canonical(attributes), tuple(modifiers))
+
+def structure_fingerprint(model):
+    """
+    A hash of the reactions in a model, and the model settings which change how it is solved.
+    Parameter and species values are not included.
+    """
+    structure = [reaction_fingerprint(reaction_class) for reaction_class in model]
+    structure.append(canonical([model.mxsteps, model.analytical_jacobian, model.sparse, model.sparse_threshold,
+                                model.codegen, model.jit]))
+    return hashlib.sha1(repr(structure).encode()).hexdigest()
+
+def run_fingerprint(model):
+    """
+    A hash of everything which decides the output of model.run_model() -
+    the model structure, species, parameters, time and solver.
+    """
+    solver = model.solver
+    inputs = [structure_fingerprint(model),
+              canonical(list(model.run_model_species_names)),
+              canonical(np.asarray(model.run_model_species_starting_values, dtype=float)),
+              canonical(dict(model.run_model_parameters)),
+              canonical(np.asarray(model.time, dtype=float)),
+              (class_fingerprint(type(solver)),
+               canonical([solver.name, getattr(solver, 'method', None), solver.rtol, solver.atol, solver.options]))]
+    return hashlib.sha1(repr(inputs).encode()).hexdigest()
+
+class ResultCache(object):
+    """
+    A least recently used cache of model outputs in memory, with an optional cache on disk which can be shared between processes.
+    Outputs are evicted from memory, oldest first, once they take more than max_bytes.
+    Files on disk are written to a temporary file and then moved into place, so other processes never read half a file.
+
+    Args:
+        max_bytes (int): The most memory the outputs can use.  Default 256 MB
+        directory (str): Optional, a directory to also keep outputs in as <key>.npy.  Default None keeps them in memory only.
+
+    Attributes:
+        hits (int): Outputs found in memory
+        disk_hits (int): Outputs found on disk
+        misses (int): Outputs which weren't found, so the model was run
+        evictions (int): Outputs removed from memory to make space
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks can't be pickled, so a new one is made when the model is sent to another process
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or (self.directory is not None and os.path.exists(self.path(key)))
+
+    def key(self, model):
+        return run_fingerprint(model)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """ The output saved for key, or None.  The output is read only, so copy it before changing it """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        if self.directory is not None:
+            try:
+                y = np.load(self.path(key))
+            except (OSError, ValueError):
+                y = None
+            if y is not None:
+                y = self.put(key, y, save=False)
+                with self.lock:
+                    self.disk_hits += 1
+                return y
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, y, save=True):
+        """ Save the output y for key, in memory and (if save is True) on disk """
+        y = np.array(y, dtype=float)
+        y.setflags(write=False)
+
+        if save == True and self.directory is not None:
+            temporary_path = self.path(key) + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+            with open(temporary_path, 'wb') as file:
+                np.save(file, y)
+            os.replace(temporary_path, self.path(key))
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key).nbytes
+            if y.nbytes > self.max_bytes:
+                return y
+
+            self.entries[key] = y
+            self.size += y.nbytes
+            while self.size > self.max_bytes:
+                old_key, old_y = self.entries.popitem(last=False)
+                self.size -= old_y.nbytes
+                self.evictions += 1
+
+        return y
+
+    def clear(self, disk=False):
+        """ Empty the cache in memory, and the files on disk if disk is True.  The statistics are reset. """
+        with self.lock:
+            self.entries = OrderedDict()
+            self.size = 0
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+        if disk == True and self.directory is not None:
+            # Only the files named by a run_fingerprint, so any other files in the directory are kept
+            for name in os.listdir(self.directory):
+                if cache_file_name.fullmatch(name):
+                    os.remove(os.path.join(self.directory, name))
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total > 0 else 0
+
+    def stats(self):
+        """ A dictionary of the hits, disk_hits, misses, evictions, hit_rate, entries and bytes used in memory """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate, 'entries': len(self.entries), 'bytes': self.size}
@@ -0,0 +1,497 @@
+import ast
+import builtins
+import copy
+import hashlib
+import inspect
+import textwrap
+import numpy as np
+
+""" Generate and compile the source code of a single flat deriv function for a model """
+
+class CodegenError(Exception):
+    """ Raised when a rate equation or modifier can't be turned into inline code """
+    pass
+
+reserved_names = ['y', 'p', 'dy', 'np', 'reactions', 'species_names', 'parameter_dict']
+
+function_trees = {}
+compiled_functions = {}
+
+def function_tree(function):
+    """ Parse the source of a function into an ast.FunctionDef.  Cached per function. """
+    if function not in function_trees:
+        source = textwrap.dedent(inspect.getsource(function))
+        function_trees[function] = ast.parse(source).body[0]
+    return function_trees[function]
+
+def evaluate_index(node, owner):
+    """
+    Evaluate the index of a subscript, which must be a constant such as 0 or self.parameter_indexes[1]
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -evaluate_index(node.operand, owner)
+
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute):
+        if isinstance(node.value.value, ast.Name) and node.value.value.id == 'self':
+            return getattr(owner, node.value.attr)[evaluate_index(node.slice, owner)]
+
+    raise CodegenError('Index is not a constant: ' + ast.unparse(node))
+
+class Substitute(ast.NodeTransformer):
+    """
+    Replace the names, substrates[..] and parameters[..] in an expression with the code for their current values.
+    """
+
+    def __init__(self, inliner):
+        self.inliner = inliner
+
+    def visit_Name(self, node):
+        return self.inliner.name(node.id)
+
+    def visit_Subscript(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id in ('substrates', 'parameters'):
+            values = self.inliner.lists[node.value.id]
+            return copy.deepcopy(values[evaluate_index(node.slice, self.inliner.owner)])
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id == 'self':
+            value = getattr(self.inliner.owner, node.attr)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return ast.Constant(value)
+            raise CodegenError('Can not inline self.' + node.attr)
+        return self.generic_visit(node)
+
+class Inliner(object):
+    """
+    Turns the body of a calculate_rate or calc_modifier method into straight-line code,
+    a list of (variable name, expression ast) assignments.  Local variables become uniquely named variables (prefixed by prefix), and
+    substrates[..] and parameters[..] become the code for their current values, eg y[3] and p[5].
+
+    Only simple assignments and a return are allowed.  Anything else raises CodegenError.
+    """
+
+    def __init__(self, owner, function, substrates, parameters, prefix, assignments, namespace):
+        self.owner = owner
+        self.function = function
+        self.lists = {'substrates': list(substrates), 'parameters': list(parameters)}
+        self.prefix = prefix
+        self.assignments = assignments
+        self.namespace = namespace
+        self.local_names = {}
+        self.count = 0
+
+    def name(self, name):
+        if name in self.local_names:
+            return copy.deepcopy(self.local_names[name])
+
+        function_globals = self.function.__globals__
+        if name in function_globals and (name not in reserved_names or (name == 'np' and function_globals[name] is np)):
+            self.namespace[name] = function_globals[name]
+            return ast.Name(name, ast.Load())
+
+        if hasattr(builtins, name):
+            return ast.Name(name, ast.Load())
+
+        raise CodegenError('Unknown name ' + name)
+
+    def expression(self, node):
+        return Substitute(self).visit(copy.deepcopy(node))
+
+    def assign(self, expression):
+        """ Store expression in a new variable, unless it is already a name, constant, y[..] or p[..] """
+        if isinstance(expression, (ast.Name, ast.Constant, ast.Subscript)):
+            return expression
+
+        variable = self.prefix + '_' + str(self.count)
+        self.count += 1
+        self.assignments.append((variable, expression))
+
+        return ast.Name(variable, ast.Load())
+
+    def run(self, modifier=False):
+        """
+        Args:
+            modifier (bool): True for calc_modifier, which must end with 'return substrates, parameters'
+
+        Returns:
+            The expression returned by the function, or None for a modifier
+        """
+        tree = function_tree(self.function)
+
+        for statement in tree.body:
+            if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant):
+                continue  # docstring
+
+            if isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+                self.store(statement.targets[0], self.expression(statement.value))
+
+            elif isinstance(statement, ast.AugAssign):
+                value = ast.BinOp(left=copy.deepcopy(statement.target), op=statement.op, right=statement.value)
+                target = copy.deepcopy(statement.target)
+                target.ctx = ast.Store()
+                self.store(target, self.expression(value))
+
+            elif isinstance(statement, ast.Return) and modifier == True:
+                if ast.unparse(statement.value) != 'substrates, parameters' and ast.unparse(statement.value) != '(substrates, parameters)':
+                    raise CodegenError('Modifier must return substrates, parameters')
+                return None
+
+            elif isinstance(statement, ast.Return) and statement.value is not None:
+                return self.expression(statement.value)
+
+            else:
+                raise CodegenError('Can not inline ' + ast.unparse(statement))
+
+        raise CodegenError('No return statement')
+
+    def store(self, target, expression):
+        if isinstance(target, ast.Name):
+            self.local_names[target.id] = self.assign(expression)
+
+        elif isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name) and target.value.id in self.lists:
+            index = evaluate_index(target.slice, self.owner)
+            self.lists[target.value.id][index] = self.assign(expression)
+
+        else:
+            raise CodegenError('Can not inline assignment to ' + ast.unparse(target))
+
+def rate_assignments(reaction, parameter_indexes, prefix, namespace):
+    """
+    Straight-line code calculating the rate of a reaction (with its modifiers) into a variable called prefix.
+
+    Args:
+        reaction (Reaction): a reaction which has been set up using setup_reaction()
+        parameter_indexes (list): the index in p of each of reaction.parameter_names
+        prefix (str): name of the variable the rate is stored in.  Also used as a prefix for other variables.
+        namespace (dict): any module level names used by the rate equation (eg np) are added to this
+
+    Returns:
+        A list of (variable name, expression ast), the last of which is the rate
+    """
+    assignments = []
+    substrates = [ast.parse('y[' + str(index) + ']', mode='eval').body for index in reaction.substrate_indexes]
+    parameters = [ast.parse('p[' + str(index) + ']', mode='eval').body for index in parameter_indexes]
+
+    for i, modifier in enumerate(reaction.modifiers):
+        inliner = Inliner(modifier, type(modifier).calc_modifier, substrates, parameters,
+                          prefix + '_m' + str(i), assignments, namespace)
+        inliner.run(modifier=True)
+        substrates = inliner.lists['substrates']
+        parameters = inliner.lists['parameters']
+
+    inliner = Inliner(reaction, type(reaction).calculate_rate, substrates, parameters, prefix, assignments, namespace)
+    if hasattr(reaction, 'rate_expression'):
+        # eg Generic, where the rate is an expression parsed from a string
+        rate = inliner.expression(reaction.rate_expression())
+    else:
+        rate = inliner.run()
+
+    last_variable = assignments[-1][0] if len(assignments) != 0 else None
+    if isinstance(rate, ast.Name) and rate.id == last_variable and rate.id.startswith(prefix + '_'):
+        assignments[-1] = (prefix, assignments[-1][1])
+    else:
+        assignments.append((prefix, rate))
+
+    return assignments
+
+def assignment_lines(assignments):
+    return [variable + ' = ' + ast.unparse(expression) for variable, expression in assignments]
+
+def rate_code(reaction, parameter_indexes, prefix, namespace):
+    """ The same as rate_assignments, but as lines of code """
+    return assignment_lines(rate_assignments(reaction, parameter_indexes, prefix, namespace))
+
+def add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if isinstance(b, ast.UnaryOp) and isinstance(b.op, ast.USub):
+        return ast.BinOp(a, ast.Sub(), b.operand)
+    return ast.BinOp(a, ast.Add(), b)
+
+def negate(a):
+    if a is None:
+        return None
+    return ast.UnaryOp(ast.USub(), a)
+
+def multiply(a, b):
+    if a is None or b is None:
+        return None
+    if isinstance(a, ast.Constant) and a.value == 1:
+        return b
+    if isinstance(b, ast.Constant) and b.value == 1:
+        return a
+    return ast.BinOp(a, ast.Mult(), b)
+
+def divide(a, b):
+    if a is None:
+        return None
+    return ast.BinOp(a, ast.Div(), b)
+
+def numpy_call(name, argument):
+    return ast.Call(ast.Attribute(ast.Name('np', ast.Load()), name, ast.Load()), [argument], [])
+
+def function_name(node):
+    """ The name of the function called, eg 'exp' for np.exp(..), math.exp(..) or exp(..) """
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    return ''
+
+def differentiate(expression, derivative_of):
+    """
+    Symbolic derivative of an expression.
+
+    Args:
+        expression (ast): The expression to differentiate
+        derivative_of (function): Called with each Name or Subscript in the expression (eg a variable or y[3]),
+                                  returns the ast of its derivative, or None where it is zero.
+
+    Returns:
+        The ast of the derivative, or None if it is zero
+    """
+    e = lambda node: copy.deepcopy(node)
+
+    if isinstance(expression, ast.Constant):
+        return None
+
+    if isinstance(expression, (ast.Name, ast.Subscript)):
+        return derivative_of(expression)
+
+    if isinstance(expression, ast.UnaryOp) and isinstance(expression.op, ast.USub):
+        return negate(differentiate(expression.operand, derivative_of))
+
+    if isinstance(expression, ast.UnaryOp) and isinstance(expression.op, ast.UAdd):
+        return differentiate(expression.operand, derivative_of)
+
+    if isinstance(expression, ast.BinOp):
+        u, v = expression.left, expression.right
+        du, dv = differentiate(u, derivative_of), differentiate(v, derivative_of)
+
+        if isinstance(expression.op, ast.Add):
+            return add(du, dv)
+
+        if isinstance(expression.op, ast.Sub):
+            return add(du, negate(dv))
+
+        if isinstance(expression.op, ast.Mult):
+            return add(multiply(du, e(v)), multiply(e(u), dv))
+
+        if isinstance(expression.op, ast.Div):
+            return add(divide(du, e(v)), negate(divide(multiply(e(u), dv), ast.BinOp(e(v), ast.Pow(), ast.Constant(2)))))
+
+        if isinstance(expression.op, ast.Pow):
+            if dv is None:
+                if isinstance(v, ast.Constant) and v.value == 2:
+                    power = e(u)
+                elif isinstance(v, ast.Constant):
+                    power = ast.BinOp(e(u), ast.Pow(), ast.Constant(v.value - 1))
+                else:
+                    power = ast.BinOp(e(u), ast.Pow(), ast.BinOp(e(v), ast.Sub(), ast.Constant(1)))
+                return multiply(multiply(e(v), power), du)
+            return multiply(e(expression), add(multiply(dv, numpy_call('log', e(u))), divide(multiply(e(v), du), e(u))))
+
+    if isinstance(expression, ast.Call) and len(expression.args) == 1 and len(expression.keywords) == 0:
+        name = function_name(expression)
+        u = expression.args[0]
+        du = differentiate(u, derivative_of)
+        if du is None:
+            return None
+
+        if name == 'exp':
+            return multiply(e(expression), du)
+        if name == 'log':
+            return divide(du, e(u))
+        if name == 'sqrt':
+            return divide(du, ast.BinOp(ast.Constant(2), ast.Mult(), e(expression)))
+        if name in ['abs', 'fabs', 'absolute']:
+            return multiply(numpy_call('sign', e(u)), du)
+        if name == 'sin':
+            return multiply(numpy_call('cos', e(u)), du)
+        if name == 'cos':
+            return negate(multiply(numpy_call('sin', e(u)), du))
+        if name == 'tanh':
+            return divide(du, ast.BinOp(numpy_call('cosh', e(u)), ast.Pow(), ast.Constant(2)))
+
+    if isinstance(expression, ast.Call) and function_name(expression) in ['power', 'pow'] and len(expression.args) == 2:
+        return differentiate(ast.BinOp(expression.args[0], ast.Pow(), expression.args[1]), derivative_of)
+
+    raise CodegenError('Can not differentiate ' + ast.unparse(expression))
+
+def derivative_assignments(assignments, variables):
+    """
+    Forward mode differentiation of straight-line code.
+
+    Args:
+        assignments (list): (variable name, expression ast), as returned by rate_assignments()
+        variables (list): The code of each value to differentiate with respect to, eg ['y[0]', 'y[3]']
+
+    Returns:
+        (new_assignments, derivatives) - the extra assignments needed, and a dictionary of
+        {(variable name, variable code) : ast} for every derivative which isn't zero.
+    """
+    new_assignments = []
+    derivatives = {}
+
+    for name, expression in assignments:
+        for number, variable in enumerate(variables):
+
+            def derivative_of(node):
+                if isinstance(node, ast.Name):
+                    return copy.deepcopy(derivatives.get((node.id, variable)))
+                if ast.unparse(node) == variable:
+                    return ast.Constant(1)
+                return None
+
+            derivative = differentiate(expression, derivative_of)
+            if derivative is None:
+                continue
+
+            if isinstance(derivative, (ast.Name, ast.Constant, ast.Subscript)):
+                derivatives[(name, variable)] = derivative
+            else:
+                derivative_name = 'd_' + name + '__' + str(number)
+                new_assignments.append((derivative_name, derivative))
+                derivatives[(name, variable)] = ast.Name(derivative_name, ast.Load())
+
+    return new_assignments, derivatives
+
+def inlined_attributes(owner):
+    """
+    The attributes of a reaction or modifier which can be written into the generated code as constants
+    (see Substitute.visit_Attribute and evaluate_index) - numbers, and lists of numbers.
+    """
+    attributes = []
+    for name, value in sorted(vars(owner).items()):
+        if isinstance(value, (list, tuple)) and all(isinstance(item, (int, float, np.number)) for item in value):
+            attributes.append((name, tuple(repr(item) for item in value)))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            attributes.append((name, repr(value)))
+    return tuple(attributes)
+
+def model_fingerprint(model, parameter_names):
+    """
+    A hash of everything which changes the generated code for a model:
+    the classes of the reactions and modifiers, their substrate and parameter indexes,
+    any numeric attributes which are inlined as constants, and the stoichiometry.
+    Parameter and species values are not included, so the compiled function is reused between runs.
+    """
+    structure = [len(model.run_model_species_names)]
+    for reaction_class in model:
+        modifiers = [(type(modifier).__module__, type(modifier).__qualname__, id(type(modifier).calc_modifier),
+                      tuple(modifier.substrate_indexes), tuple(modifier.parameter_indexes),
+                      inlined_attributes(modifier))
+                     for modifier in reaction_class.modifiers]
+        structure.append((type(reaction_class).__module__, type(reaction_class).__qualname__,
+                          id(type(reaction_class).calculate_rate),
+                          reaction_class in model.stoichiometric_reactions,
+                          tuple(reaction_class.substrate_indexes),
+                          tuple(parameter_names.index(name) for name in reaction_class.parameter_names),
+                          tuple(reaction_class.substrates), tuple(reaction_class.products),
+                          getattr(reaction_class, 'rate_equation', None),
+                          inlined_attributes(reaction_class),
+                          tuple(modifiers)))
+
+    structure.append(tuple(model.run_model_species_names))
+
+    return hashlib.sha1(repr(structure).encode()).hexdigest()
+
+def stoichiometry_terms(stoichiometry):
+    """ For each species, the list of (coefficient, reaction number) in the stoichiometry matrix """
+    if hasattr(stoichiometry, 'toarray'):
+        stoichiometry = stoichiometry.toarray()
+
+    terms = []
+    for row in stoichiometry:
+        terms.append([(coefficient, i) for i, coefficient in enumerate(row) if coefficient != 0])
+    return terms
+
+def linear_code(terms):
+    """ Code for the sum of coefficient * code for a list of (coefficient, code) """
+    code = ''
+    for coefficient, term in terms:
+        if coefficient == 1:
+            code += ' + ' + term
+        elif coefficient == -1:
+            code += ' - ' + term
+        elif coefficient < 0:
+            code += ' - ' + repr(float(-coefficient)) + ' * ' + term
+        else:
+            code += ' + ' + repr(float(coefficient)) + ' * ' + term
+
+    code = code.strip()
+    if code.startswith('+ '):
+        code = code[2:]
+    elif code.startswith('- '):
+        code = '-' + code[2:]
+    return code
+
+def sum_code(terms, variable='v'):
+    """ Code for the sum of coefficient * rate for a list of (coefficient, reaction number) """
+    return linear_code([(coefficient, variable + str(i)) for coefficient, i in terms])
+
+def generate_deriv_source(model, parameter_names, function_name='model_deriv'):
+    """
+    Generate the source for one deriv function for the model, with all indexes written in as constants.
+    Rates which can't be inlined (see Inliner) call reaction.rate(y) instead,
+    and reactions which aren't stoichiometric (eg Flow) call reaction.reaction(..).
+
+    The function has the signature (y, p, reactions, species_names, parameter_dict),
+    where p is a list of parameter values in the order of parameter_names,
+    and reactions is the list of reactions in the model.
+
+    Returns:
+        (source, namespace) - namespace holds the module level names used by the rate equations
+    """
+    namespace = {'np': np}
+    lines = []
+    reaction_numbers = {id(reaction_class): i for i, reaction_class in enumerate(model)}
+
+    for i, reaction_class in enumerate(model.stoichiometric_reactions):
+        number = reaction_numbers[id(reaction_class)]
+        lines.append('# ' + type(reaction_class).__name__ + ' - reactions[' + str(number) + ']')
+        parameter_indexes = [parameter_names.index(name) for name in reaction_class.parameter_names]
+        try:
+            lines.extend(rate_code(reaction_class, parameter_indexes, 'v' + str(i), namespace))
+        except (CodegenError, OSError, TypeError, IndexError, KeyError, AttributeError):
+            lines.append('v' + str(i) + ' = reactions[' + str(number) + '].rate(y)')
+
+    lines.append('dy = np.zeros(np.shape(y))')
+    for species_index, terms in enumerate(stoichiometry_terms(model.stoichiometry)):
+        if len(terms) != 0:
+            lines.append('dy[' + str(species_index) + '] = ' + sum_code(terms))
+
+    for reaction_class in model.other_reactions:
+        number = reaction_numbers[id(reaction_class)]
+        lines.append('dy = dy + reactions[' + str(number) + '].reaction(y, species_names, parameter_dict)')
+
+    lines.append('return dy')
+
+    source = 'def ' + function_name + '(y, p, reactions, species_names, parameter_dict):\n'
+    source += ''.join('    ' + line + '\n' for line in lines)
+
+    return source, namespace
+
+def compile_deriv(model, parameter_names):
+    """
+    Generate and compile the deriv function for a model, using compile().
+    Compiled functions are cached by model_fingerprint, so models with the same structure share them.
+
+    Returns:
+        (function, source)
+    """
+    fingerprint = model_fingerprint(model, parameter_names)
+
+    if fingerprint not in compiled_functions:
+        source, namespace = generate_deriv_source(model, parameter_names)
+        code = compile(source, '<kinetics model ' + fingerprint[:8] + '>', 'exec')
+        exec(code, namespace)
+        compiled_functions[fingerprint] = (namespace['model_deriv'], source)
+
+    return compiled_functions[fingerprint]
@@ -0,0 +1,229 @@
+import ast
+import hashlib
+import importlib.util
+import math
+import os
+import sys
+import numpy as np
+
+from kinetics.codegen import CodegenError, rate_assignments, assignment_lines, derivative_assignments, \
+    model_fingerprint, stoichiometry_terms, sum_code, linear_code
+from kinetics.reaction_classes.mass_transfer import Flow
+
+"""
+Optional numba backend.  Turn on with Model.set_jit()
+
+The deriv and jacobian of a model are generated as numba kernels which only take numpy arrays (y, and p for the parameters),
+so the solver calls compiled code at every step without going through any python objects.
+The kernels are written to a module in the cache directory, named by a hash of their source,
+and compiled with numba.njit(cache=True).  Other processes running the same model load the compiled kernels from disk.
+
+The cache directory is ~/.cache/kinetics, or the KINETICS_CACHE_DIR environment variable.
+"""
+
+loaded_kernels = {}
+
+def require_numba():
+    try:
+        import numba
+    except ImportError:
+        raise ImportError('The jit backend needs numba.  Install it with pip install numba')
+    return numba
+
+def cache_directory():
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'kinetics')
+    return os.path.join(os.environ.get('KINETICS_CACHE_DIR', default), 'jit')
+
+def module_imports(namespace):
+    """ Import lines for the modules used by the rate equations.  Only numpy and math can be used by numba. """
+    lines = []
+    for name, value in sorted(namespace.items()):
+        if value is np:
+            lines.append('import numpy as ' + name)
+        elif value is math:
+            lines.append('import math as ' + name)
+        else:
+            raise CodegenError(name + ' can not be used in a jit compiled rate equation')
+    return lines
+
+def generate_kernel_source(model, parameter_names):
+    """
+    Generate the source of a module of numba kernels for the model.
+
+    The module has:
+        deriv(y, t, p) and jacobian(y, t, p) - for odeint, with args=(p,)
+        ivp_deriv(t, y, p) and ivp_jacobian(t, y, p) - for solve_ivp, with args=(p,)
+        ensemble_deriv(y, t, p) and ensemble_banded_jacobian(y, t, p) - for a stacked batch of samples,
+                                                                         where p is samples by parameters
+
+    Every stoichiometric reaction must be possible to inline (see kinetics.codegen),
+    and the only other reactions allowed are Flow reactions.  Otherwise CodegenError is raised.
+    """
+    num_species = len(model.run_model_species_names)
+    namespace = {'np': np}
+    deriv_lines = []
+    jacobian_lines = []
+    jacobian_terms = {}
+
+    for i, reaction_class in enumerate(model.stoichiometric_reactions):
+        name = 'v' + str(i)
+        parameter_indexes = [parameter_names.index(parameter) for parameter in reaction_class.parameter_names]
+        try:
+            assignments = rate_assignments(reaction_class, parameter_indexes, name, namespace)
+        except (OSError, TypeError, IndexError, KeyError, AttributeError) as error:
+            raise CodegenError('Can not inline ' + type(reaction_class).__name__ + ': ' + str(error))
+
+        indexes = sorted(set(reaction_class.substrate_indexes))
+        variables = ['y[' + str(index) + ']' for index in indexes]
+        d_assignments, derivatives = derivative_assignments(assignments, variables)
+
+        comment = '# ' + type(reaction_class).__name__
+        deriv_lines.extend([comment] + assignment_lines(assignments))
+        jacobian_lines.extend([comment] + assignment_lines(assignments) + assignment_lines(d_assignments))
+
+        column = column_of(model.stoichiometry, i)
+        for index, variable in zip(indexes, variables):
+            if (name, variable) not in derivatives:
+                continue
+            derivative = derivatives[(name, variable)]
+            code = ast.unparse(derivative)
+            if not isinstance(derivative, (ast.Name, ast.Subscript)):
+                code = '(' + code + ')'
+            for species_index in np.nonzero(column)[0]:
+                jacobian_terms.setdefault((int(species_index), index), []).append((column[species_index], code))
+
+    deriv_lines.append('dy = np.zeros(' + str(num_species) + ')')
+    for species_index, terms in enumerate(stoichiometry_terms(model.stoichiometry)):
+        if len(terms) != 0:
+            deriv_lines.append('dy[' + str(species_index) + '] = ' + sum_code(terms))
+
+    for number, reaction_class in enumerate(model.other_reactions):
+        if not isinstance(reaction_class, Flow):
+            raise CodegenError(type(reaction_class).__name__ + ' is not a stoichiometric reaction so can not be jit compiled')
+
+        flow = 'flow' + str(number)
+        code = flow + ' = p[' + str(parameter_names.index(reaction_class.parameter_names[0])) + '] / p[' + \
+               str(parameter_names.index(reaction_class.parameter_names[1])) + ']'
+        deriv_lines.append(code)
+        jacobian_lines.append(code)
+        for index, input_index in zip(reaction_class.substrate_indexes, reaction_class.input_substrates_indexes):
+            deriv_lines.append('dy[' + str(index) + '] += ' + flow + ' * (y[' + str(input_index) + '] - y[' + str(index) + '])')
+            jacobian_terms.setdefault((index, input_index), []).append((1, flow))
+            jacobian_terms.setdefault((index, index), []).append((-1, flow))
+
+    deriv_lines.append('return dy')
+
+    jacobian_lines.append('jac = np.zeros((' + str(num_species) + ', ' + str(num_species) + '))')
+    for (row, column), terms in sorted(jacobian_terms.items()):
+        jacobian_lines.append('jac[' + str(row) + ', ' + str(column) + '] = ' + linear_code(terms))
+    jacobian_lines.append('return jac')
+
+    source = '\n'.join(['""" Numba kernels generated by kinetics.jit """',
+                        'from numba import njit'] + module_imports(namespace)) + '\n\n'
+    source += 'N = ' + str(num_species) + '\n\n'
+    source += function_source('deriv_kernel(y, p)', deriv_lines)
+    source += function_source('jacobian_kernel(y, p)', jacobian_lines)
+    source += kernel_wrappers
+
+    return source
+
+def column_of(stoichiometry, i):
+    if hasattr(stoichiometry, 'toarray'):
+        return stoichiometry[:, i].toarray().ravel()
+    return stoichiometry[:, i]
+
+def function_source(signature, lines):
+    return '@njit(cache=True)\ndef ' + signature + ':\n' + ''.join('    ' + line + '\n' for line in lines) + '\n'
+
+kernel_wrappers = '''@njit(cache=True)
+def deriv(y, t, p):
+    return deriv_kernel(y, p)
+
+@njit(cache=True)
+def jacobian(y, t, p):
+    return jacobian_kernel(y, p)
+
+@njit(cache=True)
+def ivp_deriv(t, y, p):
+    return deriv_kernel(y, p)
+
+@njit(cache=True)
+def ivp_jacobian(t, y, p):
+    return jacobian_kernel(y, p)
+
+@njit(cache=True)
+def ensemble_deriv(y, t, p):
+    dy = np.empty(y.shape[0])
+    for k in range(p.shape[0]):
+        dy[k*N:(k+1)*N] = deriv_kernel(y[k*N:(k+1)*N], p[k])
+    return dy
+
+@njit(cache=True)
+def ensemble_banded_jacobian(y, t, p):
+    banded = np.zeros((2*N - 1, y.shape[0]))
+    for k in range(p.shape[0]):
+        block = jacobian_kernel(y[k*N:(k+1)*N], p[k])
+        for i in range(N):
+            for j in range(N):
+                banded[i - j + N - 1, k*N + j] = block[i, j]
+    return banded
+'''
+
+def load_kernels(source):
+    """
+    Write the kernel source to the cache directory (if it isn't already there) and import it.
+    The file is named by a hash of the source, so numba's own cache of the compiled kernels is reused by any process.
+    """
+    key = hashlib.sha1(source.encode()).hexdigest()[:20]
+    if key in loaded_kernels:
+        return loaded_kernels[key]
+
+    require_numba()
+
+    directory = cache_directory()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'kinetics_model_' + key + '.py')
+
+    if not os.path.exists(path):
+        temporary_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(source)
+        os.replace(temporary_path, path)
+
+    # numba needs to be able to import the module by name to load its cache
+    name = 'kinetics_model_' + key
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    loaded_kernels[key] = module
+    return module
+
+compiled_kernels = {}
+
+def compile_kernels(model, parameter_names):
+    """
+    Generate, write and import the numba kernels for a model.
+    In this process, kernels are cached by model_fingerprint so the source is only generated once.
+
+    Returns:
+        (module, source)
+    """
+    fingerprint = model_fingerprint(model, parameter_names)
+
+    if fingerprint not in compiled_kernels:
+        source = generate_kernel_source(model, parameter_names)
+        compiled_kernels[fingerprint] = (load_kernels(source), source)
+
+    return compiled_kernels[fingerprint]
+
+def parameter_array(values):
+    """
+    The parameter values as a numpy array for the kernels.
+    If any value is an array with a value per sample, this is samples by parameters.
+    """
+    values = np.array(np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in values]), dtype=float)
+    if values.ndim == 2:
+        return np.ascontiguousarray(values.T)
+    return values
@@ -1,7 +1,12 @@
 import numpy as np
 import pandas as pd
-from scipy import integrate
+from scipy import sparse
 import matplotlib.pyplot as plt
+from kinetics.solvers import Odeint, get_solver
+from kinetics.codegen import compile_deriv
+from kinetics import jit as jit_backend
+from kinetics.cache import ResultCache
+from kinetics.sensitivities import forward_sensitivities, adjoint_gradient
 
 class Model(list):
     """
@@ -26,14 +31,30 @@ class Model(list):
                          The first dimension is the same size as self.time.
                          Each index in self.time relates to an index in the first dimension of y.
 
+        sensitivities (numpy array): time by species by parameter, dy/dp for each parameter.  Filled upon running run_sensitivities()
+
         logging (bool): True gives text feedback upon running some commands
 
         start (int): Model start time
         end (int): Model end time
         steps (int): The number of timpoints in the model output
         mxsteps (int): mxsteps used by scipy.integrate.odeint
+        solver (Solver): The integrator used by run_model().  Default is odeint.  Change using set_solver()
         time (np.linspace(self.start, self.end, self.steps)):  The timepoints of the model
 
+        stoichiometry (numpy array or scipy.sparse matrix): Species by reaction. Built by setup_model() for every reaction
+                                                           where y_prime is rate * stoichiometry, so deriv can use one matrix product.
+        sparse_threshold (int): Models with more species than this use a sparse stoichiometry matrix.  Default 100
+        analytical_jacobian (bool): If True (default) self.jacobian is passed to the solver, rather than it being estimated by finite differences.
+        jacobian_sparsity (scipy.sparse matrix): Species by species, non-zero where a reaction links the two species. Built by setup_model()
+        codegen (bool): If True (default) run_model() generates and compiles a single deriv function for the model (see kinetics.codegen).
+                        The source is in self.compiled_source.  Compiled functions are cached and reused between runs.
+        jit (bool): If True run_model() uses numba kernels for the deriv and jacobian (see kinetics.jit).  Turn on with set_jit().  Default False
+        sparse (bool): If True, the stiff solve_ivp solvers are given a sparse jacobian so they use sparse LU.
+                       The default odeint solver switches to BDF.  Useful for models with hundreds of species.  Default False
+        cache (ResultCache): If set, run_model() returns the saved output for inputs it has already run (see kinetics.cache).
+                             Turn on with set_cache().  Default None
+
     """
 
 
@@ -47,6 +68,7 @@ class Model(list):
         self.steps = 100
         self.mxsteps = 10000
         self.time = np.linspace(self.start, self.end, self.steps)
+        self.solver = Odeint()
 
         """ Species - used to reset the model, or as the bounds to run ua/sa """
         self.species = {}
@@ -63,9 +85,47 @@ class Model(list):
         self.run_model_parameters = {}
 
         self.y = []
+        self.sensitivities = None
+
+        """ True once setup_reactions() has loaded the indexes into the reactions, until reset_reaction_indexes() """
+        self.reactions_setup = False
+
+        """ Stoichiometry matrix - set by self.build_stoichiometry() """
+        self.stoichiometry = None
+        self.stoichiometric_reactions = []
+        self.other_reactions = []
+        self.stoichiometry_species_names = []
+        self.sparse_threshold = 100
+        self.analytical_jacobian = True
+        self.jacobian_sparsity = None
+        self.sparse = False
+
+        """ Generated deriv function - set by self.compile_model() """
+        self.codegen = True
+        self.compiled_deriv = None
+        self.compiled_source = ''
+        self.run_model_parameter_names = []
+        self.run_model_parameter_values = []
+
+        """ Numba kernels - set by self.compile_jit() """
+        self.jit = False
+        self.jit_kernels = None
+        self.jit_source = ''
+        self.jit_parameters = None
+
+        """ Cache of outputs - set by self.set_cache() """
+        self.cache = None
 
         self.logging = logging
 
+    def __getstate__(self):
+        # Compiled functions can't be pickled, so are left out when sending the model to other processes.
+        # They are made again (or loaded from the cache) by setup_reactions()
+        state = self.__dict__.copy()
+        state['compiled_deriv'] = None
+        state['jit_kernels'] = None
+        return state
+
     # Time
     def set_time(self, start, end, steps):
         """
@@ -82,6 +142,57 @@ class Model(list):
         self.steps = steps
         self.time = np.linspace(self.start, self.end, self.steps)
 
+    # Solver
+    def set_solver(self, solver='odeint', rtol=None, atol=None, **options):
+        """
+        Choose the integrator used by run_model()
+
+        Args:
+            solver (str): 'odeint' (default), or a scipy.integrate.solve_ivp method -
+                          'BDF', 'Radau', 'LSODA' for stiff models, 'RK45', 'RK23', 'DOP853' for non-stiff models
+            rtol (float): relative tolerance.  Default None uses 1.49012e-8, the odeint default
+            atol (float): absolute tolerance.  Default None uses 1.49012e-8, the odeint default
+            options: any other keyword arguments for odeint or solve_ivp
+        """
+
+        self.solver = get_solver(solver, rtol=rtol, atol=atol, **options)
+
+    def set_jit(self, jit=True):
+        """
+        Use numba to compile the deriv and jacobian of the model (see kinetics.jit).  Needs numba to be installed.
+        The first run compiles the kernels, which are cached on disk and reused by later runs and other processes.
+        Every reaction must be possible to inline (see kinetics.codegen), otherwise run_model() raises CodegenError.
+
+        Args:
+            jit (bool): True to turn on, False to turn off.  Default True
+        """
+        if jit == True:
+            jit_backend.require_numba()
+        self.jit = jit
+
+    # Cache
+    def set_cache(self, cache=True, max_bytes=256 * 1024 ** 2, directory=None):
+        """
+        Keep the outputs of run_model(), so running the same model with the same species, parameters, time and solver
+        returns the saved y without calling the solver.  See kinetics.cache.ResultCache
+
+        Args:
+            cache (bool or ResultCache): True to make a new cache, False to turn it off, or a ResultCache to share one
+            max_bytes (int): The most memory used by the outputs, oldest are removed first.  Default 256 MB
+            directory (str): Optional, a directory to also save outputs to, which can be shared between processes
+
+        Returns:
+            The ResultCache, which has the hit and miss statistics (cache.stats())
+        """
+        if isinstance(cache, ResultCache):
+            self.cache = cache
+        elif cache == True:
+            self.cache = ResultCache(max_bytes=max_bytes, directory=directory)
+        else:
+            self.cache = None
+
+        return self.cache
+
     # Setup Model
     def set_parameters_from_reactions(self):
         """
@@ -180,6 +291,7 @@ class Model(list):
         2. load_species_from_reactions()
         3. update_species(self.species())
         4. set_parameters_from_reactions()
+        5. build_stoichiometry()
         """
 
         # Species
@@ -190,6 +302,119 @@ class Model(list):
         # Parameters
         self.set_parameters_from_reactions()
 
+        # Stoichiometry
+        self.build_stoichiometry()
+
+    def build_stoichiometry(self):
+        """
+        Build the stoichiometry matrix (species by reaction) for every reaction where y_prime = rate * stoichiometry.
+        Reactions which calculate y_prime themselves (eg Flow) are kept in self.other_reactions.
+
+        Called by self.setup_model(), and by self.run_model() if the species have changed since.
+        """
+        self.stoichiometric_reactions = []
+        self.other_reactions = []
+        columns = []
+
+        for reaction_class in self:
+            if reaction_class.is_stoichiometric():
+                self.stoichiometric_reactions.append(reaction_class)
+                columns.append(reaction_class.stoichiometry(self.run_model_species_names))
+            else:
+                self.other_reactions.append(reaction_class)
+
+        stoichiometry = np.zeros((len(self.run_model_species_names), len(columns)))
+        for i, column in enumerate(columns):
+            stoichiometry[:, i] = column
+
+        if self.sparse == True or len(self.run_model_species_names) > self.sparse_threshold:
+            stoichiometry = sparse.csr_matrix(stoichiometry)
+
+        self.stoichiometry = stoichiometry
+        self.stoichiometry_species_names = list(self.run_model_species_names)
+
+        self.build_jacobian_sparsity()
+
+    def build_jacobian_sparsity(self):
+        """
+        Build self.jacobian_sparsity from the species each reaction changes and the species each rate depends on.
+        Called by self.build_stoichiometry()
+        """
+        rows = []
+        columns = []
+        for reaction_class in self:
+            for row, column in reaction_class.jacobian_structure(self.run_model_species_names):
+                rows.append(row)
+                columns.append(column)
+
+        num_species = len(self.run_model_species_names)
+        sparsity = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(num_species, num_species))
+        sparsity.data[:] = 1
+
+        self.jacobian_sparsity = sparsity
+
+    def setup_reactions(self):
+        """
+        Load the substrate indexes and run_model_parameters into each reaction before running the model.
+        Called by self.run_model()
+        """
+        if self.stoichiometry is None or self.stoichiometry_species_names != self.run_model_species_names:
+            self.build_stoichiometry()
+        elif self.sparse == True and not sparse.issparse(self.stoichiometry):
+            self.build_stoichiometry()
+
+        for reaction_class in self:
+            reaction_class.setup_reaction(self.run_model_species_names, self.run_model_parameters)
+
+        self.compiled_deriv = None
+        self.jit_kernels = None
+
+        if self.jit == True:
+            self.compile_jit()
+        elif self.codegen == True:
+            self.compile_model()
+
+        self.reactions_setup = True
+
+    def compile_model(self):
+        """
+        Generate the source code for a single deriv function for this model, with every index written in as a constant,
+        and compile it.  The function is cached by the structure of the model, so it is only compiled once.
+
+        Called by self.setup_reactions() when self.codegen is True.
+
+        Returns:
+            The generated source code
+        """
+        self.run_model_parameter_names = list(self.run_model_parameters.keys())
+        self.run_model_parameter_values = list(self.run_model_parameters.values())
+        self.compiled_deriv, self.compiled_source = compile_deriv(self, self.run_model_parameter_names)
+
+        return self.compiled_source
+
+    def compile_jit(self):
+        """
+        Generate numba kernels for the deriv and jacobian of this model, and load them (compiling if needed).
+        The parameter values are put into a numpy array, self.jit_parameters, which is passed to the kernels.
+
+        Called by self.setup_reactions() when self.jit is True.
+
+        Returns:
+            The generated source code
+        """
+        self.run_model_parameter_names = list(self.run_model_parameters.keys())
+        self.run_model_parameter_values = list(self.run_model_parameters.values())
+        self.jit_kernels, self.jit_source = jit_backend.compile_kernels(self, self.run_model_parameter_names)
+        self.jit_parameters = jit_backend.parameter_array(self.run_model_parameter_values)
+
+        return self.jit_source
+
+    def jit_parameter_matrix(self, num_samples):
+        """ self.jit_parameters as samples by parameters, for the ensemble kernels """
+        if self.jit_parameters.ndim == 1:
+            return np.tile(self.jit_parameters, (num_samples, 1))
+        return self.jit_parameters
+
     # Reset the model
     def reset_reaction_indexes(self):
         """
@@ -198,6 +423,7 @@ class Model(list):
         """
         for reaction_class in self:
             reaction_class.reset_reaction()
+        self.reactions_setup = False
 
     def reset_model_to_defaults(self):
         """
@@ -219,6 +445,10 @@ class Model(list):
         For each step when the model is run, the rate for each reaction is calculated and changes in substrates and products calculated.
         These are returned by this function as y_prime, which are added to y which is returned by run_model
 
+        If the model has been compiled (see self.compile_model) the generated function is used.
+        Otherwise the rates of the stoichiometric reactions are multiplied by self.stoichiometry in one step,
+        while any other reactions (eg Flow) add their own y_prime.
+
         Args:
             y (list): ordered list of substrate values at this current timepoint. Has the same order as self.run_model_species_names
             t (): time, not used in this function but required for some reason
@@ -226,14 +456,236 @@ class Model(list):
         Returns:
             y_prime - ordered list the same as y, y_prime is the new set of y's for this timepoint.
         """
+        if self.reactions_setup == False:
+            self.setup_reactions()
 
-        yprime = np.zeros(len(y))
+        if self.jit_kernels is not None:
+            return self.jit_kernels.deriv(np.asarray(y, dtype=float), t, self.jit_parameters)
 
-        for reaction_class in self:
+        if self.compiled_deriv is not None:
+            # Rates are calculated on numpy floats, so dividing by zero gives nan or inf with a warning, as in rate()
+            return self.compiled_deriv(np.asarray(y, dtype=float), self.run_model_parameter_values, self,
+                                       self.run_model_species_names, self.run_model_parameters)
+
+        rates = np.array([reaction_class.rate(y) for reaction_class in self.stoichiometric_reactions])
+        yprime = self.stoichiometry @ rates
+
+        for reaction_class in self.other_reactions:
             yprime += reaction_class.reaction(y, self.run_model_species_names, self.run_model_parameters)
 
         return yprime
 
+    def rate_jacobian(self, y):
+        """
+        The derivatives of each stoichiometric reaction rate with respect to each species.
+
+        Returns:
+            numpy array of reactions by species, in the same order as self.stoichiometric_reactions and y
+        """
+        rate_jacobian = np.zeros((len(self.stoichiometric_reactions), len(y)))
+
+        for i, reaction_class in enumerate(self.stoichiometric_reactions):
+            d_substrates, d_parameters = reaction_class.rate_gradient(y)
+            for index, d_substrate in zip(reaction_class.substrate_indexes, d_substrates):
+                rate_jacobian[i][index] += d_substrate
+
+        return rate_jacobian
+
+    def jacobian(self, y, t):
+        """
+        Jacobian function called by integrate.odeint(self.deriv, y0, self.time, Dfun=self.jacobian)
+
+        Args:
+            y (list): ordered list of substrate values at this current timepoint. Has the same order as self.run_model_species_names
+            t (): time, not used in this function
+
+        Returns:
+            numpy array where [i][j] is the derivative of y_prime[i] with respect to y[j]
+        """
+        if self.reactions_setup == False:
+            self.setup_reactions()
+
+        if self.jit_kernels is not None:
+            return self.jit_kernels.jacobian(np.asarray(y, dtype=float), t, self.jit_parameters)
+
+        jacobian = self.stoichiometry @ self.rate_jacobian(y)
+
+        for reaction_class in self.other_reactions:
+            jacobian += reaction_class.reaction_jacobian(y, self.run_model_species_names, self.run_model_parameters)
+
+        return jacobian
+
+    def parameter_jacobian(self, y, t, parameter_names=None):
+        """
+        The derivatives of y_prime with respect to the parameters, from the analytical gradients of each rate equation.
+        Parameters used by more than one reaction add up.
+
+        Args:
+            y (list): ordered list of substrate values at this current timepoint. Has the same order as self.run_model_species_names
+            t (): time, not used in this function
+            parameter_names (list): The parameters.  Default None uses every parameter in self.run_model_parameters
+
+        Returns:
+            numpy array where [i][j] is the derivative of y_prime[i] with respect to parameter_names[j]
+        """
+        if self.reactions_setup == False:
+            self.setup_reactions()
+
+        if parameter_names is None:
+            parameter_names = list(self.run_model_parameters.keys())
+        parameter_indexes = {name: i for i, name in enumerate(parameter_names)}
+
+        rate_parameter_jacobian = np.zeros((len(self.stoichiometric_reactions), len(parameter_names)))
+        for i, reaction_class in enumerate(self.stoichiometric_reactions):
+            d_substrates, d_parameters = reaction_class.rate_gradient(y)
+            for name, d_parameter in zip(reaction_class.parameter_names, d_parameters):
+                if name in parameter_indexes:
+                    rate_parameter_jacobian[i][parameter_indexes[name]] += d_parameter
+
+        jacobian = np.asarray(self.stoichiometry @ rate_parameter_jacobian)
+
+        for reaction_class in self.other_reactions:
+            reaction_jacobian = reaction_class.reaction_parameter_jacobian(y, self.run_model_species_names, self.run_model_parameters)
+            for j, name in enumerate(reaction_class.parameter_names):
+                if name in parameter_indexes:
+                    jacobian[:, parameter_indexes[name]] += reaction_jacobian[:, j]
+
+        return jacobian
+
+    def sparse_jacobian(self, y, t):
+        """
+        The same as self.jacobian(), but returned as a scipy.sparse csc matrix.
+        Used when self.sparse is True.
+        """
+        rows = []
+        columns = []
+        values = []
+
+        for i, reaction_class in enumerate(self.stoichiometric_reactions):
+            d_substrates, d_parameters = reaction_class.rate_gradient(y)
+            rows.extend([i] * len(d_substrates))
+            columns.extend(reaction_class.substrate_indexes)
+            values.extend(d_substrates)
+
+        rate_jacobian = sparse.csr_matrix((values, (rows, columns)), shape=(len(self.stoichiometric_reactions), len(y)))
+        jacobian = sparse.csr_matrix(self.stoichiometry @ rate_jacobian)
+
+        for reaction_class in self.other_reactions:
+            jacobian = jacobian + sparse.csr_matrix(reaction_class.reaction_jacobian(y, self.run_model_species_names, self.run_model_parameters))
+
+        return jacobian.tocsc()
+
+    # Run a batch of samples as one system
+    def ensemble_deriv(self, y, t):
+        """
+        deriv function for a batch of samples stacked into one system of odes.
+        The rate of every reaction is calculated for all the samples at once.
+
+        Args:
+            y (numpy array): flat array of samples * species.  Each sample has the same order as self.run_model_species_names
+            t (): time, not used in this function
+
+        Returns:
+            y_prime - flat array the same shape as y
+        """
+        if self.jit_kernels is not None:
+            num_samples = len(y) // len(self.run_model_species_names)
+            return self.jit_kernels.ensemble_deriv(np.asarray(y, dtype=float), t, self.jit_parameter_matrix(num_samples))
+
+        y = y.reshape(-1, len(self.run_model_species_names)).T
+
+        if self.compiled_deriv is not None:
+            yprime = self.compiled_deriv(y, self.run_model_parameter_values, self,
+                                         self.run_model_species_names, self.run_model_parameters)
+            return yprime.T.ravel()
+
+        rates = np.empty((len(self.stoichiometric_reactions), y.shape[1]))
+        for i, reaction_class in enumerate(self.stoichiometric_reactions):
+            rates[i] = reaction_class.rate(y)
+
+        yprime = self.stoichiometry @ rates
+
+        for reaction_class in self.other_reactions:
+            yprime = yprime + reaction_class.reaction(y, self.run_model_species_names, self.run_model_parameters)
+
+        return yprime.T.ravel()
+
+    def ensemble_jacobian(self, y, t):
+        """
+        The jacobian of ensemble_deriv.  Samples are independent, so this is block diagonal.
+
+        Returns:
+            numpy array of samples by species by species - the jacobian block for each sample
+        """
+        num_species = len(self.run_model_species_names)
+        y = y.reshape(-1, num_species).T
+        num_samples = y.shape[1]
+
+        rate_jacobian = np.zeros((len(self.stoichiometric_reactions), num_species, num_samples))
+        for i, reaction_class in enumerate(self.stoichiometric_reactions):
+            d_substrates, d_parameters = reaction_class.rate_gradient(y)
+            for index, d_substrate in zip(reaction_class.substrate_indexes, d_substrates):
+                rate_jacobian[i][index] += d_substrate
+
+        blocks = self.stoichiometry @ rate_jacobian.reshape(len(self.stoichiometric_reactions), -1)
+        blocks = blocks.reshape(num_species, num_species, num_samples)
+
+        for reaction_class in self.other_reactions:
+            blocks = blocks + reaction_class.reaction_jacobian(y, self.run_model_species_names, self.run_model_parameters)
+
+        return np.moveaxis(blocks, 2, 0)
+
+    def run_ensemble(self, starting_values):
+        """
+        Run a batch of samples as one stacked system of odes, rather than calling run_model() for each.
+        Any entry in self.run_model_parameters can be a numpy array with a value for each sample.
+
+        Args:
+            starting_values (numpy array): samples by species, with the same order as self.run_model_species_names
+
+        Returns:
+            numpy array of samples by time by species
+        """
+        starting_values = np.array(starting_values, dtype=float)
+        num_samples, num_species = starting_values.shape
+
+        self.setup_reactions()
+        y = self.solver.solve_ensemble(self, starting_values)
+        self.reset_reaction_indexes()
+
+        y = y.reshape(len(self.time), num_samples, num_species)
+
+        return np.ascontiguousarray(y.transpose(1, 0, 2))
+
+    def time_to_concentration(self, concentration, substrate, mode='>=', starting_values=None):
+        """
+        The exact time at which substrate first reaches concentration, found as the model is integrated
+        rather than read off the timepoints in self.time.  The model only runs until every sample has reached it.
+
+        Args:
+            concentration (float): The concentration of interest
+            substrate (str): The substrate of interest
+            mode (str): Either '>=' or '<=' which looks for more_or_equal or less_or_equal respectively.
+            starting_values (numpy array): Optional, samples by species to run as a stacked system (see self.run_ensemble).
+                                           Default None runs self.run_model_species_starting_values
+
+        Returns:
+            The time (or a numpy array of times for each sample if starting_values is given).
+            If the concentration is never reached, the end time is given.
+        """
+        if starting_values is None:
+            y0 = np.array([self.run_model_species_starting_values], dtype=float)
+        else:
+            y0 = np.array(starting_values, dtype=float)
+
+        self.setup_reactions()
+        times = self.solver.solve_crossings(self, y0, self.run_model_species_names.index(substrate), concentration, mode=mode)
+        self.reset_reaction_indexes()
+
+        if starting_values is None:
+            return times[0]
+        return times
+
     def run_model(self):
         """
         Runs the model and outputs y
@@ -242,14 +694,71 @@ class Model(list):
         These are loaded by calling self.setup_model() before running.
 
         Outputs saved to self.y
+
+        If a cache has been set (see self.set_cache) and these inputs have been run before, the saved y is used.
         """
 
+        if self.cache is not None:
+            key = self.cache.key(self)
+            y = self.cache.get(key)
+            if y is not None:
+                self.y = y.copy()
+                return self.y
+
+        self.setup_reactions()
+
         y0 = np.array(self.run_model_species_starting_values)
-        self.y = integrate.odeint(self.deriv, y0, self.time, mxstep=self.mxsteps)
+
+        self.y = self.solver.solve(self, y0)
         self.reset_reaction_indexes()
 
+        if self.cache is not None:
+            self.cache.put(key, self.y)
+
         return self.y
 
+    def run_sensitivities(self, parameter_names=None):
+        """
+        Runs the model, and the local sensitivity of every species to each parameter in one solve,
+        using the forward sensitivity equations (see kinetics.sensitivities)
+
+        Outputs saved to self.y and self.sensitivities
+
+        Args:
+            parameter_names (list): The parameters of interest.  Default None uses every parameter in self.run_model_parameters
+
+        Returns:
+            numpy array of time by species by parameter, where [t][i][j] is dy_i/dp_j
+        """
+        self.y, self.sensitivities = forward_sensitivities(self, parameter_names=parameter_names)
+
+        return self.sensitivities
+
+    def adjoint_gradient(self, objective, parameter_names=None):
+        """
+        The gradient of a single objective with respect to the parameters and starting species, using the adjoint method
+        (see kinetics.sensitivities).  Unlike run_sensitivities(), the cost stays about the same however many parameters there are.
+
+        Args:
+            objective: What to take the gradient of.  For example FinalConcentration('product'),
+                       SumSquaredError(data_df, ['product']) or TrajectoryObjective(function)
+            parameter_names (list): The parameters of interest.  Default None uses every parameter in self.run_model_parameters
+
+        Returns:
+            (value, parameter_gradients, species_gradients) - the value of the objective,
+            then dictionaries of the derivative of the objective with respect to each parameter, and to the starting value of each species.
+            For example (950.2, {'param_1' : 0.5}, {'Substrate_1' : 0.09})
+        """
+        if parameter_names is None:
+            parameter_names = list(self.run_model_parameters.keys())
+
+        value, parameter_gradient, species_gradient = adjoint_gradient(self, objective, parameter_names=parameter_names)
+
+        parameter_gradients = dict(zip(parameter_names, parameter_gradient.tolist()))
+        species_gradients = dict(zip(self.run_model_species_names, species_gradient.tolist()))
+
+        return value, parameter_gradients, species_gradients
+
     # Export results as dataframe and plot
     def results_dataframe(self):
         """
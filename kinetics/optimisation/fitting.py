@@ -0,0 +1,312 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy import optimize
+from tqdm import tqdm
+from kinetics.sensitivities import forward_sensitivities
+
+"""
+Fitting model parameters to experimental data.
+
+Parameters are fitted by scipy.optimize.least_squares, with the jacobian of the residuals taken from the
+forward sensitivities of the model (see kinetics.sensitivities) rather than by finite differences.
+Several experiments, each with their own starting species, can be fitted at once with the parameters shared between them.
+"""
+
+class Experiment(object):
+    """
+    Experimental data for fit_model(), and the conditions it was measured under.
+
+    Args:
+        data_df (Dataframe): Experimental data, with a 'Time' column, in the same format as used by plot_data()
+        substrates (list): The species which were measured.  As in plot_data(), every column containing the name of a substrate is used
+        species (dict): Starting species concentrations for this experiment, which replace those in model.species.  For example {'Substrate_1' : 500}
+        parameters (dict): Parameters which are fixed to a different value in this experiment.  For example {'enzyme_1_kcat' : 0}
+        weights (dict): Optional, {'substrate' : weight} to multiply the squared errors of each substrate by.  Default 1
+    """
+
+    def __init__(self, data_df, substrates, species={}, parameters={}, weights={}):
+        self.data_df = data_df
+        self.substrates = substrates
+        self.species = species
+        self.parameters = parameters
+        self.weights = weights
+
+    def observations(self, start=0):
+        """
+        The measurements in data_df as a list of (substrate, times, values, weight), leaving out missing values
+        and any measured before start.
+        """
+        time_data = np.asarray(self.data_df['Time'], dtype=float)
+
+        observations = []
+        for substrate in self.substrates:
+            for column in self.data_df:
+                if substrate in column:
+                    values = np.asarray(self.data_df[column], dtype=float)
+                    use = ~np.isnan(values) & (time_data >= start)
+                    observations.append((substrate, time_data[use], values[use], self.weights.get(substrate, 1)))
+
+        return observations
+
+class ModelFit(object):
+    """
+    The residuals of a model against a set of experiments, and their jacobian, for scipy.optimize.least_squares.
+    Used by fit_model(), which sends one to each worker process.
+
+    Args:
+        model (Model): The model, after setup_model()
+        experiments (list): A list of Experiment
+        parameter_names (list): The parameters being fitted
+        log (bool): If True the parameters are fitted as their natural logs
+    """
+
+    def __init__(self, model, experiments, parameter_names, log=True):
+        self.model = model
+        self.experiments = experiments
+        self.parameter_names = parameter_names
+        self.log = log
+
+        self.last_x = None
+        self.last_residuals = None
+        self.last_jacobian = None
+
+        # The timepoints each experiment is run for, and where each measurement is in them
+        start = model.time[0]
+        self.runs = []
+        for experiment in experiments:
+            observations = experiment.observations(start=start)
+            times = np.unique(np.concatenate([[start]] + [observation[1] for observation in observations]))
+            self.runs.append((experiment, times, [(model.run_model_species_names.index(substrate),
+                                                   np.searchsorted(times, observation_times),
+                                                   values, np.sqrt(weight))
+                                                  for substrate, observation_times, values, weight in observations]))
+
+        self.num_residuals = sum(len(values) for run in self.runs for index, rows, values, weight in run[2])
+
+    def to_parameters(self, x):
+        if self.log == True:
+            return np.exp(x)
+        return np.asarray(x, dtype=float)
+
+    def evaluate(self, x):
+        """ The residuals (model - data) and their jacobian with respect to x.  Saved, as least_squares asks for each separately """
+        if self.last_x is not None and np.array_equal(x, self.last_x):
+            return self.last_residuals, self.last_jacobian
+
+        model = self.model
+        parameters = self.to_parameters(x)
+        fitted = dict(zip(self.parameter_names, parameters.tolist()))
+        time = model.time
+
+        residuals = []
+        jacobians = []
+        try:
+            for experiment, times, observations in self.runs:
+                model.update_species(dict(model.species, **experiment.species))
+                model.run_model_parameters = dict(model.parameters, **fitted)
+                model.run_model_parameters.update(experiment.parameters)
+                model.time = times
+
+                y, sensitivities = forward_sensitivities(model, parameter_names=self.parameter_names)
+
+                for index, rows, values, weight in observations:
+                    residuals.append(weight * (y[rows, index] - values))
+                    jacobians.append(weight * sensitivities[rows, index, :])
+        finally:
+            model.time = time
+            model.reset_model_to_defaults()
+
+        residuals = np.concatenate(residuals) if len(residuals) > 0 else np.zeros(0)
+        jacobian = np.concatenate(jacobians) if len(jacobians) > 0 else np.zeros((0, len(x)))
+        if self.log == True:
+            jacobian = jacobian * parameters
+
+        # A failed solve gives nan, which least_squares can't use, so it is made a very poor fit instead
+        if not np.all(np.isfinite(residuals)) or not np.all(np.isfinite(jacobian)):
+            residuals = np.nan_to_num(residuals, nan=1e10, posinf=1e10, neginf=-1e10)
+            jacobian = np.nan_to_num(jacobian, nan=0, posinf=0, neginf=0)
+
+        self.last_x = np.array(x, dtype=float)
+        self.last_residuals, self.last_jacobian = residuals, jacobian
+
+        return residuals, jacobian
+
+    def residuals(self, x):
+        return self.evaluate(x)[0]
+
+    def jacobian(self, x):
+        return self.evaluate(x)[1]
+
+    def fit(self, x0, bounds=(-np.inf, np.inf), **options):
+        """
+        Run least_squares from x0.
+
+        Returns:
+            (x, cost, success, message, nfev)
+        """
+        result = optimize.least_squares(self.residuals, x0, jac=self.jacobian, bounds=bounds, **options)
+        return result.x, result.cost, bool(result.success), str(result.message), result.nfev
+
+class FitResult(object):
+    """
+    The output of fit_model()
+
+    Attributes:
+        parameters (dict): The fitted value of each parameter
+        cost (float): Half the sum of the (weighted) squared residuals of the best fit
+        residuals (np.array): The residuals (model - data) of the best fit
+        jacobian (np.array): The jacobian of the residuals with respect to the fitted parameters (or their logs, if fitted in log space)
+        covariance (np.array): Estimated covariance of the parameters, from the residual variance and the jacobian at the best fit
+        log_covariance (np.array): The same for the natural logs of the parameters.  None if log was False
+        standard_errors (dict): The standard error of each parameter
+        success (bool): Whether least_squares reported success for the best fit
+        message (str): The message from least_squares for the best fit
+        starts (Dataframe): The cost and fitted parameters of every start, best first
+    """
+
+    def __init__(self, parameter_names, parameters, cost, residuals, jacobian, log, success, message, starts):
+        self.parameter_names = parameter_names
+        self.parameters = dict(zip(parameter_names, parameters.tolist()))
+        self.cost = cost
+        self.residuals = residuals
+        self.jacobian = jacobian
+        self.success = success
+        self.message = message
+        self.starts = starts
+
+        # Covariance from the gauss-newton approximation of the hessian, scaled by the residual variance
+        degrees_of_freedom = max(len(residuals) - len(parameter_names), 1)
+        residual_variance = np.sum(residuals ** 2) / degrees_of_freedom
+        covariance = residual_variance * np.linalg.pinv(jacobian.T @ jacobian)
+
+        if log == True:
+            self.log_covariance = covariance
+            self.covariance = covariance * np.outer(parameters, parameters)
+        else:
+            self.log_covariance = None
+            self.covariance = covariance
+
+        self.standard_errors = dict(zip(parameter_names, np.sqrt(np.diag(self.covariance)).tolist()))
+
+    def __repr__(self):
+        return 'FitResult(cost=' + str(self.cost) + ', parameters=' + str(self.parameters) + ')'
+
+    def correlation(self):
+        """ The correlation matrix of the parameters, from the covariance """
+        standard_errors = np.sqrt(np.diag(self.covariance))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.covariance / np.outer(standard_errors, standard_errors)
+
+    def to_dataframe(self):
+        """ A dataframe of each parameter with its fitted value and standard error """
+        return pd.DataFrame({'Parameter': self.parameter_names,
+                             'Value': [self.parameters[name] for name in self.parameter_names],
+                             'Standard error': [self.standard_errors[name] for name in self.parameter_names]})
+
+""" -- Running starts in parallel -- """
+worker_fit = None
+
+def init_fitting_worker(model_fit):
+    """ Called once in each worker process.  Stores the ModelFit. """
+    global worker_fit
+    worker_fit = model_fit
+
+def fit_start(x0, bounds, options):
+    return worker_fit.fit(x0, bounds=bounds, **options)
+
+def starting_points(x0, lower, upper, starts, log=True, seed=None):
+    """
+    The first start is x0, the rest are drawn uniformly between the bounds (of the logs of the parameters if log is True).
+    Parameters without both bounds are drawn within a factor of 10 of their starting value.
+    """
+    rng = np.random.default_rng(seed)
+    points = [x0]
+
+    for i in range(starts - 1):
+        if log == True:
+            low = np.where(np.isfinite(lower), lower, x0 - np.log(10))
+            high = np.where(np.isfinite(upper), upper, x0 + np.log(10))
+        else:
+            low = np.where(np.isfinite(lower), lower, x0 / 10)
+            high = np.where(np.isfinite(upper), upper, x0 * 10)
+        points.append(rng.uniform(low, high))
+
+    return points
+
+def fit_model(model, experiments, parameter_names=None, bounds={}, log=True, starts=1, workers=1, seed=None,
+              logging=True, **options):
+    """
+    Fit parameters of a model to one or more experiments, which share the parameters.
+
+    The fit minimises the sum of squared errors between the model and every measurement, using scipy.optimize.least_squares
+    with the jacobian from the forward sensitivities.  The model's generated code is compiled once and reused for every run.
+    Several starts can be run in parallel, to avoid local minima.
+
+    Args:
+        model (Model): The model, after setup_model().  model.parameters are the starting values, and the values of the parameters not fitted
+        experiments (list): A list of Experiment, or a single Experiment
+        parameter_names (list): The parameters to fit.  Default None uses the keys of bounds, or if there are no bounds every parameter
+        bounds (dict): Optional, {'parameter' : (lower, upper)}.  Either can be None
+        log (bool): If True (default) the logs of the parameters are fitted, which suits parameters of very different sizes.
+                    This keeps every parameter positive, so each must start above 0
+        starts (int): The number of starts.  The first is from model.parameters, the rest are random (see starting_points)
+        workers (int): Number of processes to run the starts in.  Default = 1
+        seed (int): Seed for the random starts
+        logging (bool): Show a progress bar
+        options: Any other keyword arguments for scipy.optimize.least_squares, such as ftol or max_nfev
+
+    Returns:
+        A FitResult for the start with the lowest cost
+    """
+    if isinstance(experiments, Experiment):
+        experiments = [experiments]
+    if parameter_names is None:
+        parameter_names = list(bounds.keys()) if len(bounds) > 0 else list(model.parameters.keys())
+
+    x0 = np.array([model.parameters[name] for name in parameter_names], dtype=float)
+    lower = np.array([bounds.get(name, (None, None))[0] for name in parameter_names], dtype=float)
+    upper = np.array([bounds.get(name, (None, None))[1] for name in parameter_names], dtype=float)
+    lower[np.isnan(lower)] = -np.inf
+    upper[np.isnan(upper)] = np.inf
+
+    if log == True:
+        if np.any(x0 <= 0):
+            raise ValueError('Parameters fitted in log space must start above 0')
+        with np.errstate(divide='ignore'):
+            lower, upper, x0 = np.log(lower), np.log(upper), np.log(x0)
+        lower[np.isnan(lower)] = -np.inf
+    x0 = np.clip(x0, lower, upper)
+
+    model_fit = ModelFit(model, experiments, parameter_names, log=log)
+    points = starting_points(x0, lower, upper, starts, log=log, seed=seed)
+
+    # Compile before starting any workers, so they are forked with the compiled function already cached
+    model.setup_reactions()
+    model.reset_reaction_indexes()
+
+    fits = []
+    progress = tqdm(total=len(points), disable=(logging == False))
+    if workers > 1 and len(points) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_fitting_worker, initargs=(model_fit,)) as executor:
+            futures = {executor.submit(fit_start, point, (lower, upper), options): i for i, point in enumerate(points)}
+            for future in as_completed(futures):
+                fits.append((futures[future], future.result()))
+                progress.update(1)
+    else:
+        for i, point in enumerate(points):
+            fits.append((i, model_fit.fit(point, bounds=(lower, upper), **options)))
+            progress.update(1)
+    progress.close()
+
+    fits.sort(key=lambda fit: (fit[1][1], fit[0]))
+    best_x, best_cost, success, message, nfev = fits[0][1]
+
+    starts_df = pd.DataFrame([dict({'Start': i, 'Cost': cost, 'Success': fit_success},
+                                   **dict(zip(parameter_names, model_fit.to_parameters(x).tolist())))
+                              for i, (x, cost, fit_success, fit_message, fit_nfev) in fits])
+
+    residuals, jacobian = model_fit.evaluate(best_x)
+
+    return FitResult(parameter_names, model_fit.to_parameters(best_x), best_cost, residuals, jacobian,
+                     log, success, message, starts_df)
@@ -1,8 +1,28 @@
 from deap import creator, base, tools, algorithms
 import random
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
+""" -- Evaluating individuals in parallel -- """
+worker_ga = None
+
+def init_ga_worker(ga):
+    """
+    Called once in each worker process.  Stores a copy of the GA, with its model and metrics, which evaluates every individual sent to it.
+    """
+    global worker_ga
+    worker_ga = ga
+
+def evaluate_individual(ind):
+    """ Evaluate an individual (a list of values) in a worker process, returning its fitness as a tuple """
+    return fitness_tuple(worker_ga.evaluate(ind))
+
+def fitness_tuple(fitness):
+    if isinstance(fitness, (list, tuple)):
+        return tuple(fitness)
+    return (fitness,)
+
 class GA_Base_Class(object):
 
     def __init__(self, model=None, metrics=None, weights=(1,), bounds={}):
@@ -38,6 +58,27 @@ class GA_Base_Class(object):
 
         self.flow = False
 
+        self.workers = 1
+
+    def __getstate__(self):
+        # Only what is needed to evaluate individuals is sent to worker processes.
+        # The toolbox holds classes made by deap.creator, and all_pops can be large.
+        state = self.__dict__.copy()
+        state['toolbox'] = base.Toolbox()
+        state['all_pops'] = []
+        return state
+
+    def set_parallel(self, workers=2):
+        """
+        Evaluate individuals in a pool of worker processes.  The model and metrics are sent to each worker once per run_ga().
+        Alternatively, register any map function as self.toolbox.map (after setup) to use that instead.
+        Individuals are evaluated on copies of the model in the workers, so self.model isn't changed by run_ga().
+
+        Args:
+            workers (int): Number of processes.  1 evaluates individuals in this process
+        """
+        self.workers = workers
+
     def set_ga_settings(self, indpb_mate=0.5, mu=0, sigma=0.4, indpb_mutate=0.5):
         self.indpb_mate = indpb_mate
         self.mu=mu
@@ -59,6 +100,7 @@ class GA_Base_Class(object):
         self.toolbox.register("select", tools.selNSGA2)
         self.toolbox.register("mutate", tools.mutGaussian, mu=self.mu, sigma=self.sigma, indpb=self.indpb_mutate)
         self.toolbox.register("evaluate", self.evaluate)
+        self.toolbox.register("map", map)
 
     def make_ind(self,bounds):
         # bounds = [(0,100), (3, 4), (12, 15)...]
@@ -115,15 +157,43 @@ class GA_Base_Class(object):
     def fitness(self):
         return 1
 
+    def evaluate_population(self, individuals, executor=None):
+        """
+        Set the fitness of each individual.
+        Individuals are sent as plain lists, and their fitnesses returned as tuples,
+        using executor (see self.set_parallel) if given, or otherwise self.toolbox.map.
+        """
+        vectors = [list(ind) for ind in individuals]
+
+        if executor is not None:
+            chunksize = max(1, len(vectors) // (self.workers * 4))
+            fitnesses = executor.map(evaluate_individual, vectors, chunksize=chunksize)
+        else:
+            fitnesses = map(fitness_tuple, self.toolbox.map(self.toolbox.evaluate, vectors))
+
+        for ind, fit in zip(individuals, fitnesses):
+            ind.fitness.values = fit
+
     def run_ga(self, initial_pop=False, plot=False):
         if initial_pop != False:
             population = initial_pop
         else:
             population = self.toolbox.population(n=self.initial_pop_size)
 
-        fitnesses = list(map(self.toolbox.evaluate, population))
-        for ind, fit in zip(population, fitnesses):
-            ind.fitness.values = fit
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_ga_worker, initargs=(self,))
+
+        try:
+            population = self.evolve(population, executor=executor, plot=plot)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return population
+
+    def evolve(self, population, executor=None, plot=False):
+        self.evaluate_population(population, executor=executor)
 
         self.all_pops.append(population)
 
@@ -133,9 +203,7 @@ class GA_Base_Class(object):
 
             # Evaluate the individuals with an invalid fitness
             invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-            fitnesses = map(self.toolbox.evaluate, invalid_ind)
-            for ind, fit in zip(invalid_ind, fitnesses):
-                ind.fitness.values = fit
+            self.evaluate_population(invalid_ind, executor=executor)
 
             new_population = population + offspring
             population = self.toolbox.select(new_population, k=self.num_to_select)
@@ -145,4 +213,4 @@ class GA_Base_Class(object):
                 self.model.plot_substrate(self.metrics.product)
                 plt.show()
 
-
+        return population
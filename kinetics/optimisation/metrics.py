@@ -239,7 +239,7 @@ class Metrics(object):
         outputs = kinetics.run_all_models(self.model, samples, logging=logging)
         product_df = kinetics.dataframes_quartiles(self.model, outputs, substrates=[self.product], quartile=ci)
 
-        high_end = product_df['High'].iloc[-1]
-        low_end = product_df['Low'].iloc[-1]
+        high_end = product_df[self.product]['High'].iloc[-1]
+        low_end = product_df[self.product]['Low'].iloc[-1]
 
         return high_end-low_end
\ No newline at end of file
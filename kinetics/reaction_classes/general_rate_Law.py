@@ -1,4 +1,123 @@
+import ast
+import numpy as np
 from kinetics.reaction_classes.reaction_base_class import Reaction
+from kinetics.codegen import CodegenError, differentiate
+
+""" Functions and operators which can be used in the rate equation of a Generic reaction """
+allowed_functions = {'exp': 'exp', 'log': 'log', 'log10': 'log10', 'sqrt': 'sqrt', 'abs': 'abs',
+                     'sin': 'sin', 'cos': 'cos', 'tan': 'tan', 'tanh': 'tanh',
+                     'min': 'minimum', 'max': 'maximum', 'pow': 'power'}
+# The number of arguments of functions which don't take one.  min and max take two or more
+function_arguments = {'pow': 2}
+allowed_operators = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+compiled_equations = {}
+
+class RateEquation(object):
+    """
+    A rate equation string, parsed once and compiled into functions which take the substrates and parameters positionally.
+    The names in the equation are replaced by substrates[i] and parameters[i], and functions by their numpy versions,
+    so the compiled functions work on numpy arrays as well as floats.
+
+    Attributes:
+        expression (ast): The parsed expression, in terms of substrates[i] and parameters[i]
+        source (str): The code of the expression
+        function (function): function(substrates, parameters) returning the rate
+        gradient_function (function): function(substrates, parameters) returning ([d_substrates], [d_parameters]),
+                                      from symbolic differentiation of the expression.
+                                      None if the expression can't be differentiated (eg it uses min or max)
+    """
+
+    def __init__(self, rate_equation, substrate_names, parameter_names):
+        self.expression = parse_rate_equation(rate_equation, substrate_names, parameter_names)
+        self.source = ast.unparse(self.expression)
+        self.function = compile_function([self.expression], single=True)
+
+        variables = ['substrates[' + str(i) + ']' for i in range(len(substrate_names))]
+        variables += ['parameters[' + str(i) + ']' for i in range(len(parameter_names))]
+        try:
+            derivatives = []
+            for variable in variables:
+                derivative = differentiate(self.expression, lambda node: ast.Constant(1) if ast.unparse(node) == variable else None)
+                derivatives.append(derivative if derivative is not None else ast.Constant(0.0))
+            self.gradient_function = compile_function(derivatives, split=len(substrate_names))
+        except CodegenError:
+            self.gradient_function = None
+
+def parse_rate_equation(rate_equation, substrate_names, parameter_names):
+    """
+    Parse a rate equation, checking it only uses numbers, the substrate and parameter names,
+    allowed_operators and allowed_functions.  Otherwise a ValueError is raised.
+
+    Returns:
+        The ast of the expression, with names replaced by substrates[i] and parameters[i]
+    """
+    try:
+        expression = ast.parse(rate_equation.strip(), mode='eval').body
+    except SyntaxError as error:
+        raise ValueError('Could not parse rate equation ' + repr(rate_equation) + ': ' + str(error))
+
+    def convert(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return ast.Constant(node.value)
+
+        if isinstance(node, ast.Name):
+            if node.id in substrate_names:
+                return ast.parse('substrates[' + str(list(substrate_names).index(node.id)) + ']', mode='eval').body
+            if node.id in parameter_names:
+                return ast.parse('parameters[' + str(list(parameter_names).index(node.id)) + ']', mode='eval').body
+            raise ValueError('Unknown name ' + node.id + ' in rate equation ' + repr(rate_equation))
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, allowed_operators):
+            return ast.BinOp(convert(node.left), node.op, convert(node.right))
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, allowed_operators):
+            return ast.UnaryOp(node.op, convert(node.operand))
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in allowed_functions \
+                and len(node.keywords) == 0:
+            name = node.func.id
+            arguments = [convert(argument) for argument in node.args]
+            function = lambda: ast.Attribute(ast.Name('np', ast.Load()), allowed_functions[name], ast.Load())
+
+            if name in ['min', 'max']:
+                # np.minimum and np.maximum take two arrays (a third would be out=), so min(a, b, c) becomes min(min(a, b), c)
+                if len(arguments) < 2:
+                    raise ValueError(name + ' needs at least two arguments in rate equation ' + repr(rate_equation))
+                call = arguments[0]
+                for argument in arguments[1:]:
+                    call = ast.Call(function(), [call, argument], [])
+                return call
+
+            if len(arguments) != function_arguments.get(name, 1):
+                raise ValueError(name + ' takes ' + str(function_arguments.get(name, 1)) + ' argument(s) in rate equation ' + repr(rate_equation))
+            return ast.Call(function(), arguments, [])
+
+        raise ValueError('Rate equation ' + repr(rate_equation) + ' can not use ' + ast.unparse(node))
+
+    return convert(expression)
+
+def compile_function(expressions, single=False, split=0):
+    """
+    Compile a function of (substrates, parameters) returning the expressions.
+    Returns a single value if single is True, otherwise two lists split after the first split expressions.
+    """
+    code = [ast.unparse(expression) for expression in expressions]
+    if single == True:
+        returned = code[0]
+    else:
+        returned = '[' + ', '.join(code[:split]) + '], [' + ', '.join(code[split:]) + ']'
+
+    namespace = {'np': np}
+    exec(compile('def function(substrates, parameters):\n    return ' + returned + '\n', '<rate equation>', 'exec'), namespace)
+    return namespace['function']
+
+def compile_rate_equation(rate_equation, substrate_names, parameter_names):
+    """ A RateEquation, cached so each equation is only compiled once """
+    key = (rate_equation, tuple(substrate_names), tuple(parameter_names))
+    if key not in compiled_equations:
+        compiled_equations[key] = RateEquation(rate_equation, substrate_names, parameter_names)
+    return compiled_equations[key]
 
 class Generic(Reaction):
     """
@@ -6,6 +125,9 @@ class Generic(Reaction):
     Enter the parameter names in params, and the substrate names used in the reaction in species.
     Type the rate equation as a string in rate_equation, using these same names.
     Enter the substrates used up, and the products made in the reaction as normal.
+
+    The rate equation can use numbers, +, -, *, /, ** and the functions in allowed_functions (eg exp, log, sqrt).
+    It is parsed and compiled once, rather than evaluated at every step.
     """
 
     def __init__(self,
@@ -21,15 +143,33 @@ class Generic(Reaction):
         self.substrates = substrates
         self.products = products
 
+        self.equation = None
 
-    def calculate_rate(self, substrates, parameters):
+    def __getstate__(self):
+        # Compiled functions can't be pickled, the equation is compiled again when needed
+        state = self.__dict__.copy()
+        state['equation'] = None
+        return state
+
+    def compiled_equation(self):
+        self.equation = compile_rate_equation(self.rate_equation, self.reaction_substrate_names, self.parameter_names)
+        return self.equation
 
-        for i, name in enumerate(self.reaction_substrate_names):
-            locals().update({name: substrates[i]})
+    def setup_reaction(self, substrate_names, parameter_dict):
+        super().setup_reaction(substrate_names, parameter_dict)
+        self.compiled_equation()
 
-        for i, name in enumerate(self.parameter_names):
-            locals().update({name: parameters[i]})
+    def rate_expression(self):
+        """ The rate equation as an ast, in terms of substrates[i] and parameters[i].  Used by kinetics.codegen to inline it. """
+        return self.compiled_equation().expression
 
-        rate = eval(self.rate_equation, locals(), globals())
+    def calculate_rate(self, substrates, parameters):
+        if self.equation is None:
+            self.compiled_equation()
+        return self.equation.function(substrates, parameters)
 
-        return rate
\ No newline at end of file
+    def calculate_rate_gradient(self, substrates, parameters):
+        equation = self.compiled_equation()
+        if equation.gradient_function is None:
+            return super().calculate_rate_gradient(substrates, parameters)
+        return equation.gradient_function(substrates, parameters)
@@ -28,6 +28,22 @@ class Uni(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        enz = substrates[1]
+
+        # Parameters
+        kcat = parameters[0]
+        kma = parameters[1]
+
+        d_a = kcat * enz * kma / ((kma + a) ** 2)
+        d_enz = kcat * (a / (kma + a))
+        d_kcat = enz * (a / (kma + a))
+        d_kma = -kcat * enz * a / ((kma + a) ** 2)
+
+        return [d_a, d_enz], [d_kcat, d_kma]
+
 class Bi(Reaction):
     def __init__(self,
                  kcat=None, kma=None, kmb=None,
@@ -58,6 +74,29 @@ class Bi(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        enz = substrates[2]
+
+        # Parameters
+        kcat = parameters[0]
+        kma = parameters[1]
+        kmb = parameters[2]
+
+        sat_a = a / (kma + a)
+        sat_b = b / (kmb + b)
+
+        d_a = (kcat * enz) * (kma / ((kma + a) ** 2)) * sat_b
+        d_b = (kcat * enz) * sat_a * (kmb / ((kmb + b) ** 2))
+        d_enz = kcat * sat_a * sat_b
+        d_kcat = enz * sat_a * sat_b
+        d_kma = (kcat * enz) * (-a / ((kma + a) ** 2)) * sat_b
+        d_kmb = (kcat * enz) * sat_a * (-b / ((kmb + b) ** 2))
+
+        return [d_a, d_b, d_enz], [d_kcat, d_kma, d_kmb]
+
 class Bi_ternary_complex(Reaction):
 
     def __init__(self,
@@ -92,6 +131,33 @@ class Bi_ternary_complex(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        enz = substrates[2]
+
+        # Parameters
+        kcat = parameters[0]
+        kma = parameters[1]
+        kmb = parameters[2]
+        kia = parameters[3]
+
+        num = kcat * enz * a * b
+        den = ((kia * kmb) + (kmb * a) + (kma * b) + (a * b))
+        rate = num / den
+
+        # d(num/den) = d_num/den - rate * d_den/den
+        d_a = (kcat * enz * b - rate * (kmb + b)) / den
+        d_b = (kcat * enz * a - rate * (kma + a)) / den
+        d_enz = (kcat * a * b) / den
+        d_kcat = (enz * a * b) / den
+        d_kma = -rate * b / den
+        d_kmb = -rate * (kia + a) / den
+        d_kia = -rate * kmb / den
+
+        return [d_a, d_b, d_enz], [d_kcat, d_kma, d_kmb, d_kia]
+
 class Bi_ping_pong(Reaction):
 
     def __init__(self,
@@ -121,6 +187,29 @@ class Bi_ping_pong(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        enz = substrates[2]
+
+        # Parameters
+        kcat = parameters[0]
+        kma = parameters[1]
+        kmb = parameters[2]
+
+        den = (kmb * a) + (kma * b) + (a * b)
+        rate = (kcat * enz * a * b) / den
+
+        d_a = (kcat * enz * b - rate * (kmb + b)) / den
+        d_b = (kcat * enz * a - rate * (kma + a)) / den
+        d_enz = (kcat * a * b) / den
+        d_kcat = (enz * a * b) / den
+        d_kma = -rate * b / den
+        d_kmb = -rate * a / den
+
+        return [d_a, d_b, d_enz], [d_kcat, d_kma, d_kmb]
+
 class Ter_seq_redam(Reaction):
     r"""
     """
@@ -161,6 +250,38 @@ class Ter_seq_redam(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        c = substrates[2]
+        enz = substrates[3]
+
+        # Parameters
+        kcat = parameters[0]
+        kma = parameters[1]
+        kmb = parameters[2]
+        kmc = parameters[3]
+        kia = parameters[4]
+        kib = parameters[5]
+
+        denominator = (kia * kib * kmc) + (kib * kmc * a) + (kia * kmb * c) + (kmc * a * b) + (kmb * a * c) + (kma * b * c) + (a * b * c)
+        rate = (kcat * enz * a * b * c) / denominator
+
+        d_a = (kcat * enz * b * c - rate * ((kib * kmc) + (kmc * b) + (kmb * c) + (b * c))) / denominator
+        d_b = (kcat * enz * a * c - rate * ((kmc * a) + (kma * c) + (a * c))) / denominator
+        d_c = (kcat * enz * a * b - rate * ((kia * kmb) + (kmb * a) + (kma * b) + (a * b))) / denominator
+        d_enz = (kcat * a * b * c) / denominator
+
+        d_kcat = (enz * a * b * c) / denominator
+        d_kma = -rate * (b * c) / denominator
+        d_kmb = -rate * ((kia * c) + (a * c)) / denominator
+        d_kmc = -rate * ((kia * kib) + (kib * a) + (a * b)) / denominator
+        d_kia = -rate * ((kib * kmc) + (kmb * c)) / denominator
+        d_kib = -rate * ((kia * kmc) + (kmc * a)) / denominator
+
+        return [d_a, d_b, d_c, d_enz], [d_kcat, d_kma, d_kmb, d_kmc, d_kia, d_kib]
+
 class Ter_seq_car(Reaction):
     r"""
 
@@ -199,6 +320,36 @@ class Ter_seq_car(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        c = substrates[2]
+        enz = substrates[3]
+
+        # Parameters
+        kcat = parameters[0]
+        kma = parameters[1]
+        kmb = parameters[2]
+        kmc = parameters[3]
+        kia = parameters[4]
+
+        denominator = (kia * c) + (kmc * a * b) + (kmb * a * c) + (kma * b * c) + (a * b * c)
+        rate = (kcat * enz * a * b * c) / denominator
+
+        d_a = (kcat * enz * b * c - rate * ((kmc * b) + (kmb * c) + (b * c))) / denominator
+        d_b = (kcat * enz * a * c - rate * ((kmc * a) + (kma * c) + (a * c))) / denominator
+        d_c = (kcat * enz * a * b - rate * (kia + (kmb * a) + (kma * b) + (a * b))) / denominator
+        d_enz = (kcat * a * b * c) / denominator
+
+        d_kcat = (enz * a * b * c) / denominator
+        d_kma = -rate * (b * c) / denominator
+        d_kmb = -rate * (a * c) / denominator
+        d_kmc = -rate * (a * b) / denominator
+        d_kia = -rate * c / denominator
+
+        return [d_a, d_b, d_c, d_enz], [d_kcat, d_kma, d_kmb, d_kmc, d_kia]
+
 class Bi_ternary_complex_small_kma(Reaction):
     r"""
     """
@@ -230,4 +381,27 @@ class Bi_ternary_complex_small_kma(Reaction):
         rate = (kcat * enz * a * b) / ((kia * kmb) + (kmb * a) + (a * b))
 
 
-        return rate
\ No newline at end of file
+        return rate
+
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        enz = substrates[2]
+
+        # Parameters
+        kcat = parameters[0]
+        kmb = parameters[1]
+        kia = parameters[2]
+
+        den = (kia * kmb) + (kmb * a) + (a * b)
+        rate = (kcat * enz * a * b) / den
+
+        d_a = (kcat * enz * b - rate * (kmb + b)) / den
+        d_b = (kcat * enz * a - rate * a) / den
+        d_enz = (kcat * a * b) / den
+        d_kcat = (enz * a * b) / den
+        d_kmb = -rate * (kia + a) / den
+        d_kia = -rate * kmb / den
+
+        return [d_a, d_b, d_enz], [d_kcat, d_kmb, d_kia]
@@ -25,6 +25,15 @@ class FirstOrderRate(Reaction):
 
         return k*a
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+
+        # Parameters
+        k = parameters[0]
+
+        return [k], [a]
+
 class Binding(Reaction):
 
     def __init__(self, k1=None, kminus1=None,
@@ -53,6 +62,18 @@ class Binding(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        c = substrates[2]
+
+        # Parameters
+        k1 = parameters[0]
+        kminus1 = parameters[1]
+
+        return [k1*b, k1*a, -kminus1], [a*b, -c]
+
 class BiSecondOrderRate(Reaction):
 
     def __init__(self,
@@ -77,6 +98,16 @@ class BiSecondOrderRate(Reaction):
 
         return k*a*b
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+
+        # Parameters
+        k = parameters[0]
+
+        return [k*b, k*a], [a*b]
+
 class Binding_kd(Reaction):
 
     def __init__(self, kd=None, k1=None,
@@ -107,6 +138,18 @@ class Binding_kd(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        c = substrates[2]
+
+        # Parameters
+        kd = parameters[0]
+        k1 = parameters[1]
+
+        return [k1*b, k1*a, -kd*k1], [-k1*c, (a*b) - (kd*c)]
+
 class DiffusionEquilibrium(Reaction):
     def __init__(self, kd=None, k1=None, org_c=None, aq_c=None):
         super().__init__()
@@ -132,6 +175,17 @@ class DiffusionEquilibrium(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        org_c = substrates[0]
+        aq_c = substrates[1]
+
+        # Parameters
+        kd = parameters[0]
+        k1 = parameters[1]
+
+        return [k1, -kd*k1], [-k1*aq_c, org_c - (kd*aq_c)]
+
 class OxygenDiffusion(Reaction):
 
     def __init__(self,
@@ -160,6 +214,22 @@ class OxygenDiffusion(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        o2aq = substrates[0]
+
+        # Parameters
+        kl = parameters[0]
+        area = parameters[1]
+        o2sat = parameters[2]
+
+        d_o2aq = -kl * area
+        d_kl = -area * (o2aq - o2sat)
+        d_area = -kl * (o2aq - o2sat)
+        d_o2sat = kl * area
+
+        return [d_o2aq], [d_kl, d_area, d_o2sat]
+
 class Flow(Reaction):
     def __init__(self,
                  flow_rate=None, column_volume=None,
@@ -185,6 +255,10 @@ class Flow(Reaction):
         for name in self.input_substrates:
             self.input_substrates_indexes.append(substrate_names.index(name))
 
+    def setup_reaction(self, substrate_names, parameter_dict):
+        super().setup_reaction(substrate_names, parameter_dict)
+        self.get_input_indexes(substrate_names)
+
     def reset_reaction(self):
         self.substrate_indexes = []
         self.input_substrates_indexes = []
@@ -203,7 +277,7 @@ class Flow(Reaction):
 
         fr_over_cv = self.run_model_parameters[0] / self.run_model_parameters[1]
 
-        y_prime = np.zeros(len(y))
+        y_prime = np.zeros(np.shape(y))
 
         for index, input_index in zip(self.substrate_indexes, self.input_substrates_indexes):
             uM_current = y[index]
@@ -212,4 +286,54 @@ class Flow(Reaction):
 
             y_prime[index] += rate
 
-        return y_prime
\ No newline at end of file
+        return y_prime
+
+    def jacobian_structure(self, substrate_names):
+        structure = []
+        for name, input_name in zip(self.substrates, self.input_substrates):
+            index = substrate_names.index(name)
+            structure.append((index, index))
+            structure.append((index, substrate_names.index(input_name)))
+
+        return structure
+
+    def reaction_jacobian(self, y, substrate_names, parameter_dict):
+        if self.substrate_indexes == []:
+            self.get_indexes(substrate_names)
+
+        if self.input_substrates_indexes == []:
+            self.get_input_indexes(substrate_names)
+
+        if self.run_model_parameters == []:
+            self.run_model_parameters = self.get_parameters(parameter_dict)
+
+        fr_over_cv = self.run_model_parameters[0] / self.run_model_parameters[1]
+
+        jacobian = np.zeros((len(y), len(y)) + np.shape(y)[1:])
+
+        for index, input_index in zip(self.substrate_indexes, self.input_substrates_indexes):
+            jacobian[index][input_index] += fr_over_cv
+            jacobian[index][index] -= fr_over_cv
+
+        return jacobian
+
+    def reaction_parameter_jacobian(self, y, substrate_names, parameter_dict):
+        if self.substrate_indexes == []:
+            self.get_indexes(substrate_names)
+
+        if self.input_substrates_indexes == []:
+            self.get_input_indexes(substrate_names)
+
+        if self.run_model_parameters == []:
+            self.run_model_parameters = self.get_parameters(parameter_dict)
+
+        flow_rate, column_volume = self.run_model_parameters[0], self.run_model_parameters[1]
+
+        jacobian = np.zeros((len(y), 2) + np.shape(y)[1:])
+
+        for index, input_index in zip(self.substrate_indexes, self.input_substrates_indexes):
+            difference = y[input_index] - y[index]
+            jacobian[index][0] += difference / column_volume
+            jacobian[index][1] -= flow_rate * difference / column_volume ** 2
+
+        return jacobian
@@ -1,3 +1,6 @@
+import numpy as np
+from kinetics.reaction_classes.reaction_base_class import numerical_gradient
+
 """ Modifiers (eg inhibtion) """
 class Modifier():
 
@@ -26,6 +29,24 @@ class Modifier():
 
         return substrates, parameters
 
+    def calc_modifier_gradient(self, substrates, parameters, d_substrates, d_parameters):
+        # substrates and parameters are the values before calc_modifier was applied.
+        # d_substrates and d_parameters are derivatives of the rate with respect to the values after calc_modifier.
+        # Returns the derivatives of the rate with respect to the values before calc_modifier (chain rule).
+        # Modifiers should override this with the analytical derivatives, otherwise central differences are used.
+
+        num_substrates = len(substrates)
+        d_outputs = list(d_substrates) + list(d_parameters)
+
+        def modifier_function(values):
+            new_substrates, new_parameters = self.calc_modifier(values[:num_substrates], values[num_substrates:])
+            return np.array(np.broadcast_arrays(*(list(new_substrates) + list(new_parameters))))
+
+        columns = numerical_gradient(modifier_function, list(substrates) + list(parameters))
+        gradient = [sum(d_output * change for d_output, change in zip(d_outputs, column)) for column in columns]
+
+        return gradient[:num_substrates], gradient[num_substrates:]
+
 class SubstrateInhibition(Modifier):
 
     def __init__(self, ki=None, a=None):
@@ -41,6 +62,19 @@ class SubstrateInhibition(Modifier):
 
         return substrates, parameters
 
+    def calc_modifier_gradient(self, substrates, parameters, d_substrates, d_parameters):
+        ki = parameters[self.parameter_indexes[0]]
+        a = substrates[self.substrate_indexes[0]]
+
+        d_substrates = list(d_substrates)
+        d_parameters = list(d_parameters)
+        d_a = d_substrates[self.substrate_indexes[0]]
+
+        d_substrates[self.substrate_indexes[0]] = d_a * (1 + 2 * a / ki)
+        d_parameters[self.parameter_indexes[0]] += d_a * -(a * a) / (ki * ki)
+
+        return d_substrates, d_parameters
+
 class CompetitiveInhibition(Modifier):
 
     def __init__(self, km=None, ki=None, i=None):
@@ -57,6 +91,21 @@ class CompetitiveInhibition(Modifier):
 
         return substrates, parameters
 
+    def calc_modifier_gradient(self, substrates, parameters, d_substrates, d_parameters):
+        km = parameters[self.parameter_indexes[0]]
+        ki = parameters[self.parameter_indexes[1]]
+        i = substrates[self.substrate_indexes[0]]
+
+        d_substrates = list(d_substrates)
+        d_parameters = list(d_parameters)
+        d_km = d_parameters[self.parameter_indexes[0]]
+
+        d_parameters[self.parameter_indexes[0]] = d_km * (1 + i / ki)
+        d_parameters[self.parameter_indexes[1]] += d_km * -(km * i) / (ki * ki)
+        d_substrates[self.substrate_indexes[0]] += d_km * km / ki
+
+        return d_substrates, d_parameters
+
 class MixedInhibition(Modifier):
 
     def __init__(self, kcat=None, km=None, ki=None, alpha=None, i=None):
@@ -77,6 +126,41 @@ class MixedInhibition(Modifier):
 
         return substrates, parameters
 
+    def calc_modifier_gradient(self, substrates, parameters, d_substrates, d_parameters):
+        kcat = parameters[self.parameter_indexes[0]]
+        km = parameters[self.parameter_indexes[1]]
+        ki = parameters[self.parameter_indexes[2]]
+        alpha = parameters[self.parameter_indexes[3]]
+
+        i = substrates[self.substrate_indexes[0]]
+
+        d_substrates = list(d_substrates)
+        d_parameters = list(d_parameters)
+        d_kcat = d_parameters[self.parameter_indexes[0]]
+        d_km = d_parameters[self.parameter_indexes[1]]
+
+        # new kcat = kcat / den, new km = km * num / den
+        num = 1 + i / ki
+        den = 1 + i / (alpha * ki)
+
+        d_den_d_i = 1 / (alpha * ki)
+        d_den_d_ki = -i / (alpha * ki * ki)
+        d_den_d_alpha = -i / (alpha * alpha * ki)
+        d_num_d_i = 1 / ki
+        d_num_d_ki = -i / (ki * ki)
+
+        d_parameters[self.parameter_indexes[0]] = d_kcat / den
+        d_parameters[self.parameter_indexes[1]] = d_km * num / den
+
+        d_parameters[self.parameter_indexes[2]] += (d_kcat * -kcat * d_den_d_ki / (den * den)
+                                                    + d_km * km * (d_num_d_ki * den - num * d_den_d_ki) / (den * den))
+        d_parameters[self.parameter_indexes[3]] += (d_kcat * -kcat * d_den_d_alpha / (den * den)
+                                                    + d_km * km * -num * d_den_d_alpha / (den * den))
+        d_substrates[self.substrate_indexes[0]] += (d_kcat * -kcat * d_den_d_i / (den * den)
+                                                    + d_km * km * (d_num_d_i * den - num * d_den_d_i) / (den * den))
+
+        return d_substrates, d_parameters
+
 class MixedInhibition2(Modifier):
 
     def __init__(self, kcat=None, km=None, kic=None, kiu=None, i=None):
@@ -97,6 +181,39 @@ class MixedInhibition2(Modifier):
 
         return substrates, parameters
 
+    def calc_modifier_gradient(self, substrates, parameters, d_substrates, d_parameters):
+        kcat = parameters[self.parameter_indexes[0]]
+        km = parameters[self.parameter_indexes[1]]
+        kic = parameters[self.parameter_indexes[2]]
+        kiu = parameters[self.parameter_indexes[3]]
+
+        i = substrates[self.substrate_indexes[0]]
+
+        d_substrates = list(d_substrates)
+        d_parameters = list(d_parameters)
+        d_kcat = d_parameters[self.parameter_indexes[0]]
+        d_km = d_parameters[self.parameter_indexes[1]]
+
+        # new kcat = kcat / den, new km = km * num / den
+        num = 1 + i / kic
+        den = 1 + i / kiu
+
+        d_den_d_i = 1 / kiu
+        d_den_d_kiu = -i / (kiu * kiu)
+        d_num_d_i = 1 / kic
+        d_num_d_kic = -i / (kic * kic)
+
+        d_parameters[self.parameter_indexes[0]] = d_kcat / den
+        d_parameters[self.parameter_indexes[1]] = d_km * num / den
+
+        d_parameters[self.parameter_indexes[2]] += d_km * km * d_num_d_kic / den
+        d_parameters[self.parameter_indexes[3]] += (d_kcat * -kcat * d_den_d_kiu / (den * den)
+                                                    + d_km * km * -num * d_den_d_kiu / (den * den))
+        d_substrates[self.substrate_indexes[0]] += (d_kcat * -kcat * d_den_d_i / (den * den)
+                                                    + d_km * km * (d_num_d_i * den - num * d_den_d_i) / (den * den))
+
+        return d_substrates, d_parameters
+
 class FirstOrder_Modifier(Modifier):
 
     def __init__(self, kcat=None, k=None, s=None):
@@ -112,3 +229,18 @@ class FirstOrder_Modifier(Modifier):
         parameters[self.parameter_indexes[0]] = s*k*kcat
 
         return substrates, parameters
+
+    def calc_modifier_gradient(self, substrates, parameters, d_substrates, d_parameters):
+        kcat = parameters[self.parameter_indexes[0]]
+        k = parameters[self.parameter_indexes[1]]
+        s = substrates[self.substrate_indexes[0]]
+
+        d_substrates = list(d_substrates)
+        d_parameters = list(d_parameters)
+        d_kcat = d_parameters[self.parameter_indexes[0]]
+
+        d_parameters[self.parameter_indexes[0]] = d_kcat * s * k
+        d_parameters[self.parameter_indexes[1]] += d_kcat * s * kcat
+        d_substrates[self.substrate_indexes[0]] += d_kcat * k * kcat
+
+        return d_substrates, d_parameters
@@ -20,7 +20,7 @@ def calculate_yprime(y, rate, substrates, products, substrate_names):
         y_prime: following the addition or subtraction of rate to the specificed substrates
     """
 
-    y_prime = np.zeros(len(y))
+    y_prime = np.zeros(np.shape(y))
 
     for name in substrates:
         y_prime[substrate_names.index(name)] -= rate
@@ -30,14 +30,38 @@ def calculate_yprime(y, rate, substrates, products, substrate_names):
 
     return y_prime
 
+def numerical_gradient(function, values, step=1e-6):
+    """
+    Central difference derivatives of function(values) with respect to each entry in values.
+    Used where a reaction or modifier doesn't provide its own analytical derivatives.
+
+    Args:
+        function: takes a list the same length as values. Can return a number or a numpy array.
+        values: list of values to differentiate at
+        step: relative step size
+
+    Returns:
+        A list of derivatives, one for each entry in values
+    """
+    gradient = []
+    for i in range(len(values)):
+        h = step * np.maximum(np.abs(values[i]), 1)
+
+        up = list(values)
+        up[i] = up[i] + h
+        down = list(values)
+        down[i] = down[i] - h
+
+        gradient.append((function(up) - function(down)) / (2 * h))
+
+    return gradient
+
 def check_positive(y_prime):
     """
     Chack that substrate values are not negative when they shouldnt be
     """
 
-    for i in range(len(y_prime)):
-        if y_prime[i] < 0:
-            y_prime[i] = 0
+    y_prime[y_prime < 0] = 0
 
     return y_prime
 
@@ -93,6 +117,76 @@ class Reaction():
         self.substrate_indexes = []
         self.run_model_parameters = []
 
+    def setup_reaction(self, substrate_names, parameter_dict):
+        """
+        Load the substrate indexes and parameter values for a model run, including those of any modifiers.
+        Called by Model.run_model() before integrating, so reaction() and rate() don't need to look them up.
+        """
+        self.get_indexes(substrate_names)
+        self.run_model_parameters = self.get_parameters(parameter_dict)
+
+        for modifier in self.modifiers:
+            modifier.get_substrate_indexes(self.reaction_substrate_names)
+            modifier.get_parameter_indexes(self.parameter_names)
+
+    def is_stoichiometric(self):
+        """
+        True if y_prime for this reaction is just the rate multiplied by its stoichiometry.
+        Reactions which override reaction() or modify_product(), or use check_positive, are not.
+        """
+        if self.check_positive == True:
+            return False
+        if type(self).reaction is not Reaction.reaction:
+            return False
+        if type(self).modify_product is not Reaction.modify_product:
+            return False
+        return True
+
+    def stoichiometry(self, substrate_names):
+        """
+        Returns a numpy array the same length as substrate_names,
+        with -1 for every substrate used up and +1 for every product made in this reaction.
+        """
+        column = np.zeros(len(substrate_names))
+
+        for name in self.substrates:
+            column[substrate_names.index(name)] -= 1
+
+        for name in self.products:
+            column[substrate_names.index(name)] += 1
+
+        return column
+
+    def jacobian_structure(self, substrate_names):
+        """
+        The (row, column) positions in the model jacobian which this reaction can make non-zero.
+        Rows are the species this reaction changes, columns the species its rate depends on.
+        """
+        if type(self).modify_product is not Reaction.modify_product:
+            rows = list(range(len(substrate_names)))
+        else:
+            rows = [substrate_names.index(name) for name in self.substrates + self.products]
+
+        columns = [substrate_names.index(name) for name in self.reaction_substrate_names]
+
+        return [(row, column) for row in rows for column in columns]
+
+    def rate(self, y):
+        """
+        Calculate the rate of this reaction, with modifiers applied.
+        setup_reaction() must have been called first.
+
+        y can also be a numpy array of species by sample, with run_model_parameters holding an array of values per sample.
+        The rate equations only use arithmetic, so a numpy array with a rate for each sample is returned.
+        """
+        substrates = self.get_substrates(y)
+        parameters = copy.copy(self.run_model_parameters)
+
+        if len(self.modifiers) != 0:
+            substrates, parameters = self.calculate_modifiers(substrates, parameters)
+
+        return self.calculate_rate(substrates, parameters)
+
     def add_modifier(self, modifier):
         for name in modifier.parameter_names:
             if name not in self.parameter_names:
@@ -113,6 +207,85 @@ class Reaction():
     def calculate_rate(self, substrates, parameters):
         return 0
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        """
+        The partial derivatives of calculate_rate with respect to each substrate and each parameter.
+        Reaction classes should override this with the analytical derivatives,
+        otherwise they are estimated here by central differences.
+
+        Returns:
+            (d_substrates, d_parameters) - lists in the same order as substrates and parameters
+        """
+        num_substrates = len(substrates)
+
+        def rate_function(values):
+            return self.calculate_rate(values[:num_substrates], values[num_substrates:])
+
+        gradient = numerical_gradient(rate_function, list(substrates) + list(parameters))
+
+        return gradient[:num_substrates], gradient[num_substrates:]
+
+    def rate_gradient(self, y):
+        """
+        The derivatives of rate(y) with respect to the species in self.reaction_substrate_names
+        and the parameters in self.parameter_names, with the chain rule applied back through any modifiers.
+        setup_reaction() must have been called first.
+
+        Returns:
+            (d_substrates, d_parameters)
+        """
+        substrates = self.get_substrates(y)
+        parameters = copy.copy(self.run_model_parameters)
+
+        modifier_inputs = []
+        for modifier in self.modifiers:
+            modifier_inputs.append((list(substrates), list(parameters)))
+            substrates, parameters = modifier.calc_modifier(substrates, parameters)
+
+        d_substrates, d_parameters = self.calculate_rate_gradient(substrates, parameters)
+
+        # Modifiers can add substrates and parameters which calculate_rate doesn't use directly
+        d_substrates = list(d_substrates) + [0] * (len(substrates) - len(d_substrates))
+        d_parameters = list(d_parameters) + [0] * (len(parameters) - len(d_parameters))
+
+        for modifier, inputs in zip(reversed(self.modifiers), reversed(modifier_inputs)):
+            d_substrates, d_parameters = modifier.calc_modifier_gradient(inputs[0], inputs[1], d_substrates, d_parameters)
+
+        return d_substrates, d_parameters
+
+    def reaction_jacobian(self, y, substrate_names, parameter_dict):
+        """
+        The jacobian of reaction(y, substrate_names, parameter_dict), as a numpy array of species by species.
+        Used by Model.jacobian() for reactions which are not stoichiometric.
+        Estimated by central differences - reaction classes which override reaction() should override this too.
+        """
+        def reaction_function(values):
+            return self.reaction(np.array(values), substrate_names, parameter_dict)
+
+        columns = numerical_gradient(reaction_function, list(y))
+
+        return np.moveaxis(np.array(columns), 0, 1)
+
+    def reaction_parameter_jacobian(self, y, substrate_names, parameter_dict):
+        """
+        The derivatives of reaction(y, substrate_names, parameter_dict) with respect to the parameters in self.parameter_names,
+        as a numpy array of species by parameters.  setup_reaction() must have been called first.
+        Used by Model.parameter_jacobian() for reactions which are not stoichiometric.
+        Estimated by central differences - reaction classes which override reaction() should override this too.
+        """
+        parameters = list(self.run_model_parameters)
+
+        def reaction_function(values):
+            self.run_model_parameters = list(values)
+            return self.reaction(np.array(y, dtype=float), substrate_names, parameter_dict)
+
+        try:
+            columns = numerical_gradient(reaction_function, parameters)
+        finally:
+            self.run_model_parameters = parameters
+
+        return np.moveaxis(np.array(columns), 0, 1)
+
     def reaction(self, y, substrate_names, parameter_dict):
         if self.substrate_indexes == []:
             self.get_indexes(substrate_names) # need to move this to the model
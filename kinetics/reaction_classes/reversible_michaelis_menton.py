@@ -33,6 +33,32 @@ class UniUni_rev(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        p = substrates[1]
+        enz = substrates[2]
+
+        # Parameters
+        kcatf = parameters[0]
+        kcatr = parameters[1]
+        kma = parameters[2]
+        kmp = parameters[3]
+
+        den = 1 + (a / kma) + (p / kmp)
+        rate = ((kcatf * enz * a) - (kcatr * enz * p)) / den
+
+        d_a = ((kcatf * enz) - rate / kma) / den
+        d_p = ((-kcatr * enz) - rate / kmp) / den
+        d_enz = ((kcatf * a) - (kcatr * p)) / den
+
+        d_kcatf = (enz * a) / den
+        d_kcatr = (-enz * p) / den
+        d_kma = (rate * a / (kma * kma)) / den
+        d_kmp = (rate * p / (kmp * kmp)) / den
+
+        return [d_a, d_p, d_enz], [d_kcatf, d_kcatr, d_kma, d_kmp]
+
 class BiBi_Ordered_rev(Reaction):
 
     def __init__(self,
@@ -73,6 +99,48 @@ class BiBi_Ordered_rev(Reaction):
 
         return (numerator / denominator)
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        p = substrates[2]
+        q = substrates[3]
+        enz = substrates[4]
+
+        # Parameters
+        kcatf = parameters[0]
+        kcatr = parameters[1]
+        kmb = parameters[2]
+        kia = parameters[3]
+        kib = parameters[4]
+        kmp = parameters[5]
+        kip = parameters[6]
+        kiq = parameters[7]
+
+        forward = (a * b) / (kia * kmb)
+        reverse = (p * q) / (kmp * kiq)
+
+        numerator = (enz * kcatf * forward) - (enz * kcatr * reverse)
+        denominator = 1 + (a / kia) + (b / kib) + (q / kiq) + (p / kip) + forward + reverse
+        rate = numerator / denominator
+
+        d_a = (enz * kcatf * b / (kia * kmb) - rate * ((1 / kia) + b / (kia * kmb))) / denominator
+        d_b = (enz * kcatf * a / (kia * kmb) - rate * ((1 / kib) + a / (kia * kmb))) / denominator
+        d_p = (-enz * kcatr * q / (kmp * kiq) - rate * ((1 / kip) + q / (kmp * kiq))) / denominator
+        d_q = (-enz * kcatr * p / (kmp * kiq) - rate * ((1 / kiq) + p / (kmp * kiq))) / denominator
+        d_enz = ((kcatf * forward) - (kcatr * reverse)) / denominator
+
+        d_kcatf = (enz * forward) / denominator
+        d_kcatr = (-enz * reverse) / denominator
+        d_kmb = (-enz * kcatf * forward / kmb + rate * forward / kmb) / denominator
+        d_kia = (-enz * kcatf * forward / kia + rate * ((a / (kia * kia)) + forward / kia)) / denominator
+        d_kib = (rate * b / (kib * kib)) / denominator
+        d_kmp = (enz * kcatr * reverse / kmp + rate * reverse / kmp) / denominator
+        d_kip = (rate * p / (kip * kip)) / denominator
+        d_kiq = (enz * kcatr * reverse / kiq + rate * ((q / (kiq * kiq)) + reverse / kiq)) / denominator
+
+        return [d_a, d_b, d_p, d_q, d_enz], [d_kcatf, d_kcatr, d_kmb, d_kia, d_kib, d_kmp, d_kip, d_kiq]
+
 class BiBi_Random_rev(Reaction):
 
     def __init__(self,
@@ -114,6 +182,48 @@ class BiBi_Random_rev(Reaction):
 
         return rate
 
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        p = substrates[2]
+        q = substrates[3]
+        enz = substrates[4]
+
+        # Parameters
+        kcatf = parameters[0]
+        kcatr = parameters[1]
+        kmb = parameters[2]
+        kia = parameters[3]
+        kib = parameters[4]
+        kmp = parameters[5]
+        kip = parameters[6]
+        kiq = parameters[7]
+
+        forward = (a * b) / (kia * kmb)
+        reverse = (p * q) / (kmp * kiq)
+
+        numerator = (enz * kcatf * forward) - (enz * kcatr * reverse)
+        denominator = 1 + (a / kia) + (b / kib) + (q / kiq) + (p / kip) + forward + reverse
+        rate = numerator / denominator
+
+        d_a = (enz * kcatf * b / (kia * kmb) - rate * ((1 / kia) + b / (kia * kmb))) / denominator
+        d_b = (enz * kcatf * a / (kia * kmb) - rate * ((1 / kib) + a / (kia * kmb))) / denominator
+        d_p = (-enz * kcatr * q / (kmp * kiq) - rate * ((1 / kip) + q / (kmp * kiq))) / denominator
+        d_q = (-enz * kcatr * p / (kmp * kiq) - rate * ((1 / kiq) + p / (kmp * kiq))) / denominator
+        d_enz = ((kcatf * forward) - (kcatr * reverse)) / denominator
+
+        d_kcatf = (enz * forward) / denominator
+        d_kcatr = (-enz * reverse) / denominator
+        d_kmb = (-enz * kcatf * forward / kmb + rate * forward / kmb) / denominator
+        d_kia = (-enz * kcatf * forward / kia + rate * ((a / (kia * kia)) + forward / kia)) / denominator
+        d_kib = (rate * b / (kib * kib)) / denominator
+        d_kmp = (enz * kcatr * reverse / kmp + rate * reverse / kmp) / denominator
+        d_kip = (rate * p / (kip * kip)) / denominator
+        d_kiq = (enz * kcatr * reverse / kiq + rate * ((q / (kiq * kiq)) + reverse / kiq)) / denominator
+
+        return [d_a, d_b, d_p, d_q, d_enz], [d_kcatf, d_kcatr, d_kmb, d_kia, d_kib, d_kmp, d_kip, d_kiq]
+
 class BiBi_Pingpong_rev(Reaction):
 
     def __init__(self,
@@ -155,3 +265,57 @@ class BiBi_Pingpong_rev(Reaction):
         (a * b) / (kia * kmb)) + ((a * p) / (kia * kip)) + ((kma * b * q) / (kia * kmb * kiq)) + ((p * q) / (kip * kmq))
 
         return num / den
+
+    def calculate_rate_gradient(self, substrates, parameters):
+        # Substrates
+        a = substrates[0]
+        b = substrates[1]
+        p = substrates[2]
+        q = substrates[3]
+        enz = substrates[4]
+
+        # Parameters
+        kcatf = parameters[0]
+        kcatr = parameters[1]
+        kma = parameters[2]
+        kmb = parameters[3]
+        kia = parameters[4]
+        kmp = parameters[5]
+        kmq = parameters[6]
+        kip = parameters[7]
+        kiq = parameters[8]
+
+        forward = (kcatf * enz * a * b) / (kia * kmb)
+        reverse = ((kcatr * enz * p * q) / kip * kmq)
+        num = forward - reverse
+
+        den_a = a / kia
+        den_b = (kma * b) / (kia * kmb)
+        den_p = p / kip
+        den_q = (kmp * q) / (kip * kmq)
+        den_ab = (a * b) / (kia * kmb)
+        den_ap = (a * p) / (kia * kip)
+        den_bq = (kma * b * q) / (kia * kmb * kiq)
+        den_pq = (p * q) / (kip * kmq)
+        den = den_a + den_b + den_p + den_q + den_ab + den_ap + den_bq + den_pq
+
+        rate = num / den
+
+        # d(num/den) = d_num/den - rate * d_den/den
+        d_a = ((kcatf * enz * b) / (kia * kmb) - rate * ((1 / kia) + b / (kia * kmb) + p / (kia * kip))) / den
+        d_b = ((kcatf * enz * a) / (kia * kmb) - rate * (kma / (kia * kmb) + a / (kia * kmb) + (kma * q) / (kia * kmb * kiq))) / den
+        d_p = (-(kcatr * enz * q * kmq) / kip - rate * ((1 / kip) + a / (kia * kip) + q / (kip * kmq))) / den
+        d_q = (-(kcatr * enz * p * kmq) / kip - rate * (kmp / (kip * kmq) + (kma * b) / (kia * kmb * kiq) + p / (kip * kmq))) / den
+        d_enz = ((kcatf * a * b) / (kia * kmb) - (kcatr * p * q * kmq) / kip) / den
+
+        d_kcatf = ((enz * a * b) / (kia * kmb)) / den
+        d_kcatr = (-(enz * p * q * kmq) / kip) / den
+        d_kma = (-rate * (b / (kia * kmb) + (b * q) / (kia * kmb * kiq))) / den
+        d_kmb = (-forward / kmb + rate * (den_b + den_ab + den_bq) / kmb) / den
+        d_kia = (-forward / kia + rate * (den_a + den_b + den_ab + den_ap + den_bq) / kia) / den
+        d_kmp = (-rate * q / (kip * kmq)) / den
+        d_kmq = (-(kcatr * enz * p * q) / kip + rate * (den_q + den_pq) / kmq) / den
+        d_kip = (reverse / kip + rate * (den_p + den_q + den_ap + den_pq) / kip) / den
+        d_kiq = (rate * den_bq / kiq) / den
+
+        return [d_a, d_b, d_p, d_q, d_enz], [d_kcatf, d_kcatr, d_kma, d_kmb, d_kia, d_kmp, d_kmq, d_kip, d_kiq]
@@ -0,0 +1,284 @@
+import numpy as np
+from scipy import integrate, sparse
+from kinetics.solvers import Odeint, SolveIVP, blocks_to_banded, solution_to_y
+
+"""
+Local parameter sensitivities by the forward sensitivity equations.
+
+For y' = f(y, p), the sensitivities s_j = dy/dp_j follow s_j' = J s_j + df/dp_j, with s_j = 0 at the start.
+J is the model jacobian (Model.jacobian) and df/dp the parameter jacobian (Model.parameter_jacobian),
+from the analytical gradients of each rate equation.
+The sensitivities are integrated together with y, so every parameter is done in a single solve.
+"""
+
+def forward_sensitivities(model, parameter_names=None):
+    """
+    Run the model, integrating the sensitivity of every species to each parameter alongside it.
+    Uses model.run_model_species_starting_values and model.run_model_parameters, like Model.run_model()
+
+    The stacked system is y, then dy/dp for each parameter in turn.  Its jacobian is taken to be block diagonal,
+    with the model jacobian in each block (the derivative of J s with respect to y is left out, which only affects convergence
+    of the solver's newton iterations, not the accuracy), so odeint is given it in banded form.
+
+    Args:
+        model (Model): The model, after setup_model()
+        parameter_names (list): The parameters of interest.  Default None uses every parameter in model.run_model_parameters
+
+    Returns:
+        (y, sensitivities) - y is time by species, the same as run_model().
+                             sensitivities is time by species by parameter, where [t][i][j] is dy_i/dp_j
+    """
+    if parameter_names is None:
+        parameter_names = list(model.run_model_parameters.keys())
+
+    model.setup_reactions()
+
+    y0 = np.array(model.run_model_species_starting_values, dtype=float)
+    num_species = len(y0)
+    num_parameters = len(parameter_names)
+
+    def split(state):
+        return state[:num_species], state[num_species:].reshape(num_parameters, num_species)
+
+    def deriv(state, t):
+        y, sensitivities = split(state)
+        jacobian = model.jacobian(y, t)
+        sensitivities_prime = sensitivities @ jacobian.T + model.parameter_jacobian(y, t, parameter_names).T
+        return np.concatenate([model.deriv(y, t), sensitivities_prime.ravel()])
+
+    def blocks(state, t):
+        jacobian = np.asarray(model.jacobian(split(state)[0], t))
+        return np.broadcast_to(jacobian, (num_parameters + 1, num_species, num_species))
+
+    state0 = np.concatenate([y0, np.zeros(num_species * num_parameters)])
+    solver = model.solver
+
+    if isinstance(solver, SolveIVP):
+        options = {}
+        if solver.stiff == True and solver.method != 'LSODA':
+            options['jac'] = lambda t, state: sparse.block_diag(blocks(state, t), format='csc')
+        elif solver.stiff == True:
+            options['jac'] = lambda t, state: sparse.block_diag(blocks(state, t)).toarray()
+        options.update(solver.tolerances())
+        options.update(solver.options)
+
+        solution = integrate.solve_ivp(lambda t, state: deriv(state, t), (model.time[0], model.time[-1]), state0,
+                                       method=solver.method, t_eval=model.time, **options)
+        states = solution_to_y(solution, model.time, len(state0))
+    else:
+        options = {'mxstep': model.mxsteps, 'Dfun': lambda state, t: blocks_to_banded(blocks(state, t)),
+                   'ml': num_species - 1, 'mu': num_species - 1}
+        options.update(solver.tolerances())
+        options.update(solver.options)
+
+        states = integrate.odeint(deriv, state0, model.time, **options)
+
+    model.reset_reaction_indexes()
+
+    y = states[:, :num_species]
+    sensitivities = states[:, num_species:].reshape(len(model.time), num_parameters, num_species).transpose(0, 2, 1)
+
+    return y, np.ascontiguousarray(sensitivities)
+
+"""
+Gradients of a single objective by the adjoint method.
+
+For an objective G made of terms g_k(y(t_k)) at a set of times, the adjoint l follows l' = -J^T l backwards from the end time,
+jumping by dg_k/dy at each t_k.  Then dG/dp is the integral of l^T df/dp over time, and dG/dy0 is l at the start.
+Only l (one value per species) is integrated, so the cost barely changes with the number of parameters,
+unlike forward_sensitivities() which integrates one set of sensitivities per parameter.
+"""
+
+class FinalConcentration(object):
+    """
+    An objective for adjoint_gradient() - the concentration of a species at the end of the run.
+
+    Args:
+        substrate (str): The species of interest
+    """
+
+    def __init__(self, substrate):
+        self.substrate = substrate
+
+    def evaluate(self, model, y_at):
+        """
+        Args:
+            model (Model): The model being run
+            y_at (function): y_at(t) gives the species at time t (or species by time, if t is an array)
+
+        Returns:
+            (value, times, gradients) - the value of the objective, and the derivative of the objective
+                                        with respect to the species (times by species) at each time it depends on.
+        """
+        index = model.run_model_species_names.index(self.substrate)
+        end = model.time[-1]
+
+        gradient = np.zeros((1, len(model.run_model_species_names)))
+        gradient[0, index] = 1
+
+        return y_at(end)[index], np.array([end]), gradient
+
+class SumSquaredError(object):
+    """
+    An objective for adjoint_gradient() - the sum of squared errors between the model and experimental data.
+
+    Args:
+        data_df (Dataframe): Experimental data, with a 'Time' column, in the same format as used by plot_data()
+        substrates (list): The species to compare.  As in plot_data(), every column containing the name of a substrate is used
+        weights (dict): Optional, {'substrate' : weight} to multiply the squared errors of each substrate by.  Default 1
+
+    Missing values in data_df, and timepoints outside of model.time, are left out.
+    """
+
+    def __init__(self, data_df, substrates, weights={}):
+        self.data_df = data_df
+        self.substrates = substrates
+        self.weights = weights
+
+    def evaluate(self, model, y_at):
+        time_data = np.asarray(self.data_df['Time'], dtype=float)
+        in_range = (time_data >= model.time[0]) & (time_data <= model.time[-1])
+        times = np.unique(time_data[in_range])
+        y = np.atleast_2d(y_at(times).T)
+
+        value = 0
+        gradients = np.zeros((len(times), len(model.run_model_species_names)))
+        for substrate in self.substrates:
+            index = model.run_model_species_names.index(substrate)
+            weight = self.weights.get(substrate, 1)
+
+            for column in self.data_df:
+                if substrate in column:
+                    data = np.asarray(self.data_df[column], dtype=float)
+                    use = in_range & ~np.isnan(data)
+                    rows = np.searchsorted(times, time_data[use])
+                    residuals = y[rows, index] - data[use]
+
+                    value += weight * np.sum(residuals ** 2)
+                    np.add.at(gradients[:, index], rows, 2 * weight * residuals)
+
+        return value, times, gradients
+
+class TrajectoryObjective(object):
+    """
+    An objective for adjoint_gradient() made from any function of the model output, for example a Metrics value.
+
+    Args:
+        function (function): function(y) gives the objective, where y is time by species at model.time (as model.y)
+        gradient (function): Optional, gradient(y) gives the derivative of function with respect to each value of y (time by species).
+                             Default None estimates it by central differences, which calls function twice for every value in y
+        step (float): The relative step for the central differences.  Default 1e-6
+    """
+
+    def __init__(self, function, gradient=None, step=1e-6):
+        self.function = function
+        self.gradient = gradient
+        self.step = step
+
+    def finite_difference_gradient(self, y):
+        gradient = np.zeros(y.shape)
+        for index in np.ndindex(y.shape):
+            h = self.step * max(abs(y[index]), 1)
+            original = y[index]
+            y[index] = original + h
+            up = self.function(y)
+            y[index] = original - h
+            down = self.function(y)
+            y[index] = original
+            gradient[index] = (up - down) / (2 * h)
+        return gradient
+
+    def evaluate(self, model, y_at):
+        y = np.ascontiguousarray(y_at(model.time).T)
+        value = self.function(y)
+
+        if self.gradient is None:
+            gradient = self.finite_difference_gradient(y.copy())
+        else:
+            gradient = np.asarray(self.gradient(y), dtype=float)
+
+        return value, np.asarray(model.time, dtype=float), gradient
+
+def adjoint_gradient(model, objective, parameter_names=None):
+    """
+    The gradient of a scalar objective with respect to the parameters and starting species, by the adjoint method.
+    Uses model.run_model_species_starting_values and model.run_model_parameters, like Model.run_model()
+
+    The model is integrated forwards with dense output, then the adjoint backwards between each time the objective uses,
+    with the same method and tolerances as model.solver (scipy's LSODA in place of odeint, which has no dense output).
+    The integral for the parameter gradient is taken by scipy.integrate.quad_vec over each interval.
+
+    Args:
+        model (Model): The model, after setup_model()
+        objective: An object with evaluate(model, y_at), such as FinalConcentration, SumSquaredError or TrajectoryObjective
+        parameter_names (list): The parameters of interest.  Default None uses every parameter in model.run_model_parameters
+
+    Returns:
+        (value, parameter_gradient, species_gradient) - the value of the objective,
+        an array of dG/dp in the order of parameter_names, and an array of dG/dy0 in the order of model.run_model_species_names
+    """
+    if parameter_names is None:
+        parameter_names = list(model.run_model_parameters.keys())
+
+    solver = model.solver
+    if not isinstance(solver, SolveIVP):
+        solver = SolveIVP(method='LSODA', rtol=solver.rtol, atol=solver.atol)
+    tolerances = solver.tolerances()
+
+    model.setup_reactions()
+
+    y0 = np.array(model.run_model_species_starting_values, dtype=float)
+    start, end = model.time[0], model.time[-1]
+
+    options = solver.jacobian_options(model)
+    options.update(tolerances)
+    options.update(solver.options)
+    forward = integrate.solve_ivp(lambda t, y: model.deriv(y, t), (start, end), y0,
+                                  method=solver.method, dense_output=True, **options)
+    if forward.success == False:
+        model.reset_reaction_indexes()
+        raise RuntimeError('Solver failed: ' + str(forward.message))
+
+    value, times, gradients = objective.evaluate(model, forward.sol)
+
+    # The adjoint jumps at each time the objective uses, so is integrated over the intervals between them
+    jumps = {}
+    for t, gradient in zip(times, gradients):
+        t = min(max(float(t), start), end)
+        jumps[t] = jumps.get(t, 0) + gradient
+    boundaries = sorted(set(jumps) | {start, end}, reverse=True)
+
+    def adjoint_deriv(t, adjoint):
+        return -model.jacobian(forward.sol(t), t).T @ adjoint
+
+    adjoint_options = {}
+    if solver.stiff == True:
+        if model.sparse == True and solver.method != 'LSODA':
+            adjoint_options['jac'] = lambda t, adjoint: -model.sparse_jacobian(forward.sol(t), t).T.tocsc()
+        else:
+            adjoint_options['jac'] = lambda t, adjoint: -np.asarray(model.jacobian(forward.sol(t), t)).T
+    adjoint_options.update(tolerances)
+    adjoint_options.update(solver.options)
+
+    adjoint = np.zeros(len(y0)) + jumps.get(end, 0)
+    parameter_gradient = np.zeros(len(parameter_names))
+
+    for high, low in zip(boundaries[:-1], boundaries[1:]):
+        backward = integrate.solve_ivp(adjoint_deriv, (high, low), adjoint,
+                                       method=solver.method, dense_output=True, **adjoint_options)
+        if backward.success == False:
+            model.reset_reaction_indexes()
+            raise RuntimeError('Solver failed: ' + str(backward.message))
+
+        def integrand(t):
+            return model.parameter_jacobian(forward.sol(t), t, parameter_names).T @ backward.sol(t)
+
+        interval_gradient, error = integrate.quad_vec(integrand, low, high,
+                                                      epsabs=tolerances['atol'], epsrel=tolerances['rtol'])
+        parameter_gradient += interval_gradient
+
+        adjoint = backward.y[:, -1] + jumps.get(low, 0)
+
+    model.reset_reaction_indexes()
+
+    return value, parameter_gradient, adjoint
@@ -0,0 +1,282 @@
+import json
+import queue
+import threading
+import urllib.request
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+from kinetics.ua_and_sa.run_all_models import run_ensemble
+
+""" A local server which keeps models loaded, and runs concurrent requests together as one ensemble """
+
+metric_functions = {'final': lambda y: y[-1],
+                    'max': lambda y: np.max(y, axis=0),
+                    'min': lambda y: np.min(y, axis=0),
+                    'mean': lambda y: np.mean(y, axis=0)}
+
+class ModelBatcher(object):
+    """
+    Holds a model, and runs the requests made for it.
+    Requests arriving within batch_window seconds of each other (up to max_batch_size) are run together using run_ensemble.
+    Only the batcher's thread uses the model, so requests never change it for each other.
+    """
+
+    def __init__(self, model, batch_window=0.005, max_batch_size=256):
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        self.requests = queue.Queue()
+        self.batch_sizes = []
+        self.stopped = False
+        self.finished = False
+        self.lock = threading.Lock()
+
+        if model.stoichiometry is None:
+            model.setup_model()
+
+        # The batcher's thread replaces the run_model values while running, so requests are checked against a copy
+        self.species_names = list(model.run_model_species_names)
+        self.species = {name: float(value) for name, value in model.run_model_species.items()}
+        self.parameters = {name: float(value) for name, value in model.parameters.items()}
+        self.time = [float(t) for t in model.time]
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, parameters, species):
+        """
+        Queue a simulation.  Returns a Future which gives the y for this request (time by species).
+        Raises RuntimeError once the batcher has been stopped.
+        """
+        for name in species:
+            if name not in self.species:
+                raise ValueError('Unknown species ' + str(name))
+        for name in parameters:
+            if name not in self.parameters:
+                raise ValueError('Unknown parameter ' + str(name))
+
+        future = Future()
+        with self.lock:
+            if self.stopped == True:
+                raise RuntimeError('The batcher has been stopped')
+            self.requests.put(([dict(parameters), dict(species)], future))
+        return future
+
+    def collect_batch(self):
+        """
+        The next batch of requests.  If the stop sentinel (None) is reached, self.finished is set
+        and the requests collected before it are returned, which may be none.
+        """
+        batch = []
+        request = self.requests.get()
+        while True:
+            if request is None:
+                self.finished = True
+                break
+            batch.append(request)
+            if len(batch) == self.max_batch_size:
+                break
+            try:
+                request = self.requests.get(timeout=self.batch_window)
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while self.finished == False:
+            batch = self.collect_batch()
+            if len(batch) == 0:
+                continue
+
+            samples = [sample for sample, future in batch]
+            self.batch_sizes.append(len(samples))
+            try:
+                output = run_ensemble(self.model, samples, batch_size=len(samples), logging=False)
+                for y, (sample, future) in zip(output, batch):
+                    future.set_result(y)
+            except Exception as error:
+                for sample, future in batch:
+                    future.set_exception(error)
+
+        self.cancel_remaining()
+
+    def cancel_remaining(self):
+        """ Give an error to any requests left in the queue after the stop sentinel, so nothing waits for them """
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request[1].set_exception(RuntimeError('The batcher has been stopped'))
+
+    def stop(self):
+        with self.lock:
+            if self.stopped == False:
+                self.stopped = True
+                self.requests.put(None)
+
+class SimulationServer(object):
+    """
+    A local http server for running models.  Models are set up once when the server is made.
+
+    Requests:
+        GET /models - the names, species and parameters of the loaded models
+        POST /simulate - json of the form {'model': name, 'parameters': {..}, 'species': {..},
+                                           'outputs': [species names], 'metrics': ['final', 'max', 'min', 'mean']}
+                         'parameters' and 'species' override the model defaults for this run.
+                         'outputs' and 'metrics' are optional.  Without metrics the full trajectories are returned.
+
+    Args:
+        models (dict): {'name' : Model}
+        host (str): Default '127.0.0.1', so the server is only available locally
+        port (int): Default 0 picks a free port.  The port used is in self.port
+        batch_window (float): Seconds to wait for more requests before running a batch.  Default 0.005
+        max_batch_size (int): The most requests to run in one batch.  Default 256
+        timeout (float): Seconds to wait for a simulation before giving an error.  Default 60
+    """
+
+    def __init__(self, models, host='127.0.0.1', port=0, batch_window=0.005, max_batch_size=256, timeout=60):
+        self.timeout = timeout
+        self.batchers = {}
+        for name, model in models.items():
+            self.batchers[name] = ModelBatcher(model, batch_window=batch_window, max_batch_size=max_batch_size)
+
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self))
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[0], self.httpd.server_address[1]
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://' + str(self.host) + ':' + str(self.port)
+
+    def start(self):
+        """ Start serving in a background thread """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        """ Serve in this thread until interrupted """
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for batcher in self.batchers.values():
+            batcher.stop()
+
+    def describe_models(self):
+        description = {}
+        for name, batcher in self.batchers.items():
+            description[name] = {'species': batcher.species,
+                                 'parameters': batcher.parameters,
+                                 'time': batcher.time}
+        return description
+
+    def simulate(self, request):
+        """
+        Run a simulation request (a dict in the same form as the json for POST /simulate) and return the response dict.
+        """
+        if request.get('model') not in self.batchers:
+            raise ValueError('Unknown model ' + str(request.get('model')))
+
+        batcher = self.batchers[request['model']]
+        species_names = batcher.species_names
+        outputs = request.get('outputs', species_names)
+        for name in outputs:
+            if name not in species_names:
+                raise ValueError('Unknown species ' + str(name))
+
+        for metric in request.get('metrics', []):
+            if metric not in metric_functions:
+                raise ValueError('Unknown metric ' + str(metric))
+
+        y = batcher.submit(request.get('parameters', {}), request.get('species', {})).result(timeout=self.timeout)
+        indexes = [species_names.index(name) for name in outputs]
+
+        if 'metrics' in request:
+            response = {}
+            for metric in request['metrics']:
+                values = metric_functions[metric](y)
+                response[metric] = {name: float(values[index]) for name, index in zip(outputs, indexes)}
+            return {'metrics': response}
+
+        return {'time': batcher.time,
+                'y': {name: y[:, index].tolist() for name, index in zip(outputs, indexes)}}
+
+def make_handler(server):
+
+    class SimulationHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/models':
+                self.send_json(200, server.describe_models())
+            else:
+                self.send_json(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path != '/simulate':
+                self.send_json(404, {'error': 'Not found'})
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length))
+                if not isinstance(request, dict):
+                    raise ValueError('The request must be a json object')
+                response = server.simulate(request)
+            except (ValueError, KeyError, TypeError) as error:
+                self.send_json(400, {'error': str(error)})
+                return
+            except Exception as error:
+                # eg the model failed to run, or timed out
+                self.send_json(500, {'error': type(error).__name__ + ': ' + str(error)})
+                return
+
+            self.send_json(200, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SimulationHandler
+
+def simulate(url, model, parameters={}, species={}, outputs=None, metrics=None, timeout=60):
+    """
+    Send a request to a running SimulationServer.
+
+    Args:
+        url (str): The server url, eg 'http://127.0.0.1:8000'
+        model (str): Name of the model to run
+        parameters (dict): Parameters to change for this run
+        species (dict): Starting species concentrations to change for this run
+        outputs (list): Species to return.  Default None returns all
+        metrics (list): Any of 'final', 'max', 'min', 'mean'.  Default None returns the trajectories
+
+    Returns:
+        The response as a dictionary
+    """
+    request = {'model': model, 'parameters': parameters, 'species': species}
+    if outputs is not None:
+        request['outputs'] = outputs
+    if metrics is not None:
+        request['metrics'] = metrics
+
+    http_request = urllib.request.Request(url + '/simulate', data=json.dumps(request).encode(),
+                                          headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(http_request, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -0,0 +1,351 @@
+import inspect
+import warnings
+import numpy as np
+from scipy import integrate, sparse
+
+""" Integrators used by Model.run_model().  Select one with Model.set_solver(..) """
+
+class Solver(object):
+    """
+    Base class for the solvers used by Model.run_model()
+
+    Attributes:
+        rtol (float): Relative tolerance.  None uses the default for the solver
+        atol (float): Absolute tolerance.  None uses the default for the solver
+        options (dict): Any other keyword arguments, passed to the scipy function
+    """
+
+    name = ''
+    stiff = True
+
+    def __init__(self, rtol=None, atol=None, **options):
+        self.rtol = rtol
+        self.atol = atol
+        self.options = options
+
+    def tolerances(self):
+        tolerances = {}
+        if self.rtol is not None:
+            tolerances['rtol'] = self.rtol
+        if self.atol is not None:
+            tolerances['atol'] = self.atol
+        return tolerances
+
+    def solve(self, model, y0):
+        """
+        Integrate the model from y0 over model.time.
+        model.setup_reactions() must have been called first.
+
+        Returns:
+            A numpy array of time by species, the same as model.y
+        """
+        return np.zeros((len(model.time), len(y0)))
+
+    def solve_ensemble(self, model, y0):
+        """
+        Integrate a batch of samples as a single stacked system, using model.ensemble_deriv.
+        y0 is a numpy array of samples by species.
+
+        Returns:
+            A numpy array of time by (samples * species)
+        """
+        return np.zeros((len(model.time), y0.size))
+
+    def solve_crossings(self, model, y0, species_index, concentration, mode='>='):
+        """
+        The exact time each sample in a batch first reaches concentration, see crossing_times().
+        odeint has no dense output, so scipy's LSODA is used with the same tolerances.
+        """
+        solver = SolveIVP(method='LSODA', rtol=self.rtol, atol=self.atol)
+        return solver.solve_crossings(model, y0, species_index, concentration, mode=mode)
+
+class Odeint(Solver):
+    """
+    scipy.integrate.odeint (LSODA from ODEPACK).  This is the default solver.
+    Uses model.mxsteps, and model.jacobian if model.analytical_jacobian is True.
+
+    odeint can't use a sparse jacobian, so if model.sparse is True the BDF solver is used instead, with a warning.
+    Only the tolerances are passed on to it - choose Model.set_solver('BDF') to give it other options.
+    If the model has numba kernels (see Model.set_jit) they are passed to odeint directly.
+    """
+
+    name = 'odeint'
+
+    def sparse_solver(self):
+        """ The BDF solver used in place of odeint when model.sparse is True """
+        message = "odeint can not use a sparse jacobian, so the BDF solver is used.  Use Model.set_solver('BDF') to choose it directly"
+        if len(self.options) != 0:
+            message += ', the odeint options ' + str(sorted(self.options)) + ' are ignored'
+        warnings.warn(message)
+
+        return SolveIVP(method='BDF', rtol=self.rtol, atol=self.atol)
+
+    def solve(self, model, y0):
+        if model.jit_kernels is not None:
+            options = {'mxstep': model.mxsteps, 'args': (model.jit_parameters,)}
+            if model.analytical_jacobian == True:
+                options['Dfun'] = model.jit_kernels.jacobian
+            options.update(self.tolerances())
+            options.update(self.options)
+            return integrate.odeint(model.jit_kernels.deriv, y0, model.time, **options)
+
+        if model.sparse == True:
+            return self.sparse_solver().solve(model, y0)
+
+        options = {'mxstep': model.mxsteps}
+        if model.analytical_jacobian == True:
+            options['Dfun'] = model.jacobian
+        options.update(self.tolerances())
+        options.update(self.options)
+
+        return integrate.odeint(model.deriv, y0, model.time, **options)
+
+    def solve_ensemble(self, model, y0):
+        """
+        The jacobian of the stacked system is block diagonal, so it is passed to odeint in banded form.
+        """
+        if model.sparse == True and model.jit_kernels is None:
+            return self.sparse_solver().solve_ensemble(model, y0)
+
+        num_species = y0.shape[1]
+        deriv = model.ensemble_deriv
+
+        options = {'mxstep': model.mxsteps}
+        if model.jit_kernels is not None:
+            deriv = model.jit_kernels.ensemble_deriv
+            options['args'] = (model.jit_parameter_matrix(y0.shape[0]),)
+            if model.analytical_jacobian == True:
+                options['Dfun'] = model.jit_kernels.ensemble_banded_jacobian
+        elif model.analytical_jacobian == True:
+            options['Dfun'] = lambda y, t: blocks_to_banded(model.ensemble_jacobian(y, t))
+        options['ml'] = num_species - 1
+        options['mu'] = num_species - 1
+        options.update(self.tolerances())
+        options.update(self.options)
+
+        return integrate.odeint(deriv, y0.ravel(), model.time, **options)
+
+class SolveIVP(Solver):
+    """
+    scipy.integrate.solve_ivp, using one of its methods.
+    The stiff methods ('BDF', 'Radau', 'LSODA') are given the model jacobian, which is sparse if model.sparse is True.
+    The explicit Runge-Kutta methods ('RK45', 'RK23', 'DOP853') are only suitable for non-stiff models.
+
+    Where no tolerances are given, those of odeint are used so results are comparable between solvers.
+    If the model has numba kernels (see Model.set_jit) they are passed to solve_ivp directly, with a dense jacobian.
+    """
+
+    stiff_methods = ['BDF', 'Radau', 'LSODA']
+    explicit_methods = ['RK45', 'RK23', 'DOP853']
+
+    def __init__(self, method='BDF', rtol=None, atol=None, **options):
+        super().__init__(rtol=rtol, atol=atol, **options)
+        self.method = method
+        self.name = method
+        self.stiff = method in self.stiff_methods
+
+    def tolerances(self):
+        tolerances = {'rtol': 1.49012e-8, 'atol': 1.49012e-8}
+        tolerances.update(super().tolerances())
+        return tolerances
+
+    def jacobian_options(self, model):
+        if self.stiff == False:
+            return {}
+
+        if model.analytical_jacobian == True:
+            if model.sparse == True and self.method != 'LSODA':
+                return {'jac': lambda t, y: model.sparse_jacobian(y, t)}
+            return {'jac': lambda t, y: model.jacobian(y, t)}
+
+        if model.sparse == True and self.method != 'LSODA':
+            return {'jac_sparsity': model.jacobian_sparsity}
+
+        return {}
+
+    def solve(self, model, y0):
+        def deriv(t, y):
+            return model.deriv(y, t)
+
+        if model.jit_kernels is not None:
+            deriv = model.jit_kernels.ivp_deriv
+            options = {'args': (model.jit_parameters,)}
+            if self.stiff == True and model.analytical_jacobian == True:
+                options['jac'] = model.jit_kernels.ivp_jacobian
+        else:
+            options = self.jacobian_options(model)
+        options.update(self.tolerances())
+        options.update(self.options)
+
+        solution = integrate.solve_ivp(deriv, (model.time[0], model.time[-1]), y0,
+                                       method=self.method, t_eval=model.time, **options)
+
+        return solution_to_y(solution, model.time, len(y0))
+
+    def ensemble_options(self, model, y0):
+        """
+        The stiff methods are given the block diagonal jacobian of the stacked system as a sparse matrix.
+        """
+        options = {}
+        if self.stiff == True and self.method != 'LSODA':
+            if model.analytical_jacobian == True:
+                options['jac'] = lambda t, y: sparse.block_diag(model.ensemble_jacobian(y, t), format='csc')
+            else:
+                options['jac_sparsity'] = sparse.block_diag([np.ones((y0.shape[1], y0.shape[1]))] * y0.shape[0])
+        elif self.stiff == True and model.analytical_jacobian == True:
+            options['jac'] = lambda t, y: sparse.block_diag(model.ensemble_jacobian(y, t)).toarray()
+        options.update(self.tolerances())
+        options.update(self.options)
+
+        return options
+
+    def solve_ensemble(self, model, y0):
+        def deriv(t, y):
+            return model.ensemble_deriv(y, t)
+
+        solution = integrate.solve_ivp(deriv, (model.time[0], model.time[-1]), y0.ravel(),
+                                       method=self.method, t_eval=model.time, **self.ensemble_options(model, y0))
+
+        return solution_to_y(solution, model.time, y0.size)
+
+    def solve_crossings(self, model, y0, species_index, concentration, mode='>='):
+        def deriv(t, y):
+            return model.ensemble_deriv(y, t)
+
+        solver_class = getattr(integrate, self.method)
+        ode_solver = solver_class(deriv, model.time[0], y0.ravel(), model.time[-1],
+                                  **ode_solver_options(solver_class, self.ensemble_options(model, y0)))
+
+        return crossing_times(ode_solver, y0.shape, species_index, concentration, mode=mode)
+
+def ode_solver_options(solver_class, options):
+    """
+    The options which can be given to a scipy OdeSolver class directly.
+    Others are only used by solve_ivp itself (eg dense_output, events or args), so are left out with a warning.
+    """
+    parameters = inspect.signature(solver_class.__init__).parameters
+    accepted = [name for name, parameter in parameters.items() if parameter.kind != inspect.Parameter.VAR_KEYWORD]
+
+    ignored = sorted(name for name in options if name not in accepted)
+    if len(ignored) != 0:
+        warnings.warn('The options ' + str(ignored) + ' are not used by ' + solver_class.__name__ + ' when finding crossing times')
+
+    return {name: value for name, value in options.items() if name in accepted}
+
+def crossing_times(ode_solver, shape, species_index, concentration, mode='>='):
+    """
+    Step a scipy OdeSolver for a stacked batch of samples, finding the time each sample first reaches concentration.
+
+    After every step the samples which have just reached it are found together.  The crossing time of each of them is then
+    found by bisection on the interpolant of the step, for all of them at once, so it doesn't depend on the timepoints in model.time.
+    Integration stops once every sample has reached the concentration.
+
+    Args:
+        ode_solver (scipy.integrate.OdeSolver): The solver, set up with the stacked starting values
+        shape (tuple): (samples, species)
+        species_index (int): The index of the species of interest
+        concentration (float): The concentration of interest
+        mode (str): '>=' for the first time the species is at least concentration, or '<=' for at most
+
+    Returns:
+        np.array with the time for each sample.  Samples which never reach concentration have the end time.
+    """
+    num_samples, num_species = shape
+    rows = np.arange(num_samples) * num_species + species_index
+
+    def reached(values):
+        if mode == '<=':
+            return values <= concentration
+        return values >= concentration
+
+    times = np.full(num_samples, float(ode_solver.t_bound))
+    found = reached(ode_solver.y[rows])
+    times[found] = ode_solver.t
+
+    tolerance = 4 * np.finfo(float).eps * max(abs(ode_solver.t), abs(ode_solver.t_bound), 1)
+
+    while ode_solver.status == 'running' and not found.all():
+        message = ode_solver.step()
+        if ode_solver.status == 'failed':
+            warnings.warn('Solver failed: ' + str(message))
+            break
+
+        crossed = np.nonzero(~found & reached(ode_solver.y[rows]))[0]
+        if len(crossed) == 0:
+            continue
+
+        interpolant = ode_solver.dense_output()
+        low = np.full(len(crossed), ode_solver.t_old)
+        high = np.full(len(crossed), ode_solver.t)
+        columns = np.arange(len(crossed))
+
+        while np.any(high - low > tolerance):
+            middle = (low + high) / 2
+            at_middle = reached(interpolant(middle)[rows[crossed], columns])
+            high = np.where(at_middle, middle, high)
+            low = np.where(at_middle, low, middle)
+
+        times[crossed] = high
+        found[crossed] = True
+
+    return times
+
+def blocks_to_banded(blocks):
+    """
+    Convert the jacobian blocks of a stacked system (samples by species by species)
+    into the banded form used by odeint, with ml = mu = species - 1.
+    banded[i - j + mu][j] holds the derivative of equation i with respect to variable j.
+    """
+    num_samples, num_species = blocks.shape[0], blocks.shape[1]
+    mu = num_species - 1
+
+    rows, columns = np.indices((num_species, num_species))
+    band_rows = rows - columns + mu
+    band_columns = np.arange(num_samples)[:, None, None] * num_species + columns
+
+    banded = np.zeros((2 * num_species - 1, num_samples * num_species))
+    banded[band_rows, band_columns] = blocks
+
+    return banded
+
+def solution_to_y(solution, time, num_species):
+    """
+    Convert the output of solve_ivp to the time by species array used for model.y
+    If the solver failed part way, a warning is given and the missing timepoints are nan.
+    """
+    y = np.full((len(time), num_species), np.nan)
+    y[:solution.y.shape[1]] = solution.y.T
+
+    if solution.success == False:
+        warnings.warn('Solver failed: ' + str(solution.message))
+
+    return y
+
+solvers = {'odeint': Odeint,
+           'BDF': SolveIVP,
+           'Radau': SolveIVP,
+           'LSODA': SolveIVP,
+           'RK45': SolveIVP,
+           'RK23': SolveIVP,
+           'DOP853': SolveIVP}
+
+def get_solver(name='odeint', rtol=None, atol=None, **options):
+    """
+    Make a solver by name.
+
+    Args:
+        name (str): One of 'odeint', 'BDF', 'Radau', 'LSODA', 'RK45', 'RK23' or 'DOP853'
+        rtol (float): relative tolerance.  Default None uses the solver's default
+        atol (float): absolute tolerance.  Default None uses the solver's default
+        options: any other keyword arguments for scipy.integrate.odeint or scipy.integrate.solve_ivp
+
+    Returns:
+        A Solver object
+    """
+    if name not in solvers:
+        raise ValueError('Unknown solver ' + str(name) + ', choose from ' + str(list(solvers.keys())))
+
+    if solvers[name] == SolveIVP:
+        return SolveIVP(method=name, rtol=rtol, atol=atol, **options)
+
+    return solvers[name](rtol=rtol, atol=atol, **options)
@@ -0,0 +1,84 @@
+import numpy as np
+
+class EnsembleResult(object):
+    """
+    The output of run_all_models or run_ensemble - one contiguous array of samples by time by species.
+
+    It behaves like the list of y's that run_all_models used to return, so len(result), result[i]
+    and 'for y in result' give the y (time by species) for each sample.
+    Selecting a species, timepoint or sample gives a view of the array, rather than a copy.
+
+    Attributes:
+        y (np.array): samples by time by species
+        time (np.array): the timepoints of the model
+        species_names (list): the species, in the same order as the last axis of y (model.run_model_species_names)
+        samples (SampleSet or list): the samples which were run, [(param_dict1, species_dict1), (param_dict2.... ect]
+        start (int): the index of the first sample, when this is one chunk of a larger run (see kinetics.ua_and_sa.pipeline)
+    """
+
+    def __init__(self, y, time, species_names, samples=None, start=0):
+        # Float arrays (including a float32 memmap from an EnsembleStore) are used as they are, without a copy
+        if isinstance(y, np.ndarray) and y.dtype in (np.float32, np.float64) and y.flags.c_contiguous:
+            self.y = y
+        else:
+            self.y = np.ascontiguousarray(y, dtype=float)
+        self.time = np.asarray(time)
+        self.species_names = list(species_names)
+        self.samples = samples
+        self.start = start
+
+    def __len__(self):
+        return self.y.shape[0]
+
+    def __iter__(self):
+        return iter(self.y)
+
+    def __getitem__(self, index):
+        return self.y[index]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or dtype == self.y.dtype:
+            return self.y.copy() if copy == True else self.y
+        return self.y.astype(dtype)
+
+    def __repr__(self):
+        return 'EnsembleResult(samples=' + str(self.y.shape[0]) + ', timepoints=' + str(self.y.shape[1]) + \
+               ', species=' + str(self.species_names) + ')'
+
+    @property
+    def shape(self):
+        return self.y.shape
+
+    def species_index(self, name):
+        return self.species_names.index(name)
+
+    def time_index(self, timepoint):
+        """ The index of the timepoint closest to timepoint """
+        return int(np.argmin(np.abs(self.time - timepoint)))
+
+    def species(self, name):
+        """ samples by time for a single species """
+        return self.y[:, :, self.species_index(name)]
+
+    def at_time(self, timepoint):
+        """ samples by species at the timepoint closest to timepoint """
+        return self.y[:, self.time_index(timepoint), :]
+
+    def sample(self, i):
+        """ time by species for sample i """
+        return self.y[i]
+
+def as_array(output):
+    """
+    The output of run_all_models as an array of samples by time by species.
+    Accepts an EnsembleResult (no copy is made), or a list of y's.
+    """
+    if isinstance(output, EnsembleResult):
+        return output.y
+    return np.asarray(output, dtype=float)
+
+def species_names_for(model, output):
+    """ The species order of the last axis of output """
+    if isinstance(output, EnsembleResult):
+        return output.species_names
+    return model.run_model_species_names
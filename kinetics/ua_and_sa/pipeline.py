@@ -0,0 +1,269 @@
+import importlib.metadata
+import math
+import os
+import queue
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from scipy.stats import qmc
+from tqdm import tqdm
+
+from kinetics.ua_and_sa.sampling import sample_distributions, parse_samples, samples_to_normal_space
+from kinetics.ua_and_sa.run_all_models import run_all_models, run_ensemble
+from kinetics.ua_and_sa.ensemble_result import EnsembleResult
+from kinetics.ua_and_sa.sensitivity_analysis import get_concentrations_at_timepoint
+
+"""
+A chunked pipeline for uncertainty and sensitivity analysis - samples -> simulations -> reducers.
+Samples are made, run and reduced one chunk at a time, so memory depends on the chunk size rather than the number of samples.
+"""
+
+""" -- Samplers, which yield chunks of samples -- """
+def distribution_chunks(model, num_samples=1000, chunk_size=1000, negative_allowed=[]):
+    """
+    Yields chunks of samples from the species and parameter distributions in the model, see sample_distributions()
+    """
+    for start in range(0, num_samples, chunk_size):
+        yield sample_distributions(model, num_samples=min(chunk_size, num_samples - start),
+                                   negative_allowed=negative_allowed)
+
+# The first SALib version whose saltelli.sample() skips the sobol points the same way as saltelli_chunks()
+salib_skip_version = (1, 4, 5)
+
+def salib_version():
+    """ The installed SALib version as a tuple of ints, eg (1, 4, 7) """
+    parts = []
+    for part in importlib.metadata.version('SALib').split('.'):
+        digits = ''.join(character for character in part if character.isdigit())
+        if digits == '':
+            break
+        parts.append(int(digits))
+    return tuple(parts)
+
+def saltelli_chunks(model, salib_problem, num_samples, chunk_size=1000, second_order=False, log=[]):
+    """
+    Yields chunks of saltelli samples, without making them all at once.
+    Each chunk holds whole groups of (num_vars + 2) samples (or 2 * num_vars + 2 for second order).
+
+    The base samples are an unscrambled sobol sequence in 2 * num_vars dimensions, skipping the first
+    max(16, 2 ** ceil(log2(num_samples))) points.  This is what SALib's saltelli.sample() does by default from SALib 1.4.5,
+    so the samples are the same as make_saltelli_samples().  Older versions of SALib skip a different number of points,
+    so a ValueError is raised rather than giving samples which don't match.
+    """
+    if salib_version() < salib_skip_version:
+        raise ValueError('saltelli_chunks needs SALib ' + '.'.join(str(part) for part in salib_skip_version) +
+                         ' or later to match make_saltelli_samples(), use make_saltelli_samples() instead')
+
+    num_vars = salib_problem['num_vars']
+    group_size = 2 * num_vars + 2 if second_order == True else num_vars + 2
+    rows_per_chunk = max(1, chunk_size // group_size)
+
+    bounds = np.array(salib_problem['bounds'], dtype=float)
+    parameter_names = list(model.parameter_distributions.keys())
+    species_names = list(model.species_distributions.keys())
+
+    # The same sobol sequence and skipped values as SALib
+    skip_values = max(int(2 ** math.ceil(math.log(num_samples) / math.log(2))), 16)
+    sequence = qmc.Sobol(2 * num_vars, scramble=False)
+    sequence.fast_forward(skip_values)
+
+    for start in range(0, num_samples, rows_per_chunk):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            base = sequence.random(min(rows_per_chunk, num_samples - start))
+
+        saltelli_samples = saltelli_rows(base, num_vars, second_order)
+        saltelli_samples = bounds[:, 0] + saltelli_samples * (bounds[:, 1] - bounds[:, 0])
+        saltelli_samples = samples_to_normal_space(saltelli_samples, salib_problem, log)
+
+        yield parse_samples(saltelli_samples, parameter_names, species_names)
+
+def saltelli_rows(base, num_vars, second_order=False):
+    """
+    Saltelli's cross sampling of base rows (rows by 2 * num_vars) into A, AB_1..AB_D, (BA_1..BA_D), B for each row
+    """
+    a, b = base[:, :num_vars], base[:, num_vars:]
+    groups = [a]
+    for k in range(num_vars):
+        ab = a.copy()
+        ab[:, k] = b[:, k]
+        groups.append(ab)
+    if second_order == True:
+        for k in range(num_vars):
+            ba = b.copy()
+            ba[:, k] = a[:, k]
+            groups.append(ba)
+    groups.append(b)
+
+    return np.stack(groups, axis=1).reshape(-1, num_vars)
+
+def sample_list_chunks(samples, chunk_size=1000):
+    """ Yields chunks of an existing list of samples """
+    for start in range(0, len(samples), chunk_size):
+        yield samples[start:start+chunk_size]
+
+def prefetch(chunks, size=1, timeout=0.1):
+    """
+    Makes the next chunks in a background thread, while the current chunk is being run.
+    If the consumer stops early (an error, or the generator is closed) the thread stops too,
+    checking every timeout seconds while it waits for space in the queue.
+    """
+    chunk_queue = queue.Queue(maxsize=size)
+    finished = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fill():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+        except Exception as error:
+            put(error)
+        put(finished)
+
+    threading.Thread(target=fill, daemon=True).start()
+
+    try:
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is finished:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+
+""" -- Reducers, which are updated with the output of each chunk -- """
+class ScalarOutputs(object):
+    """
+    Keeps a single value for each sample, eg for sobol sensitivity analysis.
+    By default this is the concentration of substrate at timepoint (see get_concentrations_at_timepoint).
+
+    Args:
+        model (Model): The model being run
+        substrate (str): The substrate of interest
+        timepoint (float): The timepoint of interest.  Default None is the last timepoint
+        function (function): Optional, function(model, output) giving an array with a value for each sample in output,
+                             used instead of substrate and timepoint
+    """
+
+    def __init__(self, model, substrate=None, timepoint=None, function=None):
+        self.model = model
+        self.substrate = substrate
+        self.timepoint = timepoint
+        self.function = function
+        self.chunks = {}
+
+    def update(self, output):
+        if self.function is not None:
+            values = self.function(self.model, output)
+        else:
+            timepoint = self.timepoint if self.timepoint is not None else output.time[-1]
+            values = get_concentrations_at_timepoint(self.model, output, timepoint, self.substrate)
+        self.chunks[output.start] = np.array(values, dtype=float)
+        return self
+
+    def result(self):
+        """ np.array of the value for every sample, in the order of the samples """
+        if len(self.chunks) == 0:
+            return np.array([])
+        return np.concatenate([self.chunks[start] for start in sorted(self.chunks)])
+
+class ChunkWriter(object):
+    """
+    Saves the output of each chunk to directory as output_<start>.npy (samples by time by species)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = []
+        os.makedirs(directory, exist_ok=True)
+
+    def update(self, output):
+        path = os.path.join(self.directory, 'output_' + str(output.start) + '.npy')
+        np.save(path, output.y)
+        self.files.append(path)
+        return self
+
+""" -- Running the pipeline -- """
+pipeline_model = None
+
+def init_pipeline_worker(model):
+    global pipeline_model
+    pipeline_model = model
+
+def run_chunk_in_worker(samples, ensemble, batch_size):
+    if ensemble == True:
+        return run_ensemble(pipeline_model, samples, batch_size=batch_size, logging=False).y
+    return run_all_models(pipeline_model, samples, logging=False).y
+
+def run_pipeline(model, chunks, reducers, workers=1, ensemble=False, batch_size=1000, logging=True):
+    """
+    Run a model for chunks of samples, passing the output of every chunk to each reducer.
+    Neither the full set of samples nor all the outputs are kept.
+    The next chunk of samples is made while the current chunk runs.
+
+    Args:
+        model (Model): The model to run
+        chunks (iterable): Chunks of samples, eg from distribution_chunks() or saltelli_chunks()
+        reducers (list): Objects with an update(output) method, eg UncertaintyBands, ScalarOutputs or ChunkWriter.
+                         output is an EnsembleResult for the chunk, where output.start is the index of its first sample.
+        workers (int): Number of processes to run chunks in.  Default = 1, which runs them in this process.
+        ensemble (bool): If True each chunk is run with run_ensemble rather than run_all_models.  Default False
+        batch_size (int): batch_size for run_ensemble
+        logging (bool): Show a progress bar.  Default True
+
+    Returns:
+        The reducers
+    """
+    time = np.array(model.time)
+    species_names = list(model.run_model_species_names)
+    progress = tqdm(disable=(logging == False), unit='samples')
+
+    def reduce(start, samples, y):
+        output = EnsembleResult(y, time, species_names, samples=samples, start=start)
+        for reducer in reducers:
+            reducer.update(output)
+        progress.update(len(samples))
+
+    start = 0
+    if workers <= 1:
+        for samples in prefetch(chunks):
+            if ensemble == True:
+                y = run_ensemble(model, samples, batch_size=batch_size, logging=False).y
+            else:
+                y = run_all_models(model, samples, logging=False).y
+            reduce(start, samples, y)
+            start += len(samples)
+
+    else:
+        # At most two chunks per worker are waiting or running at once, so memory stays bounded
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_pipeline_worker, initargs=(model,)) as executor:
+            running = {}
+            for samples in prefetch(chunks):
+                future = executor.submit(run_chunk_in_worker, samples, ensemble, batch_size)
+                running[future] = (start, samples)
+                start += len(samples)
+
+                while len(running) >= 2 * workers:
+                    done, not_done = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        reduce(*running.pop(future), future.result())
+
+            for future in list(running):
+                reduce(*running.pop(future), future.result())
+
+    progress.close()
+
+    return reducers
@@ -145,4 +145,31 @@ def plot_sa_total_sensitivity(df):
 
     plt.bar(x, st, align='center', yerr=st_err, edgecolor='black', color='#000090')
     plt.xticks(x, x_names, rotation=90)
-    plt.ylabel("ST")
\ No newline at end of file
+    plt.ylabel("ST")
+
+def plot_sensitivity_over_time(df, substrate, index='ST', parameters=[], plot=False, units=['', '']):
+    """
+    Plot sobol indices against time for a substrate, one line for each parameter.
+
+    Args:
+        df (Dataframe): Output of analyse_sobal_sensitivity_over_time
+        substrate (str): The substrate to plot
+        index (str): 'ST' (default) or 'S1'
+        parameters (list): Parameters to plot.  If empty plots all (default)
+        plot (bool): If True calls plt.show()
+        units (list): Units for the axis [yaxis_lable, xaxis_lable]
+    """
+    df = df[df['Substrate'] == substrate]
+    if parameters == []:
+        parameters = list(dict.fromkeys(df['Parameter']))
+
+    for name in parameters:
+        parameter_df = df[df['Parameter'] == name]
+        plt.plot(parameter_df['Time'], parameter_df[index], label=name)
+
+    plt.ylabel(units[0] if units[0] != '' else index)
+    plt.xlabel(units[1])
+    plt.legend()
+
+    if plot == True:
+        plt.show()
@@ -1,56 +1,226 @@
 from tqdm import tqdm
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from collections.abc import Mapping
+from kinetics.ua_and_sa.ensemble_result import EnsembleResult, as_array, species_names_for
+from kinetics.ua_and_sa.sample_set import SampleSet
 
-def run_all_models(model, samples, logging=True):
+def run_all_models(model, samples, logging=True, workers=1, chunk_size=None):
     """
     Run all the models for a set of samples.
 
     Args:
         model (kinetics.model_module): A model object
-        samples (list): A list of samples in the form [(param_dict1, species_dict1), (param_dict2.... ect}
+        samples (SampleSet or list): A SampleSet, or a list of samples in the form [(param_dict1, species_dict1), (param_dict2.... ect}
         logging (bool): Show logging and progress bar.  Default = True
+        workers (int): Number of processes to run the models in.  Default = 1, which runs them in this process.
+        chunk_size (int): Number of samples sent to a worker at a time.  Default None splits the samples into 4 chunks per worker.
 
-    Returns (list): [y1, y2, y3, y4, ect..]
+    Returns (EnsembleResult): samples by time by species.  Behaves like a list of y's - [y1, y2, y3, y4, ect..]
 
     """
-    output = []
+    if workers > 1:
+        return run_all_models_in_parallel(model, samples, logging=logging, workers=workers, chunk_size=chunk_size)
+
+    time = np.array(model.time)
+    species_names = list(model.run_model_species_names)
+    output = np.empty((len(samples), len(time), len(species_names)))
 
     if logging==True:
-        for parameters, species in tqdm(samples):
-            model.update_species(species)
-            model.run_model_parameters.update(parameters)
-            y = model.run_model()
-            output.append(y)
+        samples_to_run = tqdm(samples)
+    else:
+        samples_to_run = samples
+
+    for i, (parameters, species) in enumerate(samples_to_run):
+        model.update_species(species)
+        model.run_model_parameters.update(parameters)
+        output[i] = model.run_model()
+
+    # Reset the model back to the default values
+    model.reset_model_to_defaults()
+
+    return EnsembleResult(output, time, species_names, samples=samples)
+
+""" -- Running models in parallel -- """
+worker_model = None
+worker_output = None
+worker_shared_memory = None
+
+def init_worker(model, shared_memory_name, shape):
+    """
+    Called once in each worker process.  Stores the model, and the output array in shared memory.
+    """
+    global worker_model, worker_output, worker_shared_memory
 
-    elif logging==False:
-        for parameters, species in samples:
-            model.update_species(species)
-            model.run_model_parameters.update(parameters)
+    worker_model = model
+    worker_shared_memory = shared_memory.SharedMemory(name=shared_memory_name)
+    worker_output = np.ndarray(shape, dtype=np.float64, buffer=worker_shared_memory.buf)
 
-            y = model.run_model()
-            output.append(y)
+def run_chunk(start, samples):
+    """
+    Run a chunk of samples in a worker process, writing each y straight into the shared output array.
+    """
+    for i, (parameters, species) in enumerate(samples):
+        worker_model.update_species(species)
+        worker_model.run_model_parameters.update(parameters)
+        worker_output[start + i] = worker_model.run_model()
+
+    return len(samples)
+
+def run_all_models_in_parallel(model, samples, logging=True, workers=2, chunk_size=None):
+    """
+    Run all the models for a set of samples using a pool of processes.
+    The model is sent to each worker once, and the samples are split into chunks.
+    Each worker writes its outputs into an array in shared memory.
+
+    Called by run_all_models when workers > 1.
+
+    Returns (EnsembleResult): samples by time by species
+    """
+    time = np.array(model.time)
+    species_names = list(model.run_model_species_names)
+    shape = (len(samples), len(model.time), len(model.run_model_species_names))
+    if chunk_size is None:
+        chunk_size = max(1, int(np.ceil(len(samples) / (workers * 4))))
+
+    shared = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(model, shared.name, shape)) as executor:
+            futures = [executor.submit(run_chunk, start, samples[start:start+chunk_size])
+                       for start in range(0, len(samples), chunk_size)]
+
+            progress = tqdm(total=len(samples), disable=(logging == False))
+            for future in as_completed(futures):
+                progress.update(future.result())
+            progress.close()
+
+        output = np.ndarray(shape, dtype=np.float64, buffer=shared.buf).copy()
+    finally:
+        shared.close()
+        shared.unlink()
+
+    model.reset_model_to_defaults()
+
+    return EnsembleResult(output, time, species_names, samples=samples)
+
+def run_ensemble(model, samples, batch_size=1000, logging=True):
+    """
+    Run all the models for a set of samples, integrating each batch of samples as one stacked system of odes.
+    For small models this avoids the cost of starting the solver for every sample.
+
+    Args:
+        model (kinetics.model_module): A model object
+        samples (SampleSet or list): A SampleSet, or a list of samples in the form [(param_dict1, species_dict1), (param_dict2.... ect}
+        batch_size (int): The number of samples to integrate together.  Default = 1000
+        logging (bool): Show logging and progress bar.  Default = True
+
+    Returns (EnsembleResult): samples by time by species
+
+    """
+    samples = SampleSet.from_samples(samples)
+    default_parameters = dict(model.run_model_parameters)
+    default_species = dict(model.run_model_species)
+    species_names = model.run_model_species_names
+
+    output = np.empty((len(samples), len(model.time), len(species_names)))
+
+    batches = range(0, len(samples), batch_size)
+    if logging == True:
+        batches = tqdm(batches)
+
+    for start in batches:
+        batch = samples[start:start+batch_size]
+        parameters, starting_values = batch_inputs(batch, default_parameters, default_species, species_names)
+
+        model.run_model_parameters = parameters
+        output[start:start+len(batch)] = model.run_ensemble(starting_values)
 
     # Reset the model back to the default values
+    model.run_model_parameters = default_parameters
     model.reset_model_to_defaults()
 
-    # ua_output will be a list like [y1, y2, y3, ect...]
-    return output
+    return EnsembleResult(output, model.time, species_names, samples=samples)
 
-def return_ys_for_a_single_substrate(model, output, substrate_name):
+def run_all_models_time_to_concentration(model, samples, concentration, substrate, mode='>=', batch_size=1000, logging=True):
+    """
+    The exact time each sample takes to reach a concentration, found while the models run (see Model.time_to_concentration).
+    Each batch of samples is run as one stacked system, which stops once every sample has reached the concentration.
+    Unlike get_time_to_concentration, this doesn't depend on the timepoints in model.time, and no trajectories are kept.
 
-    collected_output = []
-    species_names = list(model.species.keys())
+    Args:
+        model (kinetics.model_module): A model object
+        samples (SampleSet or list): A SampleSet, or a list of samples in the form [(param_dict1, species_dict1), (param_dict2.... ect}
+        concentration (float): The concentration of interest
+        substrate (str): The substrate of interest
+        mode (str): Either '>=' or '<=' which looks for more_or_equal or less_or_equal respectively.
+        batch_size (int): The number of samples to integrate together.  Default = 1000
+        logging (bool): Show logging and progress bar.  Default = True
 
-    for i in range(len(model.time)):
-        timepoint = [model.time[i]]
+    Returns:
+        A np.array of the times for each sample.  Samples which never reach the concentration have the end time.
+    """
+    samples = SampleSet.from_samples(samples)
+    default_parameters = dict(model.run_model_parameters)
+    default_species = dict(model.run_model_species)
+    species_names = model.run_model_species_names
+
+    times = np.empty(len(samples))
+
+    batches = range(0, len(samples), batch_size)
+    if logging == True:
+        batches = tqdm(batches)
+
+    for start in batches:
+        batch = samples[start:start+batch_size]
+        parameters, starting_values = batch_inputs(batch, default_parameters, default_species, species_names)
 
-        for y in output:
-            timepoint.append(y[i][species_names.index(substrate_name)])
+        model.run_model_parameters = parameters
+        times[start:start+len(batch)] = model.time_to_concentration(concentration, substrate, mode=mode,
+                                                                    starting_values=starting_values)
 
-        collected_output.append(timepoint)
+    # Reset the model back to the default values
+    model.run_model_parameters = default_parameters
+    model.reset_model_to_defaults()
+
+    return times
+
+def batch_inputs(batch, default_parameters, default_species, species_names):
+    """
+    The parameters (with an array for each sampled parameter) and starting values (samples by species) for a batch of samples.
+    Samples without a value (nan) use the default.
+    """
+    def with_defaults(column, default):
+        return np.where(np.isnan(column), np.nan if default is None else default, column)
+
+    parameters = dict(default_parameters)
+    for name in batch.parameter_names:
+        parameters[name] = with_defaults(batch.column(name), default_parameters.get(name))
+
+    starting_values = np.empty((len(batch), len(species_names)))
+    for i, name in enumerate(species_names):
+        if name in batch.species_names:
+            starting_values[:, i] = with_defaults(batch.column(name), default_species[name])
+        else:
+            starting_values[:, i] = default_species[name]
+
+    return parameters, starting_values
+
+def return_ys_for_a_single_substrate(model, output, substrate_name):
+    """
+    Gives an array of [[t0, r1, r2, r3], [t1, r1, r2, r3]..] for a single substrate from every model run
+
+    Args:
+        model (Model): Model object
+        output (EnsembleResult or list): The output from run_all_models
+        substrate_name (str): The substrate to collect
+    """
+    species_names = species_names_for(model, output)
+    substrate_ys = as_array(output)[:, :, species_names.index(substrate_name)]
 
-    return collected_output
+    return np.column_stack([model.time, substrate_ys.T])
 
 def dataframes_all_runs(model, output, substrates=[]):
     """
@@ -59,79 +229,92 @@ def dataframes_all_runs(model, output, substrates=[]):
 
     [[t0, r1, r2, r3], [t1, r1, r2, r3]]
 
+    Each dataframe is only made when it is first used, so asking for one substrate doesn't make them all.
+
     Args:
         model (Model): Model object
-        output (list): The output from run_all_models. [y1, y2, y3 ect]
+        output (EnsembleResult or list): The output from run_all_models. [y1, y2, y3 ect]
         substrates (list): Substrate names to include. If empty returns all (default).
 
     Returns:
         Dictionary of dataframes containing all model runs - {'Substrate' : dataframe'}
     """
-
-    all_runs_substrate_dataframes = {}
+    y = as_array(output)
+    species_names = species_names_for(model, output)
+    time = np.asarray(model.time)
+    column_titles = ['Time'] + [str(i) for i in range(1, len(y) + 1)]
 
     if substrates == []:
-        substrates = list(model.species.keys())
-
-    for name in substrates:
-        # format: [[t0, r1, r2, r3], [t1, r1, r2, r3]..]
-        collected_runs = return_ys_for_a_single_substrate(model, output, name)
-        all_runs = {"Time": []}
-        column_titles = ['Time']
+        substrates = species_names
 
-        for i in range(1,len(collected_runs[0])):
-            all_runs[str(i)] = []
-            column_titles.append(str(i))
+    def make_dataframe(name):
+        runs = y[:, :, species_names.index(name)]
+        return pd.DataFrame(np.column_stack([time, runs.T]), columns=column_titles)
 
-        for timepoint in collected_runs:
-            all_runs['Time'].append(timepoint[0])
-
-            for i in range(1,len(timepoint)):
-                all_runs[str(i)].append(timepoint[i])
-
-        df = pd.DataFrame(all_runs, columns=column_titles)
-
-        all_runs_substrate_dataframes[name] = df
-
-    return all_runs_substrate_dataframes
+    return LazyDataFrames(substrates, make_dataframe)
 
 def dataframes_quartiles(model, output, substrates=[], quartile=95, logging=False):
     """
     Gives a dictionary of dataframes - {'Substrate' : dataframe'}
     Each dataframe has columns ['Time', 'High', 'Low', 'Mean']
 
+    The percentiles at every timepoint are calculated in one call for each substrate,
+    and each dataframe is only made when it is first used.
+
     Args:
         model (Model): Model object
-        output (list): The output from run_all_models. [y1, y2, y3 ect]
+        output (EnsembleResult or list): The output from run_all_models. [y1, y2, y3 ect]
         substrates (list): Substrate names to include. If empty returns all (default).
         quartile (int): The percentile to take.  Default is 95 which gives with 95% and 5% quartiles.
 
     Returns:
         Dictionary of dataframes containing confidence intervals from the uncertainty analysis.
     """
-
-    dataframes = {}
+    y = as_array(output)
+    species_names = species_names_for(model, output)
+    time = np.asarray(model.time)
 
     if substrates == []:
-        substrates = list(model.species.keys())
-
-    for name in substrates:
+        substrates = species_names
 
+    def make_dataframe(name):
         if logging == True:
             print(name)
 
-        quartiles = {"Time": [], "High": [], "Low": [], "Mean": []}
-        ys_for_single_substrate = return_ys_for_a_single_substrate(model, output, name)
+        runs = y[:, :, species_names.index(name)]
+        high, low = np.percentile(runs, [quartile, 100 - quartile], axis=0)
+
+        return pd.DataFrame({'Time': time, 'High': high, 'Low': low, 'Mean': np.mean(runs, axis=0)})
+
+    return LazyDataFrames(substrates, make_dataframe)
+
+class LazyDataFrames(Mapping):
+    """
+    A dictionary of {'Substrate' : dataframe}, where each dataframe is made by make_dataframe(name) the first time it is used.
+    """
+
+    def __init__(self, names, make_dataframe):
+        self.names = list(names)
+        self.make_dataframe = make_dataframe
+        self.dataframes = {}
+
+    def __getitem__(self, name):
+        if name not in self.dataframes:
+            if name not in self.names:
+                raise KeyError(name)
+            self.dataframes[name] = self.make_dataframe(name)
+        return self.dataframes[name]
 
-        for i in range(len(ys_for_single_substrate)):
-            # output_at_t will be a array.  i=0 is time, after than the substrate values at that time.
-            output_at_t = ys_for_single_substrate[i]
+    def __setitem__(self, name, dataframe):
+        if name not in self.names:
+            self.names.append(name)
+        self.dataframes[name] = dataframe
 
-            quartiles["Time"].append(output_at_t[0])
-            quartiles["High"].append(np.percentile(output_at_t[1:], quartile))
-            quartiles["Low"].append(np.percentile(output_at_t[1:], 100 - quartile))
-            quartiles["Mean"].append(np.mean(output_at_t[1:]))
+    def __iter__(self):
+        return iter(self.names)
 
-        dataframes[name] = quartiles
+    def __len__(self):
+        return len(self.names)
 
-    return dataframes
\ No newline at end of file
+    def __repr__(self):
+        return 'LazyDataFrames(' + str(self.names) + ')'
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+class SampleSet(object):
+    """
+    A set of samples for run_all_models, held in one array of samples by (parameters + species).
+
+    It behaves like the list of [param_dict, species_dict] pairs which the samplers used to return,
+    so len(samples), samples[i] and 'for parameters, species in samples' still work.
+    Slicing (samples[10:20]) gives a SampleSet which is a view of the same array, and is sent to other processes as one buffer.
+
+    Values which are nan are left out of the dictionaries, so the model uses its default for them.
+
+    Attributes:
+        values (np.array): samples by (parameters + species)
+        parameter_names (list): The names of the first columns
+        species_names (list): The names of the remaining columns
+        names (list): parameter_names + species_names
+    """
+
+    def __init__(self, values, parameter_names, species_names):
+        self.parameter_names = list(parameter_names)
+        self.species_names = list(species_names)
+        self.names = self.parameter_names + self.species_names
+        self.column_index = {name: i for i, name in enumerate(self.names)}
+
+        self.values = np.asarray(values, dtype=float)
+        if self.values.size == 0:
+            self.values = self.values.reshape(0, len(self.names))
+
+        if self.values.ndim != 2 or self.values.shape[1] != len(self.names):
+            raise ValueError('SampleSet values of shape ' + str(self.values.shape) + ' do not match ' + str(len(self.names)) + ' names')
+
+    @classmethod
+    def from_samples(cls, samples):
+        """
+        Make a SampleSet from a list of samples [(param_dict1, species_dict1), ..].
+        Names missing from some samples are nan in those rows.
+        """
+        if isinstance(samples, SampleSet):
+            return samples
+
+        parameter_names = list(dict.fromkeys(name for parameters, species in samples for name in parameters))
+        species_names = list(dict.fromkeys(name for parameters, species in samples for name in species))
+
+        values = np.full((len(samples), len(parameter_names) + len(species_names)), np.nan)
+        for i, (parameters, species) in enumerate(samples):
+            for j, name in enumerate(parameter_names):
+                if name in parameters:
+                    values[i, j] = parameters[name]
+            for j, name in enumerate(species_names):
+                if name in species:
+                    values[i, len(parameter_names) + j] = species[name]
+
+        return cls(values, parameter_names, species_names)
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SampleSet(self.values[index], self.parameter_names, self.species_names)
+        return self.row_dictionaries(self.values[index].tolist())
+
+    def __iter__(self):
+        for row in self.values.tolist():
+            yield self.row_dictionaries(row)
+
+    def __repr__(self):
+        return 'SampleSet(samples=' + str(len(self)) + ', parameters=' + str(self.parameter_names) + \
+               ', species=' + str(self.species_names) + ')'
+
+    def row_dictionaries(self, row):
+        """ [param_dict, species_dict] for one row of values """
+        num_parameters = len(self.parameter_names)
+        parameters = {name: value for name, value in zip(self.parameter_names, row[:num_parameters]) if value == value}
+        species = {name: value for name, value in zip(self.species_names, row[num_parameters:]) if value == value}
+        return [parameters, species]
+
+    @property
+    def parameters(self):
+        """ samples by parameters, a view of self.values """
+        return self.values[:, :len(self.parameter_names)]
+
+    @property
+    def species(self):
+        """ samples by species, a view of self.values """
+        return self.values[:, len(self.parameter_names):]
+
+    def column(self, name):
+        """ The values of one parameter or species in every sample, a view of self.values """
+        return self.values[:, self.column_index[name]]
+
+    def to_dataframe(self):
+        """ A dataframe with a column for each parameter and species, sharing memory with self.values """
+        return pd.DataFrame(self.values, columns=self.names, copy=False)
+
+    def to_dict(self):
+        """ {'name' : array of values} for every parameter and species """
+        return {name: self.column(name) for name in self.names}
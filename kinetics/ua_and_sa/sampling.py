@@ -1,5 +1,6 @@
 from SALib.sample import latin, saltelli
 import numpy as np
+from kinetics.ua_and_sa.sample_set import SampleSet
 
 def parse_samples(samples, parameter_names, species_names):
     """
@@ -13,9 +14,8 @@ def parse_samples(samples, parameter_names, species_names):
 
     For example, Samples = [ [value1, value2, value3..],  [value1, value2, value3], ...]
 
-    The ordered lists of parameter and species names are used to unpack these lists back into dictionaries.
-    These dictionaries can be used to update the model.
-    The dictionaries are saved in a new list called parsed samples
+    The ordered lists of parameter and species names are used to name the columns of a SampleSet,
+    which gives the dictionaries used to update the model without making them all up front.
 
     Parsed samples = [ (parameter_dict1, species_dict1), (parameter_dict2, species_dict2) ..]
 
@@ -23,90 +23,86 @@ def parse_samples(samples, parameter_names, species_names):
     :param samples:  a list of lists containing the samples values, in the order they were defined in problem dict.
     :param parameter_names: ordered list of parameter names
     :param species_names: ordered list of species names
-    :return: Parsed samples - [ (parameter_dict1, species_dict1), (parameter_dict2, species_dict2) ..]
+    :return: Parsed samples - a SampleSet, which behaves like [ (parameter_dict1, species_dict1), (parameter_dict2, species_dict2) ..]
     """
 
-    parsed_samples = []
-
-    def unpack_sampled_params_and_species(sample_list, parameter_names_list, species_names_list):
-        """
-        Returns a dictionaries for parameters and species
-
-        :param sample_list: a list of sample values,
-                            parameters first then species, of the same order as the names lists
-        :param parameter_names_list: an ordered list of parameter_names which matches the first part of sample_list
-        :param species_names_list:  an ordered list of species_names which matches the first part of sample_list
-        :return: (parameters_dictionary, species_dictionary)   - dictionary format is {'name' : value, ..}
-        """
-
-        parameters_dict = {}
-        count = 0
-        for i in range(len(parameter_names_list)):
-            name = parameter_names_list[i]
-            parameters_dict[name] = sample_list[i]
-            count += 1
-
-        species_dict = {}
-        for i in range(count, len(species_names_list) + count):
-            name = species_names_list[i - count]
-            species_dict[name] = sample_list[i]
-
-        return parameters_dict, species_dict
-
-    for sampled in samples:
-        parameters, species = unpack_sampled_params_and_species(sampled, parameter_names, species_names)
-        parsed_samples.append([parameters, species])
-
-    # returns a list of tuples containing [(parameter_dict, species_dict), ] for each sample
-    return parsed_samples
+    return SampleSet(samples, parameter_names, species_names)
 
 def check_not_neg(sample, name, negative_allowed):
-    def check_sample(sample_to_check, name_to_check):
-        if (sample_to_check <= 0) and (name_to_check not in negative_allowed):
-            return False
-
-    if type(sample) == np.ndarray:
-        for s in sample:
-            print(s)
-            if check_sample(s, name) == False:
-                return False
-
-    elif type(sample) == np.float64:
-        if check_sample(sample, name) == False:
-            return False
-
-    elif sample == None:
+    """
+    True if sample (a number or an array) is positive, or name is in negative_allowed.  False if sample is None.
+    """
+    if sample is None:
         return False
-
-    else:
-        print('Error no type matches')
-        print(type(sample))
-        return None
-
-    return True
+    if name in negative_allowed:
+        return True
+    return bool(np.all(np.asarray(sample) > 0))
 
 def multi_params(distributions):
     """
     Return a dict of the params which take their distribution from another param as part of a multivariate distribution
+
+    For example, {'enz1_kcat': multivariate_normal(..), 'enz1_km': ('enz1_kcat', 1)} gives {'enz1_kcat': [('enz1_km', 1)]}
+    where 'enz1_km' takes the values at index 1 of the samples from the distribution of 'enz1_kcat'.
     """
     dict_multi_params = {}
-    list_source_names = []
 
     for name, dist in distributions.items():
         if (type(dist) == list or type(dist) == tuple):
             if type(dist[0]) == str:
-                if name not in dict_multi_params:
-                    dict_multi_params[name] = []
-                dict_multi_params[name].append(dist)
-
+                source_name, index = dist
+                if source_name not in dict_multi_params:
+                    dict_multi_params[source_name] = []
+                dict_multi_params[source_name].append((name, index))
 
     return dict_multi_params
 
+def sample_distribution(distribution, num_samples, name, negative_allowed=[], max_redraws=1000):
+    """
+    Draw num_samples from a scipy distribution in one call.
+    Samples with a value which isn't positive are redrawn together, unless name is in negative_allowed.
+
+    Args:
+        distribution: A frozen scipy distribution, eg norm(100, 10) or multivariate_normal(..)
+        num_samples (int): Number of samples
+        name (str): The name of the parameter or species
+        negative_allowed (list): Names which can be negative
+        max_redraws (int): Raise a ValueError if there are still samples which aren't positive after this many redraws
+
+    Returns:
+        np.array of num_samples by the dimensions of the distribution (1 unless multivariate)
+    """
+    def draw(size):
+        return np.asarray(distribution.rvs(size=size), dtype=float).reshape(size, -1)
+
+    if num_samples == 0:
+        # rvs(size=0) doesn't keep the dimensions of a multivariate distribution, so they are taken from one sample
+        return np.empty((0, draw(1).shape[1]))
+
+    samples = draw(num_samples)
+    if name in negative_allowed:
+        return samples
+
+    redraws = 0
+    not_positive = np.nonzero(~np.all(samples > 0, axis=1))[0]
+    while len(not_positive) != 0:
+        if redraws == max_redraws:
+            raise ValueError('Could not sample positive values for ' + str(name) + ', add it to negative_allowed if it can be negative')
+        samples[not_positive] = draw(len(not_positive))
+        not_positive = not_positive[~np.all(samples[not_positive] > 0, axis=1)]
+        redraws += 1
+
+    return samples
+
 
 """ -- Generate Samples --"""
 def sample_distributions(model, num_samples=1000, negative_allowed=[]):
     """
     Makes a set of samples from the species and parameter distributions in the model.
+    All the samples for each distribution are drawn at once (see sample_distribution).
+
+    Parameters which take their values from a multivariate distribution of another parameter,
+    for example {'enz1_km': ('enz1_kcat', 1)}, are sampled along with it.
 
     Args:
         model (kinetics.model_module): A model object
@@ -114,41 +110,29 @@ def sample_distributions(model, num_samples=1000, negative_allowed=[]):
         negative_allowed (list): A list of any distributions that can be negative.
 
     Returns:
-        A list of samples.  Each entry in the list is a tuple containing (parameter_dict, species_dict) for the samples.
+        A SampleSet.  This behaves like a list where each entry is (parameter_dict, species_dict) for the samples.
     """
 
     mv_params = multi_params(model.parameter_distributions)
 
-    samples = []
-    for i in range(num_samples):
-        parameter_dict = {}
-        species_dict = {}
-
-        for name, distribution in model.parameter_distributions.items():
-
-            if type(distribution) != list and type(distribution) != tuple:
-                sample = None
-                while not check_not_neg(sample, name, negative_allowed):
-                    sample = distribution.rvs()
-
-                if type(sample) == np.ndarray:
-                    parameter_dict[name] = sample[0]
-                else:
-                    parameter_dict[name] = sample
+    parameter_columns = {}
+    for name, distribution in model.parameter_distributions.items():
+        if type(distribution) != list and type(distribution) != tuple:
+            values = sample_distribution(distribution, num_samples, name, negative_allowed)
+            parameter_columns[name] = values[:, 0]
 
-                if name in mv_params:
-                    for multi_name, index in mv_params[name]:
-                        parameter_dict[multi_name] = sample[index]
+            for multi_name, index in mv_params.get(name, []):
+                parameter_columns[multi_name] = values[:, index]
 
-        for name, distribution in model.species_distributions.items():
-            sample=None
-            while not check_not_neg(sample, name, negative_allowed):
-                sample = distribution.rvs()
-            species_dict[name] = sample
+    species_columns = {}
+    for name, distribution in model.species_distributions.items():
+        species_columns[name] = sample_distribution(distribution, num_samples, name, negative_allowed)[:, 0]
 
-        samples.append([parameter_dict, species_dict])
+    values = np.empty((num_samples, len(parameter_columns) + len(species_columns)))
+    for i, column in enumerate(list(parameter_columns.values()) + list(species_columns.values())):
+        values[:, i] = column
 
-    return samples # samples will = [ (parameter_dict1, species_dict1), (parameter_dict2, species_dict2) ..]
+    return SampleSet(values, list(parameter_columns), list(species_columns))
 
 def sample_uniforms(model, num_samples=1000, log=[]):
 
@@ -1,7 +1,10 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
 from SALib.analyze import sobol
+from kinetics.ua_and_sa.ensemble_result import as_array, species_names_for
 
 
 
@@ -12,7 +15,7 @@ def get_concentrations_at_timepoint(model, output, timepoint, substrate):
 
     Args:
         model (Model): The model object
-        output (list): Output from run_all_models
+        output (EnsembleResult or list): Output from run_all_models
         timepoint (int): Timepoint of interest
         substrate (str): Substrate name of interest
 
@@ -20,25 +23,20 @@ def get_concentrations_at_timepoint(model, output, timepoint, substrate):
         A np.array containing the concentrations from run_all_models at the specified timepoint
         [c1, c2, c3...]
     """
-    closest_timepoint = min(model.time, key=lambda x: abs(x - timepoint))
-    index = list(model.time).index(closest_timepoint)
+    index = int(np.argmin(np.abs(np.asarray(model.time) - timepoint)))
+    substrate_index = species_names_for(model, output).index(substrate)
 
-    outputs_for_analysis = []
-    for y in output:
-        output_at_t = y[index][model.run_model_species_names.index(substrate)]
-        outputs_for_analysis.append(output_at_t)
-
-    outputs_for_analysis = np.array(outputs_for_analysis)
-
-    return outputs_for_analysis
+    return as_array(output)[:, index, substrate_index]
 
 def get_time_to_concentration(model, output, concentration, substrate, mode='>='):
     """
     Return a np.array containing the time it takes to reach a certain concentration for all the models run.
+    This is the first timepoint in model.time where it is reached, so depends on model.steps.
+    For exact times, use run_all_models_time_to_concentration instead of run_all_models.
 
     Args:
         model (Model): A model object
-        output (list): Output from run_all_models
+        output (EnsembleResult or list): Output from run_all_models
         concentration (int): The concentration of interest
         substrate (str): The substrate of interest
         mode (str): Either '>=' or '<=' which looks for more_or_equal or less_or_equal respectively.
@@ -47,56 +45,258 @@ def get_time_to_concentration(model, output, concentration, substrate, mode='>='
         A np.array containing the times taken to reach concentration for all models from run_all_models
     """
 
-    list_of_times = []
-
-    for y in output:
-        y = np.transpose(y)
-
-        substrate_index = model.run_model_species_names.index(substrate)
-        y_substrate = y[substrate_index]
-
-        if mode == '<=':
-            index_for_conc = np.where(y_substrate <= concentration)
-        elif mode == '>=':
-            index_for_conc = np.where(y_substrate >= concentration)
+    substrate_index = species_names_for(model, output).index(substrate)
+    y_substrate = as_array(output)[:, :, substrate_index]
 
-        if len(index_for_conc[0]) == 0:
-            time = model.time[-1]
-        else:
-            index_for_conc = index_for_conc[0][0]
-            time = model.time[index_for_conc]
+    if mode == '<=':
+        reached = y_substrate <= concentration
+    elif mode == '>=':
+        reached = y_substrate >= concentration
 
-        list_of_times.append(time)
+    # The first timepoint where the concentration is reached, or the end time if it never is
+    first_index = np.argmax(reached, axis=1)
+    time = np.asarray(model.time)
 
-    list_of_times = np.array(list_of_times)
-    return list_of_times
+    return np.where(reached.any(axis=1), time[first_index], time[-1])
 
 def analyse_sobal_sensitivity(salib_problem, output_to_analyse,
-                              second_order=False, num_resample=100, conf_level=0.95):
+                              second_order=False, num_resample=100, conf_level=0.95, seed=None, workers=1):
     """
-    Run the SALib sobal sensitivity analysis
+    Run the sobal sensitivity analysis.
+
+    First order and total indices, and their confidence intervals, are calculated with sobol_indices() and
+    sobol_confidence_intervals(), which use the same estimators as SALib with every bootstrap resample done at once.
+    For second order interactions SALib is used.
 
     Args:
         salib_problem (dict): The salib problem used to make the samples
         output_to_analyse (np.array): A np.array containing the output of interest.
         second_order (bool): Look at second order interactions. Default=Fa;se
-        num_resample(int): salib, number of resamples.  Default=100
-        conf_level (float): salib confidence level, default = 0.95
+        num_resample(int): number of bootstrap resamples.  Default=100
+        conf_level (float): confidence level, default = 0.95
+        seed (int): seed for the resamples, so the confidence intervals can be reproduced.  Default None
+        workers (int): number of processes for the bootstrap.  Default 1
 
     Returns:
         A dataframe containing the output from the sobal sensitivity analysis
     """
 
-    analysis = sobol.analyze(salib_problem,
-                             output_to_analyse,
-                             calc_second_order=second_order,
-                             num_resamples=num_resample,
-                             conf_level=conf_level,
-                             print_to_console=False,
-                             parallel=False,
-                             n_processors=None)
-
     rows = salib_problem['names']
-    dataframe_output = pd.DataFrame(analysis, index=rows)
+
+    if second_order == True:
+        analysis = sobol.analyze(salib_problem,
+                                 np.asarray(output_to_analyse, dtype=float),
+                                 calc_second_order=second_order,
+                                 num_resamples=num_resample,
+                                 conf_level=conf_level,
+                                 print_to_console=False,
+                                 parallel=workers > 1,
+                                 n_processors=workers if workers > 1 else None,
+                                 seed=seed)
+        return pd.DataFrame(analysis, index=rows)
+
+    output_to_analyse = np.asarray(output_to_analyse, dtype=float).reshape(-1, 1)
+    first_order, total_order = sobol_indices(output_to_analyse, salib_problem['num_vars'])
+    first_order_conf, total_order_conf = sobol_confidence_intervals(output_to_analyse, salib_problem['num_vars'],
+                                                                    num_resample=num_resample, conf_level=conf_level,
+                                                                    seed=seed, workers=workers)
+
+    dataframe_output = pd.DataFrame({'S1': first_order[:, 0], 'S1_conf': first_order_conf[:, 0],
+                                     'ST': total_order[:, 0], 'ST_conf': total_order_conf[:, 0]}, index=rows)
+
+    return dataframe_output
+
+def saltelli_outputs(output_values, num_vars, second_order=False):
+    """
+    Split the outputs for saltelli samples into groups of (A, AB_1..AB_D, (BA_1..BA_D), B),
+    centring and scaling each output by its standard deviation as SALib does.  Outputs which don't vary are set to 0.
+
+    Returns:
+        np.array of groups by (num_vars + 2, or 2 * num_vars + 2) by outputs
+    """
+    output_values = np.asarray(output_values, dtype=float)
+    step = 2 * num_vars + 2 if second_order == True else num_vars + 2
+
+    if output_values.shape[0] % step != 0:
+        raise ValueError('The number of outputs does not match the number of saltelli samples, check second_order')
+
+    y = output_values.reshape(output_values.shape[0] // step, step, -1)
+
+    flat = y.reshape(-1, y.shape[2])
+    mean = flat.mean(axis=0)
+    std = flat.std(axis=0)
+    varies = np.ptp(flat, axis=0) > np.finfo(float).eps
+
+    return np.divide(y - mean, std, out=np.zeros_like(y), where=varies)
+
+def sobol_indices(output_values, num_vars, second_order=False):
+    """
+    First order (Saltelli 2010) and total (Jansen) sobol indices for many outputs at once, using the same estimators as SALib.
+    Each output is centred and scaled by its standard deviation first, as SALib does.
+    Outputs which don't vary have indices of 0.
+
+    Args:
+        output_values (np.array): The outputs for the saltelli samples, samples by any number of outputs (eg timepoints by species)
+        num_vars (int): The number of parameters and species in the salib problem
+        second_order (bool): Whether the samples were made with second_order=True.  Default False
+
+    Returns:
+        (S1, ST) - np.arrays of num_vars by the shape of the outputs
+    """
+    outputs_shape = np.shape(output_values)[1:]
+    y = saltelli_outputs(output_values, num_vars, second_order=second_order)
+
+    a, b = y[:, 0], y[:, -1]
+    variance = np.var(np.concatenate([a, b]), axis=0)
+    valid = variance > np.finfo(float).eps
+
+    first_order = np.zeros((num_vars, y.shape[2]))
+    total_order = np.zeros((num_vars, y.shape[2]))
+    for j in range(num_vars):
+        ab = y[:, j + 1]
+        first_order[j] = np.divide(np.mean(b * (ab - a), axis=0), variance, out=np.zeros_like(variance), where=valid)
+        total_order[j] = np.divide(0.5 * np.mean((a - ab) ** 2, axis=0), variance, out=np.zeros_like(variance), where=valid)
+
+    return first_order.reshape((num_vars,) + outputs_shape), total_order.reshape((num_vars,) + outputs_shape)
+
+def resample_counts(num_groups, num_resample, seed=None):
+    """
+    Draw every bootstrap resample at once, as the number of times each group is picked in each resample (groups by resamples).
+    The resamples are the same as SALib's for the same seed.
+    """
+    indexes = np.random.default_rng(seed).integers(num_groups, size=(num_groups, num_resample))
+    flat = (indexes + num_groups * np.arange(num_resample)).ravel(order='F')
+    counts = np.bincount(flat, minlength=num_groups * num_resample).reshape(num_resample, num_groups).T
+    return counts.astype(float)
+
+def bootstrap_block(y, counts, num_vars, z):
+    """
+    The confidence intervals of S1 and ST for a block of outputs.
+    A mean over each resample is counts.T @ values / groups, so every resample is done in one matrix product.
+    """
+    num_groups = y.shape[0]
+    weights = counts.T / num_groups
+    a, b = y[:, 0], y[:, -1]
+
+    # Population variance of A and B together, in each resample
+    mean = (weights @ a + weights @ b) / 2
+    variance = (weights @ (a ** 2) + weights @ (b ** 2)) / 2 - mean ** 2
+    valid = variance > np.finfo(float).eps
+
+    first_order = np.zeros((num_vars, y.shape[2]))
+    total_order = np.zeros((num_vars, y.shape[2]))
+    for j in range(num_vars):
+        ab = y[:, j + 1]
+        resampled_first = np.divide(weights @ (b * (ab - a)), variance, out=np.zeros_like(variance), where=valid)
+        resampled_total = np.divide(weights @ (0.5 * (a - ab) ** 2), variance, out=np.zeros_like(variance), where=valid)
+        first_order[j] = z * resampled_first.std(axis=0, ddof=1)
+        total_order[j] = z * resampled_total.std(axis=0, ddof=1)
+
+    return first_order, total_order
+
+worker_counts = None
+
+def init_bootstrap_worker(counts):
+    """ Called once in each worker process, so the resample counts are only sent to it once """
+    global worker_counts
+    worker_counts = counts
+
+def bootstrap_worker_block(y, num_vars, z):
+    return bootstrap_block(y, worker_counts, num_vars, z)
+
+def sobol_confidence_intervals(output_values, num_vars, second_order=False, num_resample=100, conf_level=0.95,
+                               seed=None, workers=1, block_size=None):
+    """
+    Bootstrap confidence intervals for the first order and total sobol indices of many outputs at once.
+    All the resamples are drawn together, and the estimators for every resample are calculated as matrix products.
+
+    Args:
+        output_values (np.array): The outputs for the saltelli samples, samples by any number of outputs
+        num_vars (int): The number of parameters and species in the salib problem
+        second_order (bool): Whether the samples were made with second_order=True.  Default False
+        num_resample (int): Number of bootstrap resamples.  Default 100
+        conf_level (float): Confidence level.  Default 0.95
+        seed (int): Seed for the resamples, so the intervals can be reproduced.  The same seed gives the same resamples as SALib
+        workers (int): Number of processes to split the outputs between.  Default 1
+        block_size (int): Number of outputs calculated together.  Default None keeps each block to about 1e7 values,
+                          or with more than one worker splits the outputs evenly between them
+
+    Returns:
+        (S1_conf, ST_conf) - np.arrays of num_vars by the shape of the outputs
+    """
+    outputs_shape = np.shape(output_values)[1:]
+    y = saltelli_outputs(output_values, num_vars, second_order=second_order)
+    counts = resample_counts(y.shape[0], num_resample, seed=seed)
+    z = norm.ppf(0.5 + conf_level / 2)
+
+    if block_size is None and workers > 1:
+        block_size = max(1, int(np.ceil(y.shape[2] / workers)))
+    elif block_size is None:
+        block_size = max(1, int(1e7 // max(1, num_resample * y.shape[0])))
+    blocks = [y[:, :, start:start+block_size] for start in range(0, y.shape[2], block_size)]
+
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_bootstrap_worker, initargs=(counts,)) as executor:
+            results = list(executor.map(bootstrap_worker_block, blocks, [num_vars] * len(blocks), [z] * len(blocks)))
+    else:
+        results = [bootstrap_block(block, counts, num_vars, z) for block in blocks]
+
+    first_order = np.concatenate([result[0] for result in results], axis=1)
+    total_order = np.concatenate([result[1] for result in results], axis=1)
+
+    return first_order.reshape((num_vars,) + outputs_shape), total_order.reshape((num_vars,) + outputs_shape)
+
+def analyse_sobal_sensitivity_over_time(model, salib_problem, output, substrates=[], timepoints=None, second_order=False,
+                                        num_resample=0, conf_level=0.95, seed=None, workers=1):
+    """
+    First order and total sobol indices for every substrate at every timepoint, in one pass over the output of run_all_models.
+    This is the same as calling analyse_sobal_sensitivity on get_concentrations_at_timepoint for each substrate and timepoint.
+
+    Args:
+        model (Model): The model object
+        salib_problem (dict): The salib problem used to make the samples
+        output (EnsembleResult or list): Output from run_all_models, for samples from make_saltelli_samples
+        substrates (list): Substrate names to include. If empty uses all (default).
+        timepoints (list): Timepoints to include, the closest timepoint in model.time is used.  Default None uses every timepoint
+        second_order (bool): Whether the samples were made with second_order=True.  Default False
+        num_resample (int): Number of bootstrap resamples for confidence intervals.  Default 0 doesn't calculate them
+        conf_level (float): Confidence level.  Default 0.95
+        seed (int): Seed for the bootstrap resamples
+        workers (int): Number of processes for the bootstrap, see sobol_confidence_intervals()
+
+    Returns:
+        A dataframe with columns ['Substrate', 'Time', 'Parameter', 'S1', 'ST'] and a row for each substrate, timepoint and parameter.
+        If num_resample is more than 0, the columns 'S1_conf' and 'ST_conf' are added.
+        Plot with plot_sensitivity_over_time()
+    """
+    species_names = species_names_for(model, output)
+    if substrates == []:
+        substrates = species_names
+    substrate_indexes = [species_names.index(name) for name in substrates]
+
+    time = np.asarray(model.time)
+    if timepoints is None:
+        time_indexes = np.arange(len(time))
+    else:
+        time_indexes = np.array([int(np.argmin(np.abs(time - timepoint))) for timepoint in timepoints])
+
+    y = as_array(output)[:, time_indexes][:, :, substrate_indexes]
+    first_order, total_order = sobol_indices(y, salib_problem['num_vars'], second_order=second_order)
+
+    # Parameter by timepoint by substrate, flattened in that order
+    names = salib_problem['names']
+    shape = first_order.shape
+    dataframe_output = pd.DataFrame({'Substrate': np.tile(np.asarray(substrates, dtype=object), shape[0] * shape[1]),
+                                     'Time': np.tile(np.repeat(time[time_indexes], shape[2]), shape[0]),
+                                     'Parameter': np.repeat(np.asarray(names, dtype=object), shape[1] * shape[2]),
+                                     'S1': first_order.ravel(),
+                                     'ST': total_order.ravel()})
+
+    if num_resample > 0:
+        first_order_conf, total_order_conf = sobol_confidence_intervals(y, salib_problem['num_vars'], second_order=second_order,
+                                                                        num_resample=num_resample, conf_level=conf_level,
+                                                                        seed=seed, workers=workers)
+        dataframe_output['S1_conf'] = first_order_conf.ravel()
+        dataframe_output['ST_conf'] = total_order_conf.ravel()
 
     return dataframe_output
@@ -0,0 +1,259 @@
+import json
+import os
+import numpy as np
+
+from kinetics.ua_and_sa.ensemble_result import EnsembleResult
+from kinetics.ua_and_sa.pipeline import run_pipeline
+from kinetics.ua_and_sa.sample_set import SampleSet
+
+"""
+An on-disk store for the output of run_all_models, written as each chunk of samples finishes so a run can be resumed.
+"""
+
+class EnsembleStore(object):
+    """
+    Stores samples and trajectories in a directory:
+        manifest.json - the time, species names, input names, dtype and whether the trajectories are compressed
+        inputs.npy - samples by inputs, the value of each parameter and species in each sample (nan if not set)
+        completed.npy - True for each sample which has been run
+        y.npy - samples by time by species.  Or, if compressed, y_<start>.npz for each chunk
+
+    Every .npy file is opened as a memmap, so reading a species or timepoint only reads that part of the file.
+    Make a new store with EnsembleStore.create(), and open an existing one with EnsembleStore(directory).
+
+    It can be used as a reducer for run_pipeline, or filled by run_to_store().
+    """
+
+    def __init__(self, directory, mode='r+'):
+        self.directory = directory
+        self.mode = mode
+
+        with open(self.path('manifest.json')) as file:
+            self.manifest = json.load(file)
+
+        self.time = np.array(self.manifest['time'])
+        self.species_names = self.manifest['species_names']
+        self.input_names = self.manifest['input_names']
+        self.parameter_names = self.manifest['parameter_names']
+        self.num_samples = self.manifest['num_samples']
+        self.compression = self.manifest['compression']
+
+        self.inputs = np.load(self.path('inputs.npy'), mmap_mode=mode)
+        self.completed = np.load(self.path('completed.npy'), mmap_mode=mode)
+        self.y = None
+        if self.compression == False:
+            self.y = np.load(self.path('y.npy'), mmap_mode=mode)
+
+    @classmethod
+    def create(cls, directory, model, num_samples, parameter_names=None, species_names=None,
+               dtype='float64', compression=False):
+        """
+        Make a new, empty store.
+
+        Args:
+            directory (str): Where to keep the store.  Made if it doesn't exist
+            model (Model): The model which will be run, for the time and species names
+            num_samples (int): The number of samples which will be run
+            parameter_names (list): The parameters which are sampled.  Default is those in model.parameter_distributions
+            species_names (list): The species which are sampled.  Default is those in model.species_distributions
+            dtype (str): 'float64' (default) or 'float32' to halve the size of the trajectories
+            compression (bool): If True the trajectories of each chunk are saved in a compressed .npz,
+                                rather than in one memory mapped .npy.  Default False
+
+        Returns:
+            The EnsembleStore
+        """
+        if parameter_names is None:
+            parameter_names = list(model.parameter_distributions.keys())
+        if species_names is None:
+            species_names = list(model.species_distributions.keys())
+
+        os.makedirs(directory, exist_ok=True)
+        shape = (num_samples, len(model.time), len(model.run_model_species_names))
+
+        inputs = np.lib.format.open_memmap(os.path.join(directory, 'inputs.npy'), mode='w+', dtype='float64',
+                                           shape=(num_samples, len(parameter_names) + len(species_names)))
+        inputs[:] = np.nan
+        inputs.flush()
+
+        completed = np.lib.format.open_memmap(os.path.join(directory, 'completed.npy'), mode='w+', dtype=bool,
+                                              shape=(num_samples,))
+        completed.flush()
+
+        if compression == False:
+            y = np.lib.format.open_memmap(os.path.join(directory, 'y.npy'), mode='w+', dtype=dtype, shape=shape)
+            y.flush()
+
+        manifest = {'num_samples': num_samples,
+                    'time': [float(t) for t in model.time],
+                    'species_names': list(model.run_model_species_names),
+                    'parameter_names': list(parameter_names),
+                    'input_names': list(parameter_names) + list(species_names),
+                    'dtype': str(np.dtype(dtype)),
+                    'compression': compression,
+                    'chunks': []}
+        write_json(os.path.join(directory, 'manifest.json'), manifest)
+
+        return cls(directory)
+
+    @classmethod
+    def exists(cls, directory):
+        return os.path.exists(os.path.join(directory, 'manifest.json'))
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def input_rows(self, samples):
+        """ The values of samples (a SampleSet or [(param_dict1, species_dict1), ..]) in the order of input_names, nan where missing """
+        samples = SampleSet.from_samples(samples)
+        rows = np.full((len(samples), len(self.input_names)), np.nan)
+        for j, name in enumerate(self.input_names):
+            if name in samples.column_index:
+                rows[:, j] = samples.column(name)
+        return rows
+
+    def write_inputs(self, start, samples):
+        """ Save the values of samples (a SampleSet or [(param_dict1, species_dict1), ..]), starting from sample index start """
+        rows = self.input_rows(samples)
+        self.inputs[start:start+len(rows)] = rows
+        self.inputs.flush()
+
+    def matches_inputs(self, samples):
+        """ True if samples are the same as the inputs saved in the store """
+        if len(samples) != self.num_samples:
+            return False
+        return np.array_equal(self.input_rows(samples), self.inputs, equal_nan=True)
+
+    def write(self, start, y, samples=None):
+        """
+        Save the trajectories (samples by time by species) of the samples starting from index start, and mark them complete.
+        The data is flushed to disk before the samples are marked as complete.
+        """
+        if samples is not None:
+            self.write_inputs(start, samples)
+
+        if self.compression == True:
+            name = 'y_' + str(start) + '.npz'
+            temporary_path = self.path(name + '.tmp')
+            with open(temporary_path, 'wb') as file:
+                np.savez_compressed(file, y=np.asarray(y, dtype=self.manifest['dtype']))
+            os.replace(temporary_path, self.path(name))
+            chunks = [chunk for chunk in self.manifest['chunks'] if chunk[0] != start]
+            self.manifest['chunks'] = sorted(chunks + [[start, len(y)]])
+            write_json(self.path('manifest.json'), self.manifest)
+        else:
+            self.y[start:start+len(y)] = y
+            self.y.flush()
+
+        self.completed[start:start+len(y)] = True
+        self.completed.flush()
+
+    def update(self, output):
+        """ Save the output of a chunk (an EnsembleResult from run_pipeline) """
+        self.write(output.start, output.y, samples=output.samples)
+        return self
+
+    def missing(self):
+        """ The indexes of the samples which haven't been run """
+        return np.nonzero(~np.asarray(self.completed))[0]
+
+    def is_complete(self):
+        return bool(np.all(self.completed))
+
+    def samples(self, start=0, end=None):
+        """ The stored inputs as a SampleSet, backed by the memmap.  Values which are nan are left out of its dictionaries """
+        num_parameters = len(self.parameter_names)
+        return SampleSet(self.inputs[start:end], self.input_names[:num_parameters], self.input_names[num_parameters:])
+
+    def trajectories(self):
+        """
+        samples by time by species.  A memmap, unless the store is compressed, when the chunks are loaded into memory.
+        Samples which haven't been run are zero (or nan if compressed).
+        """
+        if self.compression == False:
+            return self.y
+
+        y = np.full((self.num_samples, len(self.time), len(self.species_names)), np.nan, dtype=self.manifest['dtype'])
+        for start, length in self.manifest['chunks']:
+            with np.load(self.path('y_' + str(start) + '.npz')) as chunk:
+                y[start:start+length] = chunk['y']
+        return y
+
+    def result(self):
+        """
+        The trajectories as an EnsembleResult, which can be used with dataframes_quartiles, get_concentrations_at_timepoint ect.
+        For an uncompressed store this is backed by the memmap, so only the parts used are read from disk.
+        """
+        return EnsembleResult(self.trajectories(), self.time, self.species_names)
+
+    def species(self, name):
+        """ samples by time for one species, read without loading the rest of the trajectories """
+        index = self.species_names.index(name)
+        if self.compression == False:
+            return self.y[:, :, index]
+
+        y = np.full((self.num_samples, len(self.time)), np.nan)
+        for start, length in self.manifest['chunks']:
+            with np.load(self.path('y_' + str(start) + '.npz')) as chunk:
+                y[start:start+length] = chunk['y'][:, :, index]
+        return y
+
+def write_json(path, content):
+    """ Write json to a temporary file and move it into place, so the file is never left half written """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(content, file)
+    os.replace(temporary_path, path)
+
+def run_to_store(model, samples, directory, chunk_size=100, workers=1, ensemble=False,
+                 dtype='float64', compression=False, logging=True):
+    """
+    Run all the models for a set of samples, saving each chunk to an EnsembleStore in directory as it finishes.
+    If the store already exists, only the chunks which weren't completed are run, so a run which stopped can be resumed.
+
+    Args:
+        model (Model): The model to run
+        samples (SampleSet or list): [(param_dict1, species_dict1), ..].  Can be None to resume using the samples saved in the store
+        directory (str): The directory of the store
+        chunk_size (int): The number of samples saved at a time
+        workers (int): Number of processes to run the chunks in.  Default = 1
+        ensemble (bool): If True chunks are run with run_ensemble.  Default False
+        dtype (str): 'float64' or 'float32', used when making a new store
+        compression (bool): Compress the trajectories, used when making a new store
+        logging (bool): Show a progress bar
+
+    Returns:
+        The EnsembleStore
+    """
+    if EnsembleStore.exists(directory):
+        store = EnsembleStore(directory)
+        if samples is None:
+            samples = store.samples()
+        elif not store.matches_inputs(samples):
+            raise ValueError('The store in ' + str(directory) + ' is for a different set of samples')
+        if store.species_names != list(model.run_model_species_names):
+            raise ValueError('The store in ' + str(directory) + ' is for a different model')
+    else:
+        if samples is None:
+            raise ValueError('No store in ' + str(directory) + ' to resume, so samples are needed')
+        store = EnsembleStore.create(directory, model, len(samples), dtype=dtype, compression=compression)
+        store.write_inputs(0, samples)
+
+    starts = [start for start in range(0, len(samples), chunk_size)
+              if not np.all(store.completed[start:start+chunk_size])]
+
+    # run_pipeline numbers the chunks it is given from 0, so map these back to their place in the store
+    offsets = {}
+    position = 0
+    for start in starts:
+        offsets[position] = start
+        position += len(samples[start:start+chunk_size])
+
+    class StoreWriter(object):
+        def update(self, output):
+            store.write(offsets[output.start], output.y)
+
+    chunks = (samples[start:start+chunk_size] for start in starts)
+    run_pipeline(model, chunks, [StoreWriter()], workers=workers, ensemble=ensemble, logging=logging)
+
+    return store
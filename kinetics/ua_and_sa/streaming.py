@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+from kinetics.ua_and_sa.ensemble_result import EnsembleResult, as_array
+from kinetics.ua_and_sa.run_all_models import LazyDataFrames
+
+""" Streaming summaries of model outputs, so uncertainty bands don't need every trajectory kept in memory """
+
+class QuantileSketch(object):
+    """
+    A mergeable quantile sketch for every cell of an array (eg every timepoint and species), in the style of a merging t-digest.
+
+    Each cell holds a fixed number of centroids (mean, weight).  Centroids are sized using the arcsin scale function,
+    so they are small near the tails and the high and low percentiles are accurate.
+    Every operation works on all the cells at once.
+    A running count, mean and variance (Chan et al.), and the exact min and max, are kept alongside.
+
+    nan values (eg from a failed run) are ignored.
+
+    Args:
+        shape (tuple): The shape of one observation, eg (timepoints, species)
+        compression (int): The larger this is, the more centroids and the more accurate the quantiles.  Default 200
+    """
+
+    def __init__(self, shape, compression=200):
+        self.shape = tuple(shape)
+        self.compression = compression
+        self.num_centroids = int(compression // 2) + 1
+
+        num_cells = int(np.prod(self.shape))
+        self.centroid_means = np.zeros((num_cells, self.num_centroids))
+        self.centroid_weights = np.zeros((num_cells, self.num_centroids))
+
+        self.count = np.zeros(num_cells)
+        self.running_mean = np.zeros(num_cells)
+        self.m2 = np.zeros(num_cells)
+        self.minimum = np.full(num_cells, np.inf)
+        self.maximum = np.full(num_cells, -np.inf)
+
+    def update(self, values):
+        """
+        Add a batch of observations.
+
+        Args:
+            values (np.array): observations by self.shape, eg samples by time by species
+        """
+        values = np.asarray(values, dtype=float).reshape(-1, self.centroid_means.shape[0]).T
+        valid = ~np.isnan(values)
+        weights = valid.astype(float)
+        values = np.where(valid, values, 0)
+
+        count = weights.sum(axis=1)
+        mean = values.sum(axis=1) / np.maximum(count, 1)
+        m2 = (((values - mean[:, None]) * weights) ** 2).sum(axis=1)
+        self.combine_moments(count, mean, m2)
+
+        self.minimum = np.minimum(self.minimum, np.where(valid, values, np.inf).min(axis=1))
+        self.maximum = np.maximum(self.maximum, np.where(valid, values, -np.inf).max(axis=1))
+
+        self.compress(np.concatenate([self.centroid_means, values], axis=1),
+                      np.concatenate([self.centroid_weights, weights], axis=1))
+        return self
+
+    def merge(self, other):
+        """ Merge another sketch (eg from a different chunk or worker) into this one """
+        if other.shape != self.shape:
+            raise ValueError('Can not merge sketches of shape ' + str(self.shape) + ' and ' + str(other.shape))
+
+        self.combine_moments(other.count, other.running_mean, other.m2)
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+
+        self.compress(np.concatenate([self.centroid_means, other.centroid_means], axis=1),
+                      np.concatenate([self.centroid_weights, other.centroid_weights], axis=1))
+        return self
+
+    def combine_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.running_mean
+        fraction = np.divide(count, total, out=np.zeros_like(total), where=total > 0)
+
+        self.running_mean = self.running_mean + delta * fraction
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * fraction
+        self.count = total
+
+    def compress(self, means, weights):
+        """ Merge centroids into self.num_centroids per cell, sized by the arcsin scale function """
+        num_cells = means.shape[0]
+
+        order = np.argsort(np.where(weights > 0, means, np.inf), axis=1, kind='stable')
+        means = np.take_along_axis(means, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+
+        total = np.maximum(weights.sum(axis=1, keepdims=True), 1e-300)
+        q = (np.cumsum(weights, axis=1) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)) + self.compression / 4
+        centroid = np.clip(np.floor(k).astype(np.int64), 0, self.num_centroids - 1)
+
+        flat = (np.arange(num_cells)[:, None] * self.num_centroids + centroid).ravel()
+        size = num_cells * self.num_centroids
+        new_weights = np.bincount(flat, weights=weights.ravel(), minlength=size).reshape(num_cells, -1)
+        sums = np.bincount(flat, weights=(means * weights).ravel(), minlength=size).reshape(num_cells, -1)
+
+        self.centroid_weights = new_weights
+        self.centroid_means = np.divide(sums, new_weights, out=np.zeros_like(sums), where=new_weights > 0)
+
+    def quantile(self, q, cells=None):
+        """
+        Estimate the q quantile (0 to 1) of every cell, interpolating between the centres of the centroids
+        and the exact min and max.
+
+        Args:
+            q (float): The quantile, from 0 to 1
+            cells (np.array): Optional, the flat indexes of the cells to calculate.  Default None does them all
+
+        Returns:
+            np.array of self.shape (or of cells).  nan for cells with no observations.
+        """
+        if cells is None:
+            return self.quantile(q, cells=np.arange(self.count.size)).reshape(self.shape)
+
+        weights = self.centroid_weights[cells]
+        minimum, maximum = self.minimum[cells][:, None], self.maximum[cells][:, None]
+        total = weights.sum(axis=1, keepdims=True)
+
+        # Move empty centroids to the end, where they take the position and value of the max
+        order = np.argsort(weights == 0, axis=1, kind='stable')
+        weights = np.take_along_axis(weights, order, axis=1)
+        means = np.take_along_axis(self.centroid_means[cells], order, axis=1)
+        empty = weights == 0
+
+        positions = np.where(empty, total, np.cumsum(weights, axis=1) - weights / 2)
+        means = np.where(empty, maximum, means)
+
+        positions = np.concatenate([np.zeros_like(total), positions, total], axis=1)
+        means = np.concatenate([minimum, means, maximum], axis=1)
+
+        target = q * total
+        upper = np.clip((positions < target).sum(axis=1, keepdims=True), 1, positions.shape[1] - 1)
+        lower = upper - 1
+
+        x0, x1 = np.take_along_axis(positions, lower, axis=1), np.take_along_axis(positions, upper, axis=1)
+        y0, y1 = np.take_along_axis(means, lower, axis=1), np.take_along_axis(means, upper, axis=1)
+        fraction = np.divide(target - x0, x1 - x0, out=np.zeros_like(target), where=x1 > x0)
+
+        quantile = (y0 + np.clip(fraction, 0, 1) * (y1 - y0))[:, 0]
+        quantile[self.count[cells] == 0] = np.nan
+
+        return quantile
+
+    def percentile(self, percentile, cells=None):
+        return self.quantile(percentile / 100, cells=cells)
+
+    def mean(self):
+        mean = np.where(self.count > 0, self.running_mean, np.nan)
+        return mean.reshape(self.shape)
+
+    def variance(self):
+        """ The sample variance of every cell """
+        variance = np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), np.nan)
+        return variance.reshape(self.shape)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+class UncertaintyBands(object):
+    """
+    A reducer for model outputs which keeps a QuantileSketch of every timepoint and species,
+    so uncertainty bands can be made for any number of samples in a fixed amount of memory.
+
+    Add the output of run_all_models (or run_ensemble) in chunks with update(), and combine reducers from different
+    chunks or workers with merge().  dataframes() gives the same {'Substrate' : dataframe} as dataframes_quartiles.
+
+    Args:
+        model (Model): The model being run.  Used for the time and species names
+        compression (int): Accuracy of the sketch, see QuantileSketch.  Default 200
+    """
+
+    def __init__(self, model, compression=200):
+        self.time = np.array(model.time)
+        self.species_names = list(model.run_model_species_names)
+        self.sketch = QuantileSketch((len(self.time), len(self.species_names)), compression=compression)
+
+    @property
+    def count(self):
+        return int(self.sketch.count.max()) if self.sketch.count.size != 0 else 0
+
+    def update(self, output):
+        """ Add the output of run_all_models or run_ensemble (samples by time by species) """
+        if isinstance(output, EnsembleResult) and output.species_names != self.species_names:
+            raise ValueError('Output species do not match the model')
+        self.sketch.update(as_array(output))
+        return self
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        return self
+
+    def dataframes(self, substrates=[], quartile=95):
+        """
+        Gives a dictionary of dataframes - {'Substrate' : dataframe'}
+        Each dataframe has columns ['Time', 'High', 'Low', 'Mean', 'Std']
+
+        Args:
+            substrates (list): Substrate names to include. If empty returns all (default).
+            quartile (int): The percentile to take.  Default is 95 which gives with 95% and 5% quartiles.
+        """
+        if substrates == []:
+            substrates = self.species_names
+
+        num_species = len(self.species_names)
+
+        def make_dataframe(name):
+            index = self.species_names.index(name)
+            cells = np.arange(len(self.time)) * num_species + index
+            return pd.DataFrame({'Time': self.time,
+                                 'High': self.sketch.percentile(quartile, cells=cells),
+                                 'Low': self.sketch.percentile(100 - quartile, cells=cells),
+                                 'Mean': self.sketch.mean()[:, index],
+                                 'Std': self.sketch.std()[:, index]})
+
+        return LazyDataFrames(substrates, make_dataframe)
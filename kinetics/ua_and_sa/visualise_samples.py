@@ -2,34 +2,21 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 import seaborn as sns
+from kinetics.ua_and_sa.sample_set import SampleSet
 
 
 def dict_of_samples(samples):
     """
     Gives a dictionary containing {'Sample_name' : [all samples]}
     Args:
-        samples (list): The output from make_samples. Each entry in the list is a tuple containing (parameter_dict, species_dict)
+        samples (SampleSet or list): The output from make_samples. Each entry in the list is a tuple containing (parameter_dict, species_dict)
 
     Returns:
-        A dictionary containing {'Sample_name' : [all samples]}
+        A dictionary containing {'Sample_name' : np.array of all samples}, where each array is a column of the SampleSet
 
     """
 
-    samples_dict = {}
-
-    for s in samples:
-        # s = (param_dict, species_dict)
-        for name in {**s[0], **s[1]}:
-
-            try:
-                values = samples_dict[name]
-            except KeyError:
-                values = samples_dict[name] = []
-
-            sample_to_add = {**s[0], **s[1]}[name]
-            values.append(sample_to_add)
-
-    return samples_dict
+    return SampleSet.from_samples(samples).to_dict()
 
 
 def plot_parameters(samples_dict, parameter_names, units={}, plot=True,
@@ -32,6 +32,58 @@ def test_simple_model():
     assert_allclose(expected, actual, atol=1, rtol=1)
 
 
+def test_stoichiometry_matches_reactions():
+    model = kinetics.Model()
+
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameters = {'enz1_kcat': 100, 'enz1_km': 1000}
+    enzyme_1.add_modifier(kinetics.SubstrateInhibition(ki='enz1_ki', a='A'))
+    enzyme_1.parameters['enz1_ki'] = 5000
+
+    enzyme_2 = kinetics.Bi(kcat='enz2_kcat', kma='enz2_kma', kmb='enz2_kmb', enz='enz_2', a='B', b='C',
+                           substrates=['B', 'C'], products=['D', 'D'])
+    enzyme_2.parameters = {'enz2_kcat': 10, 'enz2_kma': 500, 'enz2_kmb': 200}
+
+    flow = kinetics.Flow(flow_rate='flow_rate', column_volume='column_volume',
+                         input_substrates=['A_in'], substrates=['A'])
+    flow.parameters = {'flow_rate': 1, 'column_volume': 10}
+
+    model.append(enzyme_1)
+    model.append(enzyme_2)
+    model.append(flow)
+    model.species = {"A": 1000, "A_in": 2000, "C": 500, "enz_1": 5, "enz_2": 2}
+    model.setup_model()
+
+    assert model.stoichiometry.shape == (len(model.run_model_species_names), 2)
+    assert model.other_reactions == [flow]
 
+    model.setup_reactions()
+    y = np.array(model.run_model_species_starting_values, dtype=float) + 10
+    expected = np.zeros(len(y))
+    for reaction in model:
+        expected += reaction.reaction(y, model.run_model_species_names, model.run_model_parameters)
 
+    assert_allclose(model.deriv(y, 0), expected)
 
+
+def test_deriv_sets_up_reactions():
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameters = {'enz1_kcat': 100, 'enz1_km': 1000}
+
+    model = kinetics.Model()
+    model.append(enzyme_1)
+    model.species = {"A": 1000, "enz_1": 5}
+    model.setup_model()
+
+    y = np.array(model.run_model_species_starting_values, dtype=float)
+    rate = 100 * 5 * 1000 / (1000 + 1000)
+    expected = np.zeros(len(y))
+    expected[model.run_model_species_names.index('A')] = -rate
+    expected[model.run_model_species_names.index('B')] = rate
+    assert_allclose(model.deriv(y, 0), expected)
+
+    model.codegen = False
+    model.run_model()
+    assert_allclose(model.deriv(y, 0), expected)
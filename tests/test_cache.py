@@ -0,0 +1,70 @@
+import kinetics
+import numpy as np
+from numpy.testing import assert_allclose
+from kinetics.cache import run_fingerprint
+from tests.test_ensemble import make_model
+
+
+def test_cache_hits_and_misses():
+    model = make_model()
+    cache = model.set_cache()
+
+    key = run_fingerprint(model)
+    y = model.run_model().copy()
+    assert run_fingerprint(model) == key
+
+    y_again = model.run_model()
+    assert_allclose(y_again, y, rtol=0)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    model.run_model_parameters['enz1_kcat'] = 200
+    y_changed = model.run_model()
+    assert not np.allclose(y_changed, y)
+    assert cache.misses == 2
+
+    model.set_time(0, 60, 50)
+    model.run_model()
+    assert cache.misses == 3
+
+
+def test_cache_evicts_and_uses_disk(tmp_path):
+    model = make_model()
+    entry_size = len(model.time) * len(model.run_model_species_names) * 8
+    cache = model.set_cache(max_bytes=2 * entry_size, directory=str(tmp_path))
+
+    outputs = []
+    for kcat in [50, 100, 150]:
+        model.run_model_parameters['enz1_kcat'] = kcat
+        outputs.append(model.run_model().copy())
+    assert len(cache) == 2 and cache.evictions == 1
+
+    # A new cache on the same directory, as another process would have
+    model.set_cache(directory=str(tmp_path))
+    model.run_model_parameters['enz1_kcat'] = 50
+    assert_allclose(model.run_model(), outputs[0], rtol=0)
+    assert model.cache.disk_hits == 1 and model.cache.misses == 0
+
+    # The fingerprint doesn't depend on the process, so a copy of the model has the same key
+    assert run_fingerprint(make_model()) == run_fingerprint(make_model())
+
+
+def test_cache_key_includes_solver_method():
+    model = make_model()
+    cache = model.set_cache()
+
+    model.set_solver('RK23')
+    model.run_model()
+    model.set_solver('Radau')
+    model.run_model()
+    assert cache.hits == 0 and cache.misses == 2
+
+
+def test_clear_only_removes_cache_files(tmp_path):
+    np.save(str(tmp_path / 'data.npy'), np.ones(3))
+    model = make_model()
+    cache = model.set_cache(directory=str(tmp_path))
+    model.run_model()
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    cache.clear(disk=True)
+    assert [path.name for path in tmp_path.glob('*.npy')] == ['data.npy']
@@ -0,0 +1,113 @@
+import kinetics
+import numpy as np
+from numpy.testing import assert_allclose
+from kinetics.reaction_classes.reaction_base_class import Reaction
+from tests.test_jacobian import all_reactions
+
+
+class Hill(Reaction):
+
+    def __init__(self, k=None, a=None, n=1, substrates=[], products=[]):
+        super().__init__()
+        self.reaction_substrate_names = [a]
+        self.parameter_names = [k]
+        self.n = n
+        self.substrates = substrates
+        self.products = products
+
+    def calculate_rate(self, substrates, parameters):
+        a = substrates[0]
+        k = parameters[0]
+        return k * a ** self.n
+
+
+def make_model(reactions, modifiers={}):
+    model = kinetics.Model()
+    for i, reaction in enumerate(reactions):
+        if isinstance(reaction, kinetics.Generic):
+            model.append(reaction)
+            continue
+        reaction.reaction_substrate_names = [name + str(i) for name in reaction.reaction_substrate_names]
+        reaction.parameter_names = [name + '_' + str(i) for name in reaction.parameter_names]
+        reaction.substrates = reaction.reaction_substrate_names[:1]
+        reaction.products = ['product' + str(i)]
+        if i in modifiers:
+            reaction.add_modifier(modifiers[i](i))
+        reaction.parameters = {name: 1 + j for j, name in enumerate(reaction.parameter_names)}
+        model.append(reaction)
+    model.setup_model()
+    return model
+
+
+def make_hill_model(n):
+    hill = Hill(k='k', a='a', n=n, substrates=['a'], products=['b'])
+    hill.parameters = {'k': 0.1}
+    model = kinetics.Model(logging=False)
+    model.append(hill)
+    model.species = {'a': 10, 'b': 0}
+    model.setup_model()
+    return model
+
+
+def test_compiled_deriv_matches_reactions():
+    reactions = all_reactions()
+    generic = kinetics.Generic(params=['gk'], species=['ga', 'gb'], rate_equation='gk*ga*gb',
+                               substrates=['ga'], products=['gb'])
+    generic.parameters = {'gk': 0.1}
+    reactions.append(generic)
+    modifiers = {0: lambda i: kinetics.SubstrateInhibition(ki='ki', a='a0'),
+                 1: lambda i: kinetics.CompetitiveInhibition(km='p1_1', ki='ki', i='i'),
+                 2: lambda i: kinetics.MixedInhibition(kcat='p0_2', km='p1_2', ki='ki', alpha='alpha', i='i'),
+                 3: lambda i: kinetics.MixedInhibition2(kcat='p0_3', km='p1_3', kic='ki', kiu='alpha', i='i'),
+                 4: lambda i: kinetics.FirstOrder_Modifier(kcat='p0_4', k='ki', s='i')}
+
+    model = make_model(reactions, modifiers)
+    model.setup_reactions()
+    assert 'def model_deriv' in model.compiled_source
+    assert '.rate(y)' not in model.compiled_source
+
+    rng = np.random.default_rng(3)
+    y = rng.uniform(1, 100, len(model.run_model_species_names))
+    compiled = model.deriv(y, 0)
+
+    model.compiled_deriv = None
+    assert_allclose(compiled, model.deriv(y, 0), rtol=1e-12)
+
+
+def test_compiled_deriv_is_cached():
+    model_1 = make_model(all_reactions()[:3])
+    model_2 = make_model(all_reactions()[:3])
+
+    model_1.setup_reactions()
+    model_2.setup_reactions()
+
+    assert model_1.compiled_deriv is model_2.compiled_deriv
+
+
+def test_compiled_deriv_depends_on_inlined_attributes():
+    y = np.array([10.0, 0.0])
+    for n in [1, 2]:
+        model = make_hill_model(n)
+        model.setup_reactions()
+        assert '** ' + str(n) in model.compiled_source
+        assert_allclose(model.deriv(y, 0), [-0.1 * 10 ** n, 0.1 * 10 ** n])
+
+
+def test_compiled_deriv_gives_nan_for_zero_denominator():
+    enzyme = kinetics.Bi_ping_pong(kcat='kcat', kma='kma', kmb='kmb', a='a', b='b', enz='enz',
+                                   substrates=['a', 'b'], products=['c'])
+    enzyme.parameters = {'kcat': 10, 'kma': 100, 'kmb': 50}
+    model = kinetics.Model(logging=False)
+    model.append(enzyme)
+    model.species = {'a': 0, 'b': 0, 'enz': 1}
+    model.setup_model()
+    model.setup_reactions()
+    assert model.compiled_deriv is not None
+
+    y = np.array(model.run_model_species_starting_values, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        compiled = model.deriv(y, 0)
+        expected = enzyme.reaction(y, model.run_model_species_names, model.run_model_parameters)
+
+    assert np.isnan(compiled).any()
+    assert_allclose(compiled, expected)
@@ -0,0 +1,106 @@
+import kinetics
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from scipy.stats import norm, uniform
+
+
+def make_model():
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameter_distributions = {'enz1_kcat': norm(100, 12),
+                                        'enz1_km': uniform(2000, 6000)}
+    enzyme_1.add_modifier(kinetics.CompetitiveInhibition(km='enz1_km', ki='enz1_ki', i='C'))
+    enzyme_1.parameters = {'enz1_ki': 1000}
+
+    enzyme_2 = kinetics.Bi(kcat='enz2_kcat', kma='enz2_kma', kmb='enz2_kmb', enz='enz_2', a='B', b='O2',
+                           substrates=['B', 'O2'], products=['C'])
+    enzyme_2.parameter_distributions = {'enz2_kcat': norm(30, 5)}
+    enzyme_2.parameters = {'enz2_kma': 100, 'enz2_kmb': 50}
+
+    diffusion = kinetics.OxygenDiffusion(kl='kl', area='area', o2sat='o2sat', o2aq='O2', products=['O2'])
+    diffusion.parameters = {'kl': 0.1, 'area': 1, 'o2sat': 250}
+
+    model = kinetics.Model(logging=False)
+    model.append(enzyme_1)
+    model.append(enzyme_2)
+    model.append(diffusion)
+    model.set_time(0, 120, 50)
+    model.species = {"A": 10000, "O2": 250}
+    model.species_distributions = {"enz_1": norm(4, 4 * 0.05),
+                                   "enz_2": norm(10, 10 * 0.05)}
+    model.setup_model()
+
+    return model
+
+
+def test_run_ensemble_matches_run_all_models():
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=12)
+
+    expected = np.array(kinetics.run_all_models(model, samples, logging=False))
+    actual = kinetics.run_ensemble(model, samples, batch_size=5, logging=False)
+
+    assert actual.shape == (12, 50, len(model.run_model_species_names))
+    assert_allclose(actual, expected, rtol=1e-4, atol=1e-2)
+
+    model.set_solver('BDF')
+    actual = kinetics.run_ensemble(model, samples, batch_size=5, logging=False)
+    assert_allclose(actual, expected, rtol=1e-4, atol=1e-2)
+
+
+def test_run_all_models_with_workers():
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=6)
+
+    expected = kinetics.run_all_models(model, samples, logging=False)
+    actual = kinetics.run_all_models(model, samples, logging=False, workers=2, chunk_size=2)
+
+    assert len(actual) == len(expected)
+    assert_allclose(np.array(actual), np.array(expected))
+
+
+def test_ensemble_result():
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=5)
+    output = kinetics.run_all_models(model, samples, logging=False)
+
+    assert isinstance(output, kinetics.EnsembleResult)
+    assert len(output) == 5 and len(list(output)) == 5
+    assert output[2].shape == (50, len(model.run_model_species_names))
+    assert output.samples is samples
+
+    b = output.species('B')
+    assert np.shares_memory(b, output.y)
+    assert_allclose(b[3], output[3][:, model.run_model_species_names.index('B')])
+
+    at_60 = kinetics.get_concentrations_at_timepoint(model, output, 60, 'B')
+    assert_allclose(at_60, output.at_time(60)[:, output.species_index('B')])
+
+    times = kinetics.get_time_to_concentration(model, output, 100, 'C')
+    for y, time in zip(output, times):
+        reached = np.where(y[:, model.run_model_species_names.index('C')] >= 100)[0]
+        assert time == (model.time[reached[0]] if len(reached) != 0 else model.time[-1])
+
+
+def test_dataframes_match_loops():
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=8)
+    output = kinetics.run_all_models(model, samples, logging=False)
+    index = model.run_model_species_names.index('C')
+
+    quartiles = kinetics.dataframes_quartiles(model, output, quartile=90)
+    assert list(quartiles.keys()) == model.run_model_species_names
+    assert len(quartiles.dataframes) == 0
+
+    df = quartiles['C']
+    assert len(quartiles.dataframes) == 1
+    for t in [0, 10, 49]:
+        values = [y[t][index] for y in output]
+        assert df['High'][t] == pytest.approx(np.percentile(values, 90))
+        assert df['Low'][t] == pytest.approx(np.percentile(values, 10))
+        assert df['Mean'][t] == pytest.approx(np.mean(values))
+
+    all_runs = kinetics.dataframes_all_runs(model, list(output), substrates=['C'])
+    assert list(all_runs['C'].columns) == ['Time'] + [str(i) for i in range(1, 9)]
+    assert_allclose(all_runs['C']['3'], output[2][:, index])
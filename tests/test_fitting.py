@@ -0,0 +1,59 @@
+import kinetics
+import numpy as np
+import pandas as pd
+from tests.test_ensemble import make_model
+
+
+def make_experiments(model, rows=[4, 10, 20, 35, 49]):
+    """ Noise free data from the model at its default parameters, starting from two concentrations of A """
+    experiments = []
+    for a in [10000, 5000]:
+        model.update_species(dict(model.species, A=a))
+        y = model.run_model()
+        names = model.run_model_species_names
+        data_df = pd.DataFrame({'Time': model.time[rows],
+                                'B': y[rows, names.index('B')],
+                                'C': y[rows, names.index('C')]})
+        experiments.append(kinetics.Experiment(data_df, ['B', 'C'], species={'A': a}))
+    model.reset_model_to_defaults()
+    return experiments
+
+
+def test_fit_model_recovers_parameters():
+    model = make_model()
+    model.set_solver('BDF')
+    experiments = make_experiments(model)
+
+    true_values = {name: model.parameters[name] for name in ['enz1_kcat', 'enz2_kcat']}
+    model.parameters.update({'enz1_kcat': 60, 'enz2_kcat': 50})
+
+    result = kinetics.fit_model(model, experiments, parameter_names=['enz1_kcat', 'enz2_kcat'],
+                                bounds={'enz1_kcat': (1, 1000), 'enz2_kcat': (1, 1000)},
+                                starts=2, workers=2, seed=1, logging=False)
+
+    for name, value in true_values.items():
+        assert abs(result.parameters[name] - value) / value < 1e-3
+    assert result.cost < 1e-3
+    assert result.covariance.shape == (2, 2)
+    assert len(result.starts) == 2
+    assert list(result.to_dataframe()['Parameter']) == ['enz1_kcat', 'enz2_kcat']
+
+    # The model is left at its settings
+    assert model.parameters['enz1_kcat'] == 60
+    assert len(model.time) == 50
+
+
+def test_fit_model_linear_space_standard_errors():
+    model = make_model()
+    model.set_solver('BDF')
+    experiments = make_experiments(model)
+
+    rng = np.random.default_rng(0)
+    for experiment in experiments:
+        experiment.data_df['C'] = experiment.data_df['C'] + rng.normal(0, 20, len(experiment.data_df))
+
+    result = kinetics.fit_model(model, experiments, parameter_names=['enz2_kcat'], log=False, logging=False)
+
+    assert result.log_covariance is None
+    assert result.standard_errors['enz2_kcat'] > 0
+    assert abs(result.parameters['enz2_kcat'] - 30) < 5 * result.standard_errors['enz2_kcat'] + 1
@@ -0,0 +1,45 @@
+import kinetics
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+
+def make_generic(rate_equation):
+    return kinetics.Generic(params=['k', 'km'], species=['a', 'b'], rate_equation=rate_equation,
+                            substrates=['a'], products=['b'])
+
+
+def test_generic_rate_and_gradient():
+    generic = make_generic('k*a/(km + a) - sqrt(b)*k**2 + log(km)')
+    substrates, parameters = [3.0, 4.0], [2.0, 5.0]
+
+    assert generic.calculate_rate(substrates, parameters) == pytest.approx(2*3/(5+3) - 2*2**2 + np.log(5))
+
+    analytical = generic.calculate_rate_gradient(substrates, parameters)
+    numerical = kinetics.Reaction.calculate_rate_gradient(generic, substrates, parameters)
+    assert_allclose(analytical[0], numerical[0], rtol=1e-5)
+    assert_allclose(analytical[1], numerical[1], rtol=1e-5)
+
+
+def test_generic_is_vectorised():
+    generic = make_generic('k*exp(-a/km) + max(b, 1)')
+    a = np.array([1.0, 2.0, 3.0])
+    b = np.array([0.5, 2.0, 4.0])
+
+    rate = generic.calculate_rate([a, b], [2.0, np.array([1.0, 2.0, 3.0])])
+    assert_allclose(rate, 2*np.exp(-1) + np.maximum(b, 1))
+
+
+def test_generic_rejects_unsafe_equations():
+    for rate_equation in ["__import__('os').getcwd()", 'a.real', 'k*c', 'a if k else b', 'a[0]',
+                          'max(a)', 'exp(a, b)', 'pow(a, k, km)']:
+        with pytest.raises(ValueError):
+            make_generic(rate_equation).calculate_rate([1.0, 1.0], [1.0, 1.0])
+
+
+def test_generic_min_max_of_many_arguments():
+    generic = make_generic('min(a, b, k) + max(a, b, k, km)')
+    b = np.array([0.5, 2.0, 4.0])
+
+    rate = generic.calculate_rate([3.0, b], [2.0, 1.0])
+    assert_allclose(rate, np.minimum(np.minimum(3.0, b), 2.0) + np.maximum(3.0, b))
@@ -0,0 +1,39 @@
+import kinetics
+import random
+from tests.test_ensemble import make_model
+
+
+class ProductGA(kinetics.GA_Base_Class):
+    def fitness(self):
+        return (self.model.y[-1][self.model.run_model_species_names.index('C')],)
+
+
+def make_ga():
+    model = make_model()
+    metrics = kinetics.Metrics(model, substrate='A', product='C')
+    ga = ProductGA(model=model, metrics=metrics, weights=(1,), bounds={'enz_1': (1, 10), 'enz_2': (1, 20)})
+    ga.initial_pop_size = 8
+    ga.generations = 1
+    ga.num_children = 4
+    ga.num_to_select = 8
+    ga.setup()
+    return ga
+
+
+def test_parallel_evaluation_matches_serial():
+    ga = make_ga()
+    random.seed(0)
+    population = ga.toolbox.population(n=8)
+    parallel_population = [ga.toolbox.clone(ind) for ind in population]
+
+    ga.evaluate_population(population)
+
+    ga.set_parallel(workers=2)
+    random.seed(1)
+    final_population = ga.run_ga(initial_pop=parallel_population)
+
+    for ind, parallel_ind in zip(population, parallel_population):
+        assert isinstance(parallel_ind.fitness.values, tuple)
+        assert abs(ind.fitness.values[0] - parallel_ind.fitness.values[0]) < 1e-6 * abs(ind.fitness.values[0])
+    assert len(final_population) == 8
+    assert all(ind.fitness.valid for ind in final_population)
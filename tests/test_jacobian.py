@@ -0,0 +1,121 @@
+import kinetics
+import numpy as np
+from numpy.testing import assert_allclose
+from kinetics.reaction_classes.reaction_base_class import numerical_gradient
+
+
+def all_reactions():
+    return [kinetics.Uni(kcat='p0', kma='p1', a='a', enz='e'),
+            kinetics.Bi(kcat='p0', kma='p1', kmb='p2', a='a', b='b', enz='e'),
+            kinetics.Bi_ternary_complex(kcat='p0', kma='p1', kmb='p2', kia='p3', a='a', b='b', enz='e'),
+            kinetics.Bi_ping_pong(kcat='p0', kma='p1', kmb='p2', a='a', b='b', enz='e'),
+            kinetics.Ter_seq_redam(kcat='p0', kma='p1', kmb='p2', kmc='p3', kia='p4', kib='p5', a='a', b='b', c='c', enz='e'),
+            kinetics.Ter_seq_car(kcat='p0', kma='p1', kmb='p2', kmc='p3', kia='p4', a='a', b='b', c='c', enz='e'),
+            kinetics.Bi_ternary_complex_small_kma(kcat='p0', kmb='p1', kia='p2', a='a', b='b', enz='e'),
+            kinetics.UniUni_rev(kcatf='p0', kcatr='p1', kma='p2', kmp='p3', a='a', p='p', enz='e'),
+            kinetics.BiBi_Ordered_rev(kcatf='p0', kcatr='p1', kmb='p2', kia='p3', kib='p4', kmp='p5', kip='p6', kiq='p7',
+                                      a='a', b='b', p='p', q='q', enz='e'),
+            kinetics.BiBi_Random_rev(kcatf='p0', kcatr='p1', kmb='p2', kia='p3', kib='p4', kmp='p5', kip='p6', kiq='p7',
+                                     a='a', b='b', p='p', q='q', enz='e'),
+            kinetics.BiBi_Pingpong_rev(kcatf='p0', kcatr='p1', kma='p2', kmb='p3', kia='p4', kmp='p5', kmq='p6', kip='p7', kiq='p8',
+                                       a='a', b='b', p='p', q='q', enz='e'),
+            kinetics.FirstOrderRate(k='p0', a='a'),
+            kinetics.Binding(k1='p0', kminus1='p1', a='a', b='b', c='c'),
+            kinetics.BiSecondOrderRate(k='p0', a='a', b='b'),
+            kinetics.Binding_kd(kd='p0', k1='p1', a='a', b='b', c='c'),
+            kinetics.DiffusionEquilibrium(kd='p0', k1='p1', org_c='a', aq_c='b'),
+            kinetics.OxygenDiffusion(kl='p0', area='p1', o2sat='p2', o2aq='a')]
+
+
+def test_rate_gradients_match_numerical():
+    rng = np.random.default_rng(1)
+    for reaction in all_reactions():
+        substrates = list(rng.uniform(1, 100, len(reaction.reaction_substrate_names)))
+        parameters = list(rng.uniform(1, 100, len(reaction.parameter_names)))
+
+        analytical = reaction.calculate_rate_gradient(substrates, parameters)
+        numerical = kinetics.Reaction.calculate_rate_gradient(reaction, substrates, parameters)
+
+        assert_allclose(analytical[0], numerical[0], rtol=1e-5, atol=1e-9, err_msg=type(reaction).__name__)
+        assert_allclose(analytical[1], numerical[1], rtol=1e-5, atol=1e-9, err_msg=type(reaction).__name__)
+
+
+def test_modifier_gradients_match_numerical():
+    rng = np.random.default_rng(2)
+    modifiers = [kinetics.SubstrateInhibition(ki='ki', a='a'),
+                 kinetics.CompetitiveInhibition(km='p1', ki='ki', i='i'),
+                 kinetics.MixedInhibition(kcat='p0', km='p1', ki='ki', alpha='alpha', i='i'),
+                 kinetics.MixedInhibition2(kcat='p0', km='p1', kic='ki', kiu='alpha', i='i'),
+                 kinetics.FirstOrder_Modifier(kcat='p0', k='ki', s='i')]
+
+    for modifier in modifiers:
+        reaction = kinetics.Uni(kcat='p0', kma='p1', a='a', enz='e')
+        reaction.add_modifier(modifier)
+        modifier.get_substrate_indexes(reaction.reaction_substrate_names)
+        modifier.get_parameter_indexes(reaction.parameter_names)
+
+        substrates = list(rng.uniform(1, 100, len(reaction.reaction_substrate_names)))
+        parameters = list(rng.uniform(1, 100, len(reaction.parameter_names)))
+        d_substrates = list(rng.uniform(-1, 1, len(substrates)))
+        d_parameters = list(rng.uniform(-1, 1, len(parameters)))
+
+        analytical = modifier.calc_modifier_gradient(substrates, parameters, d_substrates, d_parameters)
+        numerical = kinetics.Modifier.calc_modifier_gradient(modifier, substrates, parameters, d_substrates, d_parameters)
+
+        assert_allclose(analytical[0], numerical[0], rtol=1e-5, atol=1e-9, err_msg=type(modifier).__name__)
+        assert_allclose(analytical[1], numerical[1], rtol=1e-5, atol=1e-9, err_msg=type(modifier).__name__)
+
+
+def test_model_jacobian_matches_numerical():
+    model = kinetics.Model()
+
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameters = {'enz1_kcat': 100, 'enz1_km': 1000, 'enz1_ki': 500}
+    enzyme_1.add_modifier(kinetics.CompetitiveInhibition(km='enz1_km', ki='enz1_ki', i='B'))
+
+    enzyme_2 = kinetics.UniUni_rev(kcatf='enz2_kcatf', kcatr='enz2_kcatr', kma='enz2_kma', kmp='enz2_kmp',
+                                   a='B', p='C', enz='enz_2', substrates=['B'], products=['C'])
+    enzyme_2.parameters = {'enz2_kcatf': 10, 'enz2_kcatr': 1, 'enz2_kma': 500, 'enz2_kmp': 200}
+
+    flow = kinetics.Flow(flow_rate='flow_rate', column_volume='column_volume',
+                         input_substrates=['A_in'], substrates=['A'])
+    flow.parameters = {'flow_rate': 1, 'column_volume': 10}
+
+    model.append(enzyme_1)
+    model.append(enzyme_2)
+    model.append(flow)
+    model.species = {"A": 1000, "A_in": 2000, "enz_1": 5, "enz_2": 2}
+    model.setup_model()
+    model.setup_reactions()
+
+    y = np.array([1000, 2000, 5, 2, 300, 100], dtype=float)
+    numerical = np.array(numerical_gradient(lambda values: model.deriv(np.array(values), 0), list(y))).T
+
+    assert_allclose(model.jacobian(y, 0), numerical, rtol=1e-5, atol=1e-8)
+
+
+def test_sparse_model_matches_odeint():
+    model = kinetics.Model()
+    model.set_time(0, 100, 50)
+
+    # A long chain of first order reactions, so the stoichiometry matrix is sparse
+    for i in range(150):
+        reaction = kinetics.FirstOrderRate(k='k_' + str(i), a='S' + str(i),
+                                           substrates=['S' + str(i)], products=['S' + str(i + 1)])
+        reaction.parameters = {'k_' + str(i): 0.5 + (i % 7) / 10}
+        model.append(reaction)
+
+    model.species = {'S0': 1000}
+    model.setup_model()
+    dense_y = model.run_model()
+
+    model.setup_reactions()
+    jacobian = model.sparse_jacobian(dense_y[10], 0)
+    outside_pattern = abs(jacobian) - abs(jacobian).multiply(model.jacobian_sparsity)
+    assert outside_pattern.count_nonzero() == 0
+
+    model.sparse = True
+    sparse_y = model.run_model()
+
+    assert_allclose(sparse_y, dense_y, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,79 @@
+import kinetics
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from tests.test_jacobian import all_reactions
+from tests.test_codegen import make_model, make_hill_model
+
+numba = pytest.importorskip('numba')
+
+
+def make_jit_model(monkeypatch, tmp_path):
+    monkeypatch.setenv('KINETICS_CACHE_DIR', str(tmp_path))
+    modifiers = {0: lambda i: kinetics.SubstrateInhibition(ki='ki', a='a0'),
+                 1: lambda i: kinetics.CompetitiveInhibition(km='p1_1', ki='ki', i='i'),
+                 2: lambda i: kinetics.MixedInhibition(kcat='p0_2', km='p1_2', ki='ki', alpha='alpha', i='i'),
+                 3: lambda i: kinetics.MixedInhibition2(kcat='p0_3', km='p1_3', kic='ki', kiu='alpha', i='i'),
+                 4: lambda i: kinetics.FirstOrder_Modifier(kcat='p0_4', k='ki', s='i')}
+    model = make_model(all_reactions(), modifiers)
+
+    flow = kinetics.Flow(flow_rate='flow_rate', column_volume='column_volume',
+                         input_substrates=['a0'], substrates=['a1'])
+    flow.parameters = {'flow_rate': 0.5, 'column_volume': 2}
+    model.append(flow)
+    model.setup_model()
+
+    model.species = {name: 10.0 + i for i, name in enumerate(model.run_model_species_names)}
+    model.setup_model()
+
+    return model
+
+
+def test_jit_kernels_match_model(monkeypatch, tmp_path):
+    model = make_jit_model(monkeypatch, tmp_path)
+    rng = np.random.default_rng(4)
+    y = rng.uniform(1, 100, len(model.run_model_species_names))
+
+    model.setup_reactions()
+    deriv, jacobian = model.deriv(y, 0), model.jacobian(y, 0)
+
+    model.set_jit()
+    model.setup_reactions()
+    assert len(list(tmp_path.glob('jit/kinetics_model_*.py'))) == 1
+
+    assert_allclose(model.deriv(y, 0), deriv, rtol=1e-10)
+    assert_allclose(model.jacobian(y, 0), jacobian, rtol=1e-8, atol=1e-12)
+
+
+def test_jit_run_model_matches_odeint(monkeypatch, tmp_path):
+    model = make_jit_model(monkeypatch, tmp_path)
+    model.set_time(0, 10, 10)
+    expected = model.run_model().copy()
+
+    model.set_jit()
+    assert_allclose(model.run_model(), expected, rtol=1e-5, atol=1e-8)
+
+
+def test_jit_generic(monkeypatch, tmp_path):
+    monkeypatch.setenv('KINETICS_CACHE_DIR', str(tmp_path))
+    generic = kinetics.Generic(params=['gk', 'gkm'], species=['ga', 'gb'], rate_equation='gk*ga/(gkm + ga) * exp(-gb/100)',
+                               substrates=['ga'], products=['gb'])
+    generic.parameters = {'gk': 0.1, 'gkm': 5}
+    model = make_model([generic])
+    model.species = {'ga': 100, 'gb': 0}
+    model.setup_model()
+    expected = model.run_model().copy()
+
+    model.set_jit()
+    assert_allclose(model.run_model(), expected, rtol=1e-5, atol=1e-8)
+
+
+def test_jit_kernels_depend_on_inlined_attributes(monkeypatch, tmp_path):
+    monkeypatch.setenv('KINETICS_CACHE_DIR', str(tmp_path))
+    y = np.array([10.0, 0.0])
+    for n in [1, 2]:
+        model = make_hill_model(n)
+        model.set_jit()
+        model.setup_reactions()
+        assert_allclose(model.deriv(y, 0), [-0.1 * 10 ** n, 0.1 * 10 ** n])
+    assert len(list(tmp_path.glob('jit/kinetics_model_*.py'))) == 2
@@ -0,0 +1,82 @@
+import kinetics
+import kinetics.ua_and_sa.pipeline as pipeline
+import numpy as np
+import threading
+import time
+import pytest
+from numpy.testing import assert_allclose
+from tests.test_ensemble import make_model
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_saltelli_chunks_match_make_saltelli_samples():
+    model = make_model()
+    kinetics.distributions_to_lower_upper_bounds(model, save_to_model=True)
+    problem = kinetics.salib_problem(model, bounds=[])
+
+    for second_order in [False, True]:
+        expected = kinetics.make_saltelli_samples(model, problem, 20, second_order=second_order)
+        chunks = list(kinetics.saltelli_chunks(model, problem, 20, chunk_size=30, second_order=second_order))
+        actual = [sample for chunk in chunks for sample in chunk]
+
+        assert len(chunks) > 1
+        assert len(actual) == len(expected)
+        for (expected_parameters, expected_species), (parameters, species) in zip(expected, actual):
+            assert parameters == pytest.approx(expected_parameters)
+            assert species == pytest.approx(expected_species)
+
+
+def test_saltelli_chunks_check_salib_version(monkeypatch):
+    model = make_model()
+    kinetics.distributions_to_lower_upper_bounds(model, save_to_model=True)
+    problem = kinetics.salib_problem(model, bounds=[])
+
+    assert pipeline.salib_version() >= pipeline.salib_skip_version
+    monkeypatch.setattr(pipeline, 'salib_version', lambda: (1, 4, 4))
+    with pytest.raises(ValueError):
+        next(kinetics.saltelli_chunks(model, problem, 20))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_pipeline_matches_run_all_models(tmp_path, workers):
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=10)
+    output = kinetics.run_all_models(model, samples, logging=False)
+
+    scalars = kinetics.ScalarOutputs(model, substrate='C', timepoint=60)
+    bands = kinetics.UncertaintyBands(model)
+    writer = kinetics.ChunkWriter(str(tmp_path))
+
+    kinetics.run_pipeline(model, kinetics.sample_list_chunks(samples, chunk_size=3), [scalars, bands, writer],
+                          workers=workers, logging=False)
+
+    assert_allclose(scalars.result(), kinetics.get_concentrations_at_timepoint(model, output, 60, 'C'), rtol=1e-6)
+    assert_allclose(bands.sketch.mean(), output.y.mean(axis=0), rtol=1e-6, atol=1e-8)
+    assert len(writer.files) == 4
+    assert_allclose(np.load(str(tmp_path / 'output_3.npy')), output.y[3:6], rtol=1e-6)
+
+
+def test_distribution_chunks():
+    model = make_model()
+    chunks = list(kinetics.distribution_chunks(model, num_samples=25, chunk_size=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+
+
+def test_prefetch_stops_when_closed():
+    made = []
+    def chunks():
+        for i in range(100):
+            made.append(i)
+            yield [i]
+
+    threads = threading.active_count()
+    prefetched = pipeline.prefetch(chunks())
+    assert next(prefetched) == [0]
+    prefetched.close()
+
+    for _ in range(50):
+        if threading.active_count() == threads:
+            break
+        time.sleep(0.05)
+    assert threading.active_count() == threads
+    assert len(made) < 100
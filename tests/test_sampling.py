@@ -1,6 +1,7 @@
 
 
 import kinetics
+import numpy as np
 from scipy.stats import multivariate_normal, norm
 
 
@@ -31,4 +32,55 @@ def test_multivariate():
 
     # Run the model 1000 times, sampling from distributions
     samples = kinetics.sample_distributions(model, num_samples=50)
-    outputs = kinetics.run_all_models(model, samples, logging=True)
\ No newline at end of file
+    outputs = kinetics.run_all_models(model, samples, logging=True)
+
+def test_sample_distributions_vectorised():
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameter_distributions = {'enz1_kcat': multivariate_normal([98, 114], [[46, 9], [9, 30]]),
+                                        'enz1_km': ('enz1_kcat', 1)}
+    enzyme_1.parameters = {'enz1_kcat': 98, 'enz1_km': 114}
+
+    model = kinetics.Model(logging=False)
+    model.append(enzyme_1)
+    model.species = {"A": 10000}
+    model.species_distributions = {"enz_1": norm(0.5, 1)}
+    model.setup_model()
+
+    samples = kinetics.sample_distributions(model, num_samples=20000)
+    assert len(samples) == 20000
+
+    kcat = np.array([parameters['enz1_kcat'] for parameters, species in samples])
+    km = np.array([parameters['enz1_km'] for parameters, species in samples])
+    enzyme = np.array([species['enz_1'] for parameters, species in samples])
+
+    # The linked parameter comes from the second dimension of the same draws
+    assert abs(km.mean() - 114) < 0.5
+    assert abs(np.corrcoef(kcat, km)[0, 1] - 9 / np.sqrt(46 * 30)) < 0.05
+
+    # Non positive draws are redrawn, unless negative values are allowed
+    assert enzyme.min() > 0
+    samples = kinetics.sample_distributions(model, num_samples=1000, negative_allowed=['enz_1'])
+    assert min(species['enz_1'] for parameters, species in samples) < 0
+
+    # No samples gives an empty set, including for the multivariate distribution
+    assert len(kinetics.sample_distributions(model, num_samples=0)) == 0
+
+
+def test_sample_set():
+    values = np.arange(12, dtype=float).reshape(4, 3)
+    values[1, 2] = np.nan
+    samples = kinetics.SampleSet(values, ['k1', 'k2'], ['A'])
+
+    assert len(samples) == 4
+    assert samples[0] == [{'k1': 0, 'k2': 1}, {'A': 2}]
+    assert samples[1] == [{'k1': 3, 'k2': 4}, {}]
+    assert [species for parameters, species in samples][2] == {'A': 8}
+
+    chunk = samples[2:4]
+    assert np.shares_memory(chunk.values, values)
+    assert np.shares_memory(samples.to_dataframe()['k2'].to_numpy(), values)
+
+    same = kinetics.SampleSet.from_samples(list(samples))
+    assert same.names == ['k1', 'k2', 'A']
+    np.testing.assert_array_equal(same.values, values)
@@ -0,0 +1,97 @@
+import kinetics
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose
+from tests.test_ensemble import make_model
+
+
+def finite_difference_sensitivities(model, parameter_names, step=1e-4):
+    columns = []
+    defaults = dict(model.run_model_parameters)
+    for name in parameter_names:
+        h = step * abs(defaults[name])
+        model.run_model_parameters = dict(defaults, **{name: defaults[name] + h})
+        up = model.run_model()
+        model.run_model_parameters = dict(defaults, **{name: defaults[name] - h})
+        down = model.run_model()
+        columns.append((up - down) / (2 * h))
+    model.run_model_parameters = defaults
+    return np.stack(columns, axis=2)
+
+
+@pytest.mark.parametrize('solver', ['odeint', 'BDF'])
+def test_forward_sensitivities_match_finite_differences(solver):
+    model = make_model()
+    flow = kinetics.Flow(flow_rate='flow_rate', column_volume='column_volume', input_substrates=['O2'], substrates=['C'])
+    flow.parameters = {'flow_rate': 0.05, 'column_volume': 2}
+    model.append(flow)
+    model.setup_model()
+    model.set_solver(solver, rtol=1e-11, atol=1e-9)
+
+    y = model.run_model().copy()
+    sensitivities = model.run_sensitivities()
+    parameter_names = list(model.run_model_parameters.keys())
+
+    assert sensitivities.shape == (len(model.time), len(model.run_model_species_names), len(parameter_names))
+    assert_allclose(model.y, y, rtol=1e-6, atol=1e-6)
+
+    expected = finite_difference_sensitivities(model, parameter_names)
+    scale = np.abs(expected).max(axis=(0, 1), keepdims=True) + 1e-12
+    assert_allclose(sensitivities / scale, expected / scale, atol=1e-4)
+
+
+def test_adjoint_gradient_matches_forward_sensitivities():
+    model = make_model()
+    model.set_solver('BDF', rtol=1e-10, atol=1e-8)
+
+    sensitivities = model.run_sensitivities()
+    parameter_names = list(model.run_model_parameters.keys())
+    index = model.run_model_species_names.index('C')
+
+    value, parameter_gradients, species_gradients = model.adjoint_gradient(kinetics.FinalConcentration('C'))
+    assert value == pytest.approx(model.y[-1, index], rel=1e-6)
+    gradient = np.array([parameter_gradients[name] for name in parameter_names])
+    scale = np.abs(sensitivities[-1, index]).max()
+    assert_allclose(gradient / scale, sensitivities[-1, index] / scale, atol=1e-5)
+
+    # Starting species, by finite differences
+    starting_values = list(model.run_model_species_starting_values)
+    for i, name in enumerate(model.run_model_species_names):
+        h = 1e-4 * max(abs(starting_values[i]), 1)
+        model.run_model_species_starting_values = starting_values[:i] + [starting_values[i] + h] + starting_values[i+1:]
+        up = model.run_model()[-1, index]
+        model.run_model_species_starting_values = starting_values[:i] + [starting_values[i] - h] + starting_values[i+1:]
+        down = model.run_model()[-1, index]
+        assert species_gradients[name] == pytest.approx((up - down) / (2 * h), rel=1e-4, abs=1e-6)
+    model.run_model_species_starting_values = starting_values
+
+
+def test_adjoint_sum_squared_error():
+    model = make_model()
+    model.set_solver('odeint', rtol=1e-10, atol=1e-8)
+    sensitivities = model.run_sensitivities()
+    y = model.y.copy()
+    b, c = model.run_model_species_names.index('B'), model.run_model_species_names.index('C')
+
+    rows = [5, 20, 49]
+    data_df = pd.DataFrame({'Time': model.time[rows],
+                            'B': y[rows, b] + 10, 'B_repeat': y[rows, b] - 5,
+                            'C': [np.nan, y[20, c] * 1.1, y[49, c] * 0.9]})
+
+    value, parameter_gradient, species_gradient = kinetics.adjoint_gradient(model, kinetics.SumSquaredError(data_df, ['B', 'C']))
+
+    residuals_b = np.concatenate([np.full(3, -10.0), np.full(3, 5.0)])
+    residuals_c = np.array([-0.1 * y[20, c], 0.1 * y[49, c]])
+    assert value == pytest.approx(np.sum(residuals_b ** 2) + np.sum(residuals_c ** 2), rel=1e-5)
+
+    expected = 2 * (-10 + 5) * sensitivities[rows, b].sum(axis=0) + \
+               2 * (residuals_c[:, None] * sensitivities[[20, 49], c]).sum(axis=0)
+    scale = np.abs(expected).max()
+    assert_allclose(parameter_gradient / scale, expected / scale, atol=1e-4)
+
+    trajectory = kinetics.TrajectoryObjective(lambda y: y[-1, c] - y[-1, b])
+    value, parameter_gradient, species_gradient = kinetics.adjoint_gradient(model, trajectory)
+    expected = sensitivities[-1, c] - sensitivities[-1, b]
+    scale = np.abs(expected).max()
+    assert_allclose(parameter_gradient / scale, expected / scale, atol=1e-4)
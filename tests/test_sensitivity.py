@@ -0,0 +1,81 @@
+import kinetics
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from tests.test_ensemble import make_model
+
+
+def saltelli_output(num_samples=16, second_order=False):
+    model = make_model()
+    kinetics.distributions_to_lower_upper_bounds(model, save_to_model=True)
+    problem = kinetics.salib_problem(model, bounds=[])
+    samples = kinetics.make_saltelli_samples(model, problem, num_samples, second_order=second_order)
+    output = kinetics.run_all_models(model, samples, logging=False)
+    return model, problem, output
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_sobol_over_time_matches_salib():
+    model, problem, output = saltelli_output()
+
+    df = kinetics.analyse_sobal_sensitivity_over_time(model, problem, output, substrates=['B', 'C'])
+    assert len(df) == problem['num_vars'] * len(model.time) * 2
+
+    for substrate in ['B', 'C']:
+        for timepoint in [model.time[10], model.time[-1]]:
+            concentrations = kinetics.get_concentrations_at_timepoint(model, output, timepoint, substrate)
+            expected = kinetics.analyse_sobal_sensitivity(problem, concentrations)
+
+            rows = df[(df['Substrate'] == substrate) & (df['Time'] == timepoint)].set_index('Parameter')
+            assert_allclose(rows.loc[expected.index, 'S1'], expected['S1'], atol=1e-10)
+            assert_allclose(rows.loc[expected.index, 'ST'], expected['ST'], atol=1e-10)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+def test_bootstrap_matches_salib():
+    from SALib.analyze import sobol
+    model, problem, output = saltelli_output()
+    concentrations = kinetics.get_concentrations_at_timepoint(model, output, 60, 'C')
+
+    expected = sobol.analyze(problem, concentrations, calc_second_order=False, num_resamples=200, seed=3)
+    df = kinetics.analyse_sobal_sensitivity(problem, concentrations, num_resample=200, seed=3)
+    for column in ['S1', 'S1_conf', 'ST', 'ST_conf']:
+        assert_allclose(df[column], expected[column], atol=1e-10)
+
+    # Splitting the outputs into blocks and processes gives the same intervals
+    y = output.y[:, ::10]
+    first_order, total_order = kinetics.sobol_confidence_intervals(y, problem['num_vars'], num_resample=50, seed=1)
+    first_order_2, total_order_2 = kinetics.sobol_confidence_intervals(y, problem['num_vars'], num_resample=50, seed=1,
+                                                                       workers=2, block_size=7)
+    assert first_order.shape == (problem['num_vars'],) + y.shape[1:]
+    assert_allclose(first_order, first_order_2, atol=1e-12)
+    assert_allclose(total_order, total_order_2, atol=1e-12)
+
+    # By default the outputs are split evenly between the workers
+    first_order_3, total_order_3 = kinetics.sobol_confidence_intervals(y, problem['num_vars'], num_resample=50, seed=1,
+                                                                       workers=2)
+    assert_allclose(first_order, first_order_3, atol=1e-12)
+    assert_allclose(total_order, total_order_3, atol=1e-12)
+
+
+@pytest.mark.parametrize('solver', ['odeint', 'BDF'])
+def test_time_to_concentration_events(solver):
+    model = make_model()
+    model.set_solver(solver)
+    samples = kinetics.sample_distributions(model, num_samples=6)
+
+    model.set_time(0, 120, 12001)
+    output = kinetics.run_all_models(model, samples, logging=False)
+    model.set_time(0, 120, 5)
+
+    for concentration, substrate, mode in [(1000, 'C', '>='), (5000, 'A', '<='), (1e9, 'C', '>=')]:
+        times = kinetics.run_all_models_time_to_concentration(model, samples, concentration, substrate, mode=mode,
+                                                               batch_size=4, logging=False)
+        model.set_time(0, 120, 12001)
+        expected = kinetics.get_time_to_concentration(model, output, concentration, substrate, mode=mode)
+        model.set_time(0, 120, 5)
+
+        # The grid gives the first timepoint after the crossing
+        assert np.all(times <= expected + 1e-9)
+        assert np.all(times > expected - 0.01 - 1e-9)
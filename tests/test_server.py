@@ -0,0 +1,104 @@
+import kinetics
+import kinetics.server
+import numpy as np
+import json
+import urllib.request
+import urllib.error
+import pytest
+from concurrent.futures import Future, ThreadPoolExecutor
+from numpy.testing import assert_allclose
+from kinetics.server import ModelBatcher, SimulationServer, simulate
+
+
+def make_model():
+    model = kinetics.Model()
+    model.set_time(0, 100, 20)
+
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameters = {'enz1_kcat': 10, 'enz1_km': 1000}
+
+    model.append(enzyme_1)
+    model.species = {"A": 1000, "enz_1": 1}
+    model.setup_model()
+
+    return model
+
+
+def test_server_batches_concurrent_requests():
+    server = SimulationServer({'uni': make_model()}, batch_window=0.05).start()
+    try:
+        kcats = [5, 10, 15, 20, 25, 30]
+        with ThreadPoolExecutor(max_workers=len(kcats)) as executor:
+            responses = list(executor.map(
+                lambda kcat: simulate(server.url, 'uni', parameters={'enz1_kcat': kcat}, outputs=['B']), kcats))
+
+        for kcat, response in zip(kcats, responses):
+            model = make_model()
+            model.run_model_parameters['enz1_kcat'] = kcat
+            expected = model.run_model()[:, model.run_model_species_names.index('B')]
+            assert_allclose(response['y']['B'], expected, rtol=1e-4, atol=1e-3)
+
+        assert max(server.batchers['uni'].batch_sizes) > 1
+
+        metrics = simulate(server.url, 'uni', species={'A': 500}, metrics=['final', 'max'])
+        assert metrics['metrics']['max']['A'] == pytest.approx(500)
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            simulate(server.url, 'unknown')
+        assert error.value.code == 400
+
+        with urllib.request.urlopen(server.url + '/models') as response:
+            assert 'uni' in json.loads(response.read())
+    finally:
+        server.stop()
+
+
+def test_batcher_stops_after_running_collected_requests():
+    batcher = ModelBatcher(make_model(), batch_window=0.05)
+    batcher.stop()
+    batcher.thread.join(timeout=5)
+
+    with pytest.raises(RuntimeError):
+        batcher.submit({'enz1_kcat': 5}, {})
+
+    left_behind = Future()
+    batcher.requests.put(([{'enz1_kcat': 5}, {}], Future()))
+    batcher.requests.put(None)
+    batcher.requests.put(([{'enz1_kcat': 10}, {}], left_behind))
+
+    batcher.finished = False
+    assert len(batcher.collect_batch()) == 1
+    assert batcher.finished == True
+
+    batcher.cancel_remaining()
+    assert isinstance(left_behind.exception(timeout=0), RuntimeError)
+
+
+def test_server_returns_errors(monkeypatch):
+    def failing_run(*args, **kwargs):
+        raise ZeroDivisionError('float division by zero')
+    monkeypatch.setattr(kinetics.server, 'run_ensemble', failing_run)
+
+    server = SimulationServer({'uni': make_model()}).start()
+    try:
+        for body, status in [([1, 2], 400), ({'model': 'uni'}, 500)]:
+            http_request = urllib.request.Request(server.url + '/simulate', data=json.dumps(body).encode(),
+                                                  headers={'Content-Type': 'application/json'})
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(http_request, timeout=10)
+            assert error.value.code == status
+            assert 'error' in json.loads(error.value.read())
+    finally:
+        server.stop()
+
+
+def test_describe_models_uses_defaults():
+    model = make_model()
+    server = SimulationServer({'uni': model}).start()
+    try:
+        model.run_model_parameters = {'enz1_kcat': np.ones(3), 'enz1_km': np.ones(3)}
+        description = json.loads(json.dumps(server.describe_models()))
+        assert description['uni']['parameters'] == {'enz1_kcat': 10, 'enz1_km': 1000}
+    finally:
+        server.stop()
@@ -0,0 +1,63 @@
+import kinetics
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+
+def make_model():
+    model = kinetics.Model()
+    model.set_time(0, 500, 50)
+
+    enzyme_1 = kinetics.Uni(kcat='enz1_kcat', kma='enz1_km', enz='enz_1', a='A',
+                            substrates=['A'], products=['B'])
+    enzyme_1.parameters = {'enz1_kcat': 10, 'enz1_km': 1000}
+
+    enzyme_2 = kinetics.Uni(kcat='enz2_kcat', kma='enz2_km', enz='enz_2', a='B',
+                            substrates=['B'], products=['C'])
+    enzyme_2.parameters = {'enz2_kcat': 5, 'enz2_km': 500}
+
+    model.append(enzyme_1)
+    model.append(enzyme_2)
+    model.species = {"A": 1000, "enz_1": 1, "enz_2": 1}
+    model.setup_model()
+
+    return model
+
+
+@pytest.mark.parametrize('solver', ['BDF', 'Radau', 'LSODA', 'RK45', 'DOP853'])
+def test_solvers_match_odeint(solver):
+    model = make_model()
+    expected = model.run_model()
+
+    model.set_solver(solver, rtol=1e-8, atol=1e-8)
+    actual = model.run_model()
+
+    assert actual.shape == expected.shape
+    assert_allclose(actual, expected, rtol=1e-4, atol=1e-3)
+
+
+def test_unknown_solver():
+    model = make_model()
+    with pytest.raises(ValueError):
+        model.set_solver('Euler')
+
+
+def test_odeint_warns_when_sparse():
+    model = make_model()
+    model.sparse = True
+    model.set_solver('odeint', hmax=1)
+
+    with pytest.warns(UserWarning, match='hmax'):
+        model.run_model()
+
+
+def test_crossings_ignore_solve_ivp_only_options():
+    model = make_model()
+    model.set_solver('BDF', rtol=1e-8, atol=1e-8)
+    expected = model.time_to_concentration(100, 'C')
+
+    model.set_solver('BDF', rtol=1e-8, atol=1e-8, first_step=0.01, dense_output=True)
+    with pytest.warns(UserWarning, match='dense_output'):
+        actual = model.time_to_concentration(100, 'C')
+
+    assert actual == pytest.approx(expected, rel=1e-4)
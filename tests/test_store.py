@@ -0,0 +1,54 @@
+import kinetics
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from tests.test_ensemble import make_model
+
+
+@pytest.mark.parametrize('dtype, compression', [('float64', False), ('float32', False), ('float64', True)])
+def test_store_matches_run_all_models(tmp_path, dtype, compression):
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=10)
+    output = kinetics.run_all_models(model, samples, logging=False)
+
+    store = kinetics.run_to_store(model, samples, str(tmp_path), chunk_size=3, dtype=dtype,
+                                  compression=compression, logging=False)
+    assert store.is_complete()
+
+    store = kinetics.EnsembleStore(str(tmp_path), mode='r')
+    result = store.result()
+    rtol = 1e-5 if dtype == 'float32' else 1e-12
+    assert result.y.dtype == np.dtype(dtype)
+    assert_allclose(result.y, output.y, rtol=rtol)
+    assert_allclose(store.species('C'), output.species('C'), rtol=rtol)
+    assert_allclose(kinetics.get_concentrations_at_timepoint(model, result, 60, 'C'),
+                    kinetics.get_concentrations_at_timepoint(model, output, 60, 'C'), rtol=rtol)
+
+    for (expected_parameters, expected_species), (parameters, species) in zip(samples, store.samples()):
+        assert parameters == pytest.approx(expected_parameters)
+        assert species == pytest.approx(expected_species)
+
+
+def test_store_resumes(tmp_path):
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=10)
+    output = kinetics.run_all_models(model, samples, logging=False)
+
+    store = kinetics.run_to_store(model, samples, str(tmp_path), chunk_size=4, logging=False)
+
+    # Forget the middle chunk, as if the run had stopped there
+    store.completed[4:8] = False
+    store.y[4:8] = 0
+    store.completed.flush()
+    store.y.flush()
+    assert list(store.missing()) == [4, 5, 6, 7]
+
+    store = kinetics.run_to_store(model, None, str(tmp_path), chunk_size=4, logging=False)
+    assert store.is_complete()
+    assert_allclose(store.result().y, output.y, rtol=1e-12)
+
+    # Resuming with the same samples is fine, but different samples of the same size aren't
+    kinetics.run_to_store(model, samples, str(tmp_path), chunk_size=4, logging=False)
+    with pytest.raises(ValueError):
+        kinetics.run_to_store(model, kinetics.sample_distributions(model, num_samples=10), str(tmp_path),
+                              chunk_size=4, logging=False)
@@ -0,0 +1,46 @@
+import kinetics
+import numpy as np
+from numpy.testing import assert_allclose
+from tests.test_ensemble import make_model
+
+
+def test_merged_sketches_match_percentiles():
+    rng = np.random.default_rng(0)
+    data = np.concatenate([rng.lognormal(0, 1, (4000, 10, 1)), rng.normal(5, 0.1, (4000, 10, 1))], axis=2)
+    data[7, 3, 0] = np.nan
+
+    sketch = kinetics.QuantileSketch((10, 2))
+    other = kinetics.QuantileSketch((10, 2))
+    for start in range(0, 2000, 500):
+        sketch.update(data[start:start+500])
+    other.update(data[2000:])
+    sketch.merge(other)
+
+    valid = np.ma.masked_invalid(data)
+    assert_allclose(sketch.mean(), valid.mean(axis=0), rtol=1e-10)
+    assert_allclose(sketch.variance(), valid.var(axis=0, ddof=1), rtol=1e-8)
+    assert sketch.count[3 * 2] == 3999
+
+    for percentile in [5, 50, 95]:
+        estimate = sketch.percentile(percentile)
+        rank = np.nanmean(data <= estimate, axis=0)
+        assert np.max(np.abs(rank - percentile / 100)) < 0.005
+
+
+def test_uncertainty_bands_match_dataframes_quartiles():
+    model = make_model()
+    samples = kinetics.sample_distributions(model, num_samples=60)
+    output = kinetics.run_all_models(model, samples, logging=False)
+
+    bands = kinetics.UncertaintyBands(model)
+    bands.update(output[:30])
+    bands.merge(kinetics.UncertaintyBands(model).update(output[30:]))
+
+    actual = bands.dataframes(substrates=['C'])['C']
+    assert_allclose(actual['Mean'], kinetics.dataframes_quartiles(model, output)['C']['Mean'], rtol=1e-10)
+
+    # With few samples the sketch keeps every value, and interpolates like the 'hazen' percentile
+    high, low = np.percentile(output.species('C'), [95, 5], axis=0, method='hazen')
+    spread = high - low + 1e-6
+    assert np.max(np.abs(actual['High'] - high) / spread) < 0.05
+    assert np.max(np.abs(actual['Low'] - low) / spread) < 0.05